@@ -0,0 +1,240 @@
+"""Benchmarks de la couche base de données du bot (python bench.py)"""
+import asyncio
+import datetime as dt
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Base jetable : ne jamais toucher la vraie base du bot
+_TMP = tempfile.mkdtemp(prefix="arki_bench_")
+os.environ["TRIBU_BOT_DB"] = os.path.join(_TMP, "tribus.db")
+os.environ["ARKI_IDENTITE_DB"] = os.path.join(_TMP, "arki_identite.db")
+os.environ.pop("SQLITE_PATH", None)
+
+import main  # noqa: E402
+
+# ---------- Utilitaires ----------
+async def mesurer_lag(stop: asyncio.Event, intervalle: float = 0.005):
+    """Mesure le retard de la boucle asyncio (en ms) tant que stop n'est pas levé"""
+    retards = []
+    while not stop.is_set():
+        debut = time.perf_counter()
+        await asyncio.sleep(intervalle)
+        retards.append((time.perf_counter() - debut - intervalle) * 1000)
+    return retards
+
+def resume(nom: str, retards: list, duree: float):
+    retards = sorted(retards) or [0.0]
+    p99 = retards[min(len(retards) - 1, int(len(retards) * 0.99))]
+    print(f"{nom:<28} total={duree*1000:8.1f} ms  lag moyen={statistics.mean(retards):7.2f} ms  "
+          f"p99={p99:7.2f} ms  max={retards[-1]:7.2f} ms")
+
+# ---------- Lag de la boucle avec écrivains concurrents ----------
+ECRIVAINS = 50
+ECRITURES = 20
+
+def _ecriture_sync(tribu_id: int, i: int):
+    """Ancienne façon : connexion + écriture directement dans la boucle"""
+    with main.db_connect() as conn:
+        conn.execute(
+            "INSERT INTO historique (tribu_id, user_id, action, details, created_at) VALUES (?, ?, ?, ?, ?)",
+            (tribu_id, i, "bench", "sync", "2024-01-01T00:00:00"),
+        )
+        conn.commit()
+
+async def ecrivain_sync(tribu_id: int, n: int):
+    for i in range(ECRITURES):
+        _ecriture_sync(tribu_id, n * ECRITURES + i)
+        await asyncio.sleep(0)
+
+async def ecrivain_async(tribu_id: int, n: int):
+    for i in range(ECRITURES):
+        await main.ajouter_historique(tribu_id, n * ECRITURES + i, "bench", "async")
+
+async def bench_lag(nom: str, ecrivain, tribu_id: int):
+    stop = asyncio.Event()
+    mesure = asyncio.create_task(mesurer_lag(stop))
+    await asyncio.sleep(0.02)
+    debut = time.perf_counter()
+    await asyncio.gather(*(ecrivain(tribu_id, n) for n in range(ECRIVAINS)))
+    duree = time.perf_counter() - debut
+    stop.set()
+    resume(nom, await mesure, duree)
+
+# ---------- Chargement d'une fiche : 6 requêtes vs agrégat ----------
+CHARGEMENTS = 500
+
+async def fiche_six_requetes(tribu_id: int):
+    """Ancienne façon : une requête (et un aller-retour) par table"""
+    tribu = await main.db_fetchone("SELECT * FROM tribus WHERE id=?", (tribu_id,))
+    membres = await main.db_fetchall("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,))
+    avant_postes = await main.db_fetchall("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
+    photos = await main.db_fetchall("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,))
+    bases_premium = await main.db_fetchall("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
+    progression = await main.db_fetchall("SELECT kind, item_id, state FROM tribu_progression WHERE tribu_id=? ORDER BY updated_at, rowid", (tribu_id,))
+    return tribu, membres, avant_postes, photos, bases_premium, progression
+
+def _remplir_tribu(conn, tribu_id: int):
+    date = "2024-01-01T00:00:00"
+    conn.executemany("INSERT INTO membres (tribu_id, user_id, nom_in_game, manager) VALUES (?, ?, ?, ?)",
+                     [(tribu_id, 1000 + i, f"Joueur{i}", int(i < 2)) for i in range(20)])
+    conn.executemany("INSERT INTO avant_postes (tribu_id, user_id, nom, map, coords, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     [(tribu_id, 1, f"AP{i}", "The Island", "50/50", date) for i in range(5)])
+    conn.executemany("INSERT INTO photos_tribu (tribu_id, url, ordre, created_at) VALUES (?, ?, ?, ?)",
+                     [(tribu_id, f"https://exemple.com/{i}.png", i, date) for i in range(10)])
+    conn.executemany("INSERT INTO bases_premium (tribu_id, user_id, nom, map, coords, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     [(tribu_id, 1, f"BP{i}", "Svartalfheim", "10/10", date) for i in range(3)])
+    conn.executemany("INSERT INTO tribu_progression (tribu_id, item_id, kind, state, updated_at) VALUES (?, ?, ?, ?, ?)",
+                     [(tribu_id, f"Boss{i}", "boss", "valide", date) for i in range(8)])
+
+async def bench_chargement(nom: str, charger, tribu_id: int):
+    for concurrence in (1, 20):
+        debut = time.perf_counter()
+        for _ in range(CHARGEMENTS // concurrence):
+            await asyncio.gather(*(charger(tribu_id) for _ in range(concurrence)))
+        duree = time.perf_counter() - debut
+        print(f"{nom:<28} concurrence={concurrence:<3} {duree * 1e6 / CHARGEMENTS:8.1f} µs/fiche")
+
+# ---------- Plans de requête ----------
+PLANS = [
+    # (description, requête, paramètres, index attendu)
+    ("tribu_par_nom", "SELECT * FROM tribus WHERE guild_id=? AND nom=? COLLATE NOCASE", (1, "bench"), "idx_tribus_nom_nocase"),
+    ("autocomplétion triée", "SELECT nom FROM tribus WHERE guild_id=? ORDER BY nom COLLATE NOCASE ASC", (1,), "idx_tribus_nom_nocase"),
+    ("historique (page suivante)",
+     "SELECT id FROM historique WHERE tribu_id=? AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT 10",
+     (1, "2024-01-01T00:00:00", 1), "idx_historique_tribu_date"),
+]
+
+async def verifier_plans():
+    """Vérifie que les recherches critiques utilisent bien leur index (EXPLAIN QUERY PLAN)"""
+    ok = True
+    for nom, sql, params, index in PLANS:
+        plan = " / ".join(row["detail"] for row in await main.db_fetchall(f"EXPLAIN QUERY PLAN {sql}", params))
+        utilise = f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan
+        ok = ok and utilise
+        print(f"{'✅' if utilise else '❌'} {nom:<26} {plan}")
+    return ok
+
+# ---------- Pagination de l'historique : OFFSET vs curseur ----------
+HISTORIQUE = 50_000
+
+def _remplir_historique(conn, tribu_id: int):
+    debut = dt.datetime(2024, 1, 1)
+    conn.executemany(
+        "INSERT INTO historique (tribu_id, user_id, action, details, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(tribu_id, i % 50, "bench", "", (debut + dt.timedelta(seconds=i)).isoformat()) for i in range(HISTORIQUE)],
+    )
+
+async def page_offset(tribu_id: int, page: int):
+    """Ancienne façon : COUNT(*) + OFFSET à chaque clic"""
+    await main.db_fetchone("SELECT COUNT(*) as total FROM historique WHERE tribu_id=?", (tribu_id,))
+    return await main.db_fetchall("""
+        SELECT user_id, action, details, created_at FROM historique
+        WHERE tribu_id=? ORDER BY created_at DESC LIMIT ? OFFSET ?
+    """, (tribu_id, 10, page * 10))
+
+async def bench_historique(tribu_id: int):
+    await main.db_write(_remplir_historique, tribu_id)
+    print(f"\n== Pagination de l'historique ({HISTORIQUE} entrées) ==")
+    for page in (0, 100, 4000):
+        debut = time.perf_counter()
+        await page_offset(tribu_id, page)
+        print(f"OFFSET + COUNT (avant)        page {page:<5} {(time.perf_counter() - debut) * 1000:7.2f} ms")
+    
+    # Curseur : on se place juste avant la page visée puis on lit une page
+    for page in (0, 100, 4000):
+        cible = await main.db_fetchone("""
+            SELECT created_at, id FROM historique WHERE tribu_id=?
+            ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?
+        """, (tribu_id, page * 10 - 1)) if page else None
+        curseur = (cible["created_at"], cible["id"]) if cible else None
+        debut = time.perf_counter()
+        await main.compter_historique(tribu_id)
+        await main.lire_page_historique(tribu_id, curseur, 10)
+        print(f"curseur + total en cache      page {page:<5} {(time.perf_counter() - debut) * 1000:7.2f} ms")
+
+# ---------- Autocomplétion : filtre Python vs FTS5 vs index en mémoire ----------
+TRIBUS = 10_000
+AUTRES_SERVEURS = 4
+SAISIES = ("", "s", "spi", "rouge", "tribu 42", "aptor", "spinso rouje")
+REPETITIONS = 200
+
+def _remplir_tribus(conn, guild_id: int):
+    mots = ("Spinos", "Éclair", "Rouge", "Raptors", "Loups", "Titans", "Alpha", "Dragons")
+    conn.executemany(
+        "INSERT INTO tribus (guild_id, nom, proprietaire_id, created_at) VALUES (?, ?, ?, ?)",
+        [(guild_id, f"{mots[i % 8]} {mots[i // 8 % 8]} Tribu {i}", i, "2024-01-01T00:00:00") for i in range(TRIBUS)],
+    )
+
+async def autocomplete_python(guild_id: int, saisie: str):
+    """Ancienne façon : toutes les tribus de la guilde puis filtre en Python"""
+    rows = await main.db_fetchall("SELECT nom FROM tribus WHERE guild_id=? ORDER BY nom COLLATE NOCASE ASC", (guild_id,))
+    return [r["nom"] for r in rows if saisie.lower() in r["nom"].lower()][:25]
+
+async def bench_autocompletion():
+    await main.db_write(_remplir_tribus, 2)
+    for autre in range(3, 3 + AUTRES_SERVEURS):  # mêmes noms sur d'autres serveurs du fichier : la requête FTS doit les écarter
+        await main.db_write(_remplir_tribus, autre)
+    print(f"\n== Autocomplétion ({TRIBUS} tribus, + {TRIBUS} sur {AUTRES_SERVEURS} autres serveurs) ==")
+    debut = time.perf_counter()
+    await main.index_noms_serveur(2)
+    print(f"{'construction de l index':<28} {(time.perf_counter() - debut) * 1000:7.2f} ms")
+    
+    lent = False
+    for nom, fonction in (("filtre Python (avant)", autocomplete_python), ("FTS5 préfixes", main.rechercher_noms_fts),
+                          ("index en mémoire", main.rechercher_noms_tribus)):
+        repetitions = REPETITIONS if fonction is main.rechercher_noms_tribus else 20
+        for saisie in SAISIES:
+            debut = time.perf_counter()
+            for _ in range(repetitions):
+                resultats = await fonction(2, saisie)
+            duree = (time.perf_counter() - debut) * 1000 / repetitions
+            lent = lent or (fonction is main.rechercher_noms_tribus and duree >= 1.0)
+            print(f"{nom:<28} {saisie!r:<15} {duree:7.3f} ms  ({len(resultats)} résultats"
+                  f"{', 1er : ' + resultats[0] if resultats else ''})")
+    
+    # Recherche seule, sans la boucle asyncio autour
+    index = await main.index_noms_serveur(2)
+    for saisie in SAISIES:
+        debut = time.perf_counter()
+        for _ in range(REPETITIONS):
+            index.rechercher(saisie)
+        print(f"{'IndexNoms.rechercher':<28} {saisie!r:<15} {(time.perf_counter() - debut) * 1e6 / REPETITIONS:7.1f} µs")
+    
+    # Renommage : l'index suit la publication de l'écrivain
+    tribu = await main.db_fetchone("SELECT id FROM tribus WHERE guild_id=2 LIMIT 1")
+    await main.db_execute("UPDATE tribus SET nom=? WHERE id=?", ("Zzz Renommée", tribu["id"]))
+    print(f"{'après renommage':<28} {'zzz':<15} {await main.rechercher_noms_tribus(2, 'zzz')}")
+    return not lent
+
+async def run():
+    await main.db_thread(main.db_init)
+    tribu_id = await main.db_write(lambda conn: conn.execute(
+        "INSERT INTO tribus (guild_id, nom, proprietaire_id, created_at) VALUES (?, ?, ?, ?)",
+        (1, "Bench", 1, "2024-01-01T00:00:00"),
+    ).lastrowid)
+
+    print("== Plans de requête ==")
+    if not await verifier_plans():
+        raise SystemExit("❌ Une requête critique n'utilise pas son index")
+    
+    print(f"\n== Lag de la boucle : {ECRIVAINS} écrivains x {ECRITURES} écritures ==")
+    await bench_lag("sqlite synchrone (avant)", ecrivain_sync, tribu_id)
+    await bench_lag("db_write (group commit)", ecrivain_async, tribu_id)
+    s = main.db_ecrivain.resume()
+    print(f"{'':<28} lots={s['lots']}  taille moy={s['taille_moy']:.1f}  latence commit moy={s['latence_moy_ms']:.2f} ms")
+
+    await main.db_write(_remplir_tribu, tribu_id)
+    print(f"\n== Chargement d'une fiche ({CHARGEMENTS} chargements) ==")
+    await bench_chargement("6 requêtes séparées (avant)", fiche_six_requetes, tribu_id)
+    await bench_chargement("charger_fiche_tribu", main.charger_fiche_tribu, tribu_id)
+    
+    await bench_historique(tribu_id)
+    if not await bench_autocompletion():
+        raise SystemExit("❌ Autocomplétion par l'index en mémoire au-delà d'1 ms")
+
+if __name__ == "__main__":
+    print(f"Python {sys.version.split()[0]} — base temporaire {main.DB_PATH}")
+    asyncio.run(run())
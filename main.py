@@ -7,15 +7,33 @@ Bot Discord — Fiches Tribu (FR) avec UI (boutons + modals)
 - Modals pour saisir les infos sans taper les commandes
 """
 import os
+import re
+import sys
+import bisect
+import heapq
+import csv
+import json
+import zlib
 import sqlite3
+import time
+import queue
+import asyncio
+import tempfile
+import unicodedata
+import urllib.parse
 import datetime as dt
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from typing import Optional
-from threading import Thread
+from dataclasses import dataclass
+from threading import Thread, Lock
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import discord
 from discord import app_commands
-from discord.ext import commands
-from flask import Flask
+from discord.ext import commands, tasks
+from flask import Flask, jsonify
 
 # ---------- Keep-alive HTTP (pour Replit) ----------
 app = Flask(__name__)
@@ -24,6 +42,11 @@ app = Flask(__name__)
 def home():
     return "✅ Bot Discord en ligne"
 
+@app.route("/maintenance")
+def maintenance():
+    """Dernières opérations de maintenance SQLite (durées en ms), pour la supervision"""
+    return jsonify(resume_maintenance())
+
 def keep_alive():
     """Lance un mini serveur web pour maintenir le bot actif sur Replit"""
     def run():
@@ -40,7 +63,10 @@ DB_PATH = os.getenv("SQLITE_PATH", os.getenv("TRIBU_BOT_DB", "tribus.db"))
 # Base de données séparée pour les identités utilisateurs
 # Sur Railway : /data/arki_identite.db (dans le coffre)
 # En local : arki_identite.db (racine du projet)
-if os.getenv("SQLITE_PATH"):
+if os.getenv("ARKI_IDENTITE_DB"):
+    # Chemin explicite (bench.py, bases jetables)
+    IDENTITE_DB_PATH = os.getenv("ARKI_IDENTITE_DB")
+elif os.getenv("SQLITE_PATH"):
     # Railway : utiliser le répertoire /data/
     IDENTITE_DB_PATH = "/data/arki_identite.db"
 else:
@@ -53,319 +79,1687 @@ def identite_db_connect():
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA busy_timeout = 30000")
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
-def identite_db_init():
+def identite_db_init(dry_run: bool = False):
     """Initialisation de la base de données Arki Identité"""
-    with identite_db_connect() as conn:
-        cursor = conn.cursor()
-        cursor.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT, data TEXT)")
-        conn.commit()
+    with identite_db_pool.ecrivain() as conn:
+        rapport = migrer(conn, IDENTITE_MIGRATIONS, dry_run)
+    _afficher_migrations("Arki Identité", rapport, dry_run)
+    return rapport
 
 # ---------- Base de données Tribus ----------
-def db_connect():
+def db_connect(chemin: Optional[str] = None):
     """Connexion à la base de données avec timeout et busy handler pour éviter les locks"""
-    conn = sqlite3.connect(DB_PATH, timeout=30.0, check_same_thread=False)
+    # uri=True : seul l'ATTACH en lecture seule de la base Arki Identité s'en sert (cf. attacher_identite)
+    conn = sqlite3.connect(chemin or DB_PATH, timeout=30.0, check_same_thread=False, uri=True)
     conn.row_factory = sqlite3.Row
     # Activer le mode WAL pour améliorer la concurrence
     conn.execute("PRAGMA journal_mode=WAL")
     # Augmenter le busy_timeout pour attendre jusqu'à 30 secondes
     conn.execute("PRAGMA busy_timeout = 30000")
+    # Désactivées par défaut dans SQLite : sans ça, les ON DELETE CASCADE ne s'appliquent pas
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
-def db_init():
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS tribus (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            description TEXT DEFAULT '',
-            couleur INTEGER DEFAULT 0x2F3136,
-            logo_url TEXT DEFAULT '',
-            base TEXT DEFAULT '',
-            map_base TEXT DEFAULT '',
-            coords_base TEXT DEFAULT '',
-            tags TEXT DEFAULT '',
-            proprietaire_id INTEGER NOT NULL,
-            created_at TEXT NOT NULL
-        )
-        """)
-        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_unique ON tribus(guild_id, nom)")
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS membres (
-            tribu_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            role TEXT DEFAULT '',
-            manager INTEGER DEFAULT 0,
-            PRIMARY KEY (tribu_id, user_id),
-            FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
-        )
-        """)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS avant_postes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tribu_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            map TEXT DEFAULT '',
-            coords TEXT DEFAULT '',
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
-        )
+# ---------- Migrations du schéma ----------
+# Chaque étape est appliquée une seule fois, dans l'ordre : la version atteinte est
+# stockée dans PRAGMA user_version. Les bases créées avant ce système sont en version 0,
+# d'où des premières étapes tolérantes (IF NOT EXISTS, colonnes déjà présentes...).
+def _ajouter_colonnes(c, table: str, colonnes: list):
+    """ALTER TABLE ADD COLUMN pour chaque colonne absente"""
+    existantes = {row["name"] for row in c.execute(f"PRAGMA table_info({table})")}
+    for nom, definition in colonnes:
+        if nom not in existantes:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {nom} {definition}")
+
+def _migration_001_schema(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS tribus (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        description TEXT DEFAULT '',
+        couleur INTEGER DEFAULT 0x2F3136,
+        logo_url TEXT DEFAULT '',
+        base TEXT DEFAULT '',
+        map_base TEXT DEFAULT '',
+        coords_base TEXT DEFAULT '',
+        tags TEXT DEFAULT '',
+        proprietaire_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_unique ON tribus(guild_id, nom)")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS membres (
+        tribu_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        role TEXT DEFAULT '',
+        manager INTEGER DEFAULT 0,
+        PRIMARY KEY (tribu_id, user_id),
+        FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS avant_postes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tribu_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        map TEXT DEFAULT '',
+        coords TEXT DEFAULT '',
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS maps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        UNIQUE(guild_id, nom)
+    )
+    """)
+    _ajouter_colonnes(c, "tribus", [
+        ("map_base", "TEXT DEFAULT ''"),
+        ("coords_base", "TEXT DEFAULT ''"),
+        ("message_id", "INTEGER DEFAULT 0"),
+        ("channel_id", "INTEGER DEFAULT 0"),
+        ("devise", "TEXT DEFAULT ''"),
+        ("ouvert_recrutement", "INTEGER DEFAULT 0"),
+        ("photo_base", "TEXT DEFAULT ''"),
+        ("objectif", "TEXT DEFAULT ''"),
+        ("progression_boss", "TEXT DEFAULT ''"),
+        ("progression_notes", "TEXT DEFAULT ''"),
+        ("progression_boss_non_valides", "TEXT DEFAULT ''"),
+        ("progression_notes_non_valides", "TEXT DEFAULT ''"),
+    ])
+    _ajouter_colonnes(c, "membres", [("nom_in_game", "TEXT DEFAULT ''")])
+    
+    # Tables pour boss et notes
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS boss (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        UNIQUE(guild_id, nom)
+    )
+    """)
+    
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS notes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        UNIQUE(guild_id, nom)
+    )
+    """)
+    
+    # Table d'historique
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS historique (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tribu_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        details TEXT DEFAULT '',
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
+    )
+    """)
+    
+    # Table de configuration
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS config (
+        guild_id INTEGER NOT NULL,
+        cle TEXT NOT NULL,
+        valeur TEXT DEFAULT '',
+        PRIMARY KEY (guild_id, cle)
+    )
+    """)
+    
+    # Table pour les photos de la galerie (jusqu'à 10 photos par tribu)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS photos_tribu (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tribu_id INTEGER NOT NULL,
+        url TEXT NOT NULL,
+        ordre INTEGER DEFAULT 0,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
+    )
+    """)
+    
+    # Table pour les maps premium
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS maps_premium (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        UNIQUE(guild_id, nom)
+    )
+    """)
+    
+    # Table pour les bases premium (similaire aux avant-postes)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS bases_premium (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tribu_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        nom TEXT NOT NULL,
+        map TEXT DEFAULT '',
+        coords TEXT DEFAULT '',
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
+    )
+    """)
+
+def _migration_002_donnees_defaut(c):
+    maintenant = dt.datetime.utcnow().isoformat()
+    
+    # Bannière, couleur (bleu Discord), texte du panneau et salon des fiches (0 = salon actuel)
+    config_defaut = [
+        ("banniere_panneau", "https://i.postimg.cc/8c6gy1qK/AB2723-D2-B10-F-40-F7-A124-1-D6-F30510096.jpg"),
+        ("couleur_panneau", "5865F2"),
+        ("texte_panneau", "Bienvenue sur le panneau de gestion des tribus ! Utilise les boutons ci-dessous pour gérer ta tribu."),
+        ("salon_fiche_tribu", "0"),
+    ]
+    c.executemany("INSERT OR IGNORE INTO config (guild_id, cle, valeur) VALUES (0, ?, ?)", config_defaut)
+    
+    default_boss = ["Broodmother", "Megapithecus", "Dragon", "Cave Tek", "Manticore", "Rockwell", "King Titan", "Boss Astraeos"]
+    c.executemany("INSERT OR IGNORE INTO boss (guild_id, nom, created_at) VALUES (0, ?, ?)",
+                  [(nom, maintenant) for nom in default_boss])
+    
+    default_notes = ["Notes Island", "Notes Scorched", "Notes Abbération", "Extinction", "Bob"]
+    c.executemany("INSERT OR IGNORE INTO notes (guild_id, nom, created_at) VALUES (0, ?, ?)",
+                  [(nom, maintenant) for nom in default_notes])
+    
+    default_maps = [
+        "The Island", "Scorched Earth", "Svartalfheim", "Abberation",
+        "The Center", "Extinction", "Astraeos", "Ragnarok", "Valguero"
+    ]
+    c.executemany("INSERT OR IGNORE INTO maps (guild_id, nom, created_at) VALUES (0, ?, ?)",
+                  [(nom, maintenant) for nom in default_maps])
+    
+    default_maps_premium = ["Svartalfheim", "Némésis"]
+    c.executemany("INSERT OR IGNORE INTO maps_premium (guild_id, nom, created_at) VALUES (0, ?, ?)",
+                  [(nom, maintenant) for nom in default_maps_premium])
+
+def _migration_003_photo_base(c):
+    # Migrer les photos existantes depuis photo_base vers photos_tribu (si la galerie est vide)
+    c.execute("""
+    INSERT INTO photos_tribu (tribu_id, url, ordre, created_at)
+    SELECT t.id, t.photo_base, 0, ?
+    FROM tribus t
+    WHERE t.photo_base IS NOT NULL AND t.photo_base != ''
+      AND NOT EXISTS (SELECT 1 FROM photos_tribu p WHERE p.tribu_id = t.id)
+    """, (dt.datetime.utcnow().isoformat(),))
+
+def _migration_004_index(c):
+    # Index pour optimiser les performances avec beaucoup d'utilisateurs
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tribus_guild ON tribus(guild_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tribus_proprietaire ON tribus(proprietaire_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_membres_tribu ON membres(tribu_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_membres_user ON membres(user_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_avant_postes_tribu ON avant_postes(tribu_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_photos_tribu ON photos_tribu(tribu_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historique_tribu ON historique(tribu_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bases_premium_tribu ON bases_premium(tribu_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_config_guild ON config(guild_id)")
+
+def _migration_005_progression(c):
+    # Une ligne par (tribu, boss/note) au lieu des listes séparées par des virgules dans tribus
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS tribu_progression (
+        tribu_id INTEGER NOT NULL,
+        item_id TEXT NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ('boss', 'note')),
+        state TEXT NOT NULL CHECK (state IN ('valide', 'non_valide')),
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (tribu_id, kind, item_id),
+        FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
+    )
+    """)
+    # "Quelles tribus ont validé Dragon ?"
+    c.execute("CREATE INDEX IF NOT EXISTS idx_progression_item ON tribu_progression(kind, item_id, state)")
+    
+    # Reprise des anciennes colonnes (conservées, mais plus écrites)
+    maintenant = dt.datetime.utcnow().isoformat()
+    colonnes = [
+        ("progression_boss", "boss", "valide"),
+        ("progression_boss_non_valides", "boss", "non_valide"),
+        ("progression_notes", "note", "valide"),
+        ("progression_notes_non_valides", "note", "non_valide"),
+    ]
+    c.execute(f"SELECT id, {', '.join(col for col, _, _ in colonnes)} FROM tribus")
+    lignes = []
+    for tribu in c.fetchall():
+        for colonne, kind, state in colonnes:
+            for item in (tribu[colonne] or "").split(","):
+                if item.strip():
+                    lignes.append((tribu["id"], item.strip(), kind, state, maintenant))
+    # En cas de doublon entre les deux listes, la dernière écrite (non validé) l'emporte, comme avant
+    c.executemany("""
+    INSERT INTO tribu_progression (tribu_id, item_id, kind, state, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(tribu_id, kind, item_id) DO UPDATE SET state=excluded.state
+    """, lignes)
+
+def _migration_006_nom_nocase(c):
+    # Remplace les recherches LOWER(nom)=LOWER(?) (scan) par un index COLLATE NOCASE (seek).
+    # Les doublons qui ne diffèrent que par la casse sont signalés, puis renommés
+    # (la plus ancienne tribu garde son nom) pour que l'index puisse être unique.
+    # Chaque renommage est inscrit dans l'historique de la tribu (user_id 0 : le bot).
+    c.execute("""
+    SELECT guild_id, GROUP_CONCAT(id) AS ids
+    FROM tribus
+    GROUP BY guild_id, nom COLLATE NOCASE
+    HAVING COUNT(*) > 1
+    """)
+    for collision in c.fetchall():
+        ids = sorted(int(i) for i in collision["ids"].split(","))
+        noms = [c.execute("SELECT nom FROM tribus WHERE id=?", (i,)).fetchone()["nom"] for i in ids]
+        print(f"⚠️ Collision de casse (serveur {collision['guild_id']}) : {', '.join(noms)}")
+        for tribu_id, nom in zip(ids[1:], noms[1:]):
+            nouveau_nom = f"{nom} #{tribu_id}"
+            c.execute("UPDATE tribus SET nom=? WHERE id=?", (nouveau_nom, tribu_id))
+            c.execute("""
+                INSERT INTO historique (tribu_id, user_id, action, details, created_at)
+                VALUES (?, 0, 'Tribu renommée', ?, ?)
+            """, (tribu_id, f"« {nom} » → « {nouveau_nom} » : une tribu plus ancienne du serveur porte déjà ce nom "
+                            f"(à la casse près). Un manager peut choisir un autre nom.",
+                  dt.datetime.utcnow().isoformat()))
+            print(f"   - tribu {tribu_id} renommée « {nouveau_nom} »")
+    
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_tribus_nom_nocase ON tribus(guild_id, nom COLLATE NOCASE)")
+    # Couvert par le nouvel index (même préfixe guild_id, unicité plus stricte)
+    c.execute("DROP INDEX IF EXISTS idx_unique")
+
+def _migration_007_historique_keyset(c):
+    # Pagination par curseur (created_at, id) : chaque page est un seek dans l'index
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historique_tribu_date ON historique(tribu_id, created_at, id)")
+    c.execute("DROP INDEX IF EXISTS idx_historique_tribu")
+
+def _migration_008_historique_archive(c):
+    # Un bloc = un lot d'entrées d'une tribu, en JSON compressé (zlib)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS historique_archive (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tribu_id INTEGER NOT NULL,
+        debut TEXT NOT NULL,
+        fin TEXT NOT NULL,
+        nb INTEGER NOT NULL,
+        donnees BLOB NOT NULL
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_historique_archive_tribu ON historique_archive(tribu_id, fin)")
+
+def _migration_009_recherche_fts(c):
+    # rowid = tribus.id ; la colonne membres regroupe les noms in-game des membres
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS tribus_fts USING fts5(
+        nom, description, devise, objectif, membres,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """)
+    c.execute("""
+    INSERT INTO tribus_fts (rowid, nom, description, devise, objectif, membres)
+    SELECT t.id, t.nom, t.description, t.devise, t.objectif,
+           (SELECT GROUP_CONCAT(m.nom_in_game, ' ') FROM membres m WHERE m.tribu_id = t.id)
+    FROM tribus t
+    """)
+    
+    # Synchronisation par triggers : aucune écriture applicative à modifier
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS tribus_fts_insert AFTER INSERT ON tribus BEGIN
+        INSERT INTO tribus_fts (rowid, nom, description, devise, objectif, membres)
+        VALUES (new.id, new.nom, new.description, new.devise, new.objectif, '');
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS tribus_fts_update AFTER UPDATE OF nom, description, devise, objectif ON tribus BEGIN
+        UPDATE tribus_fts SET nom = new.nom, description = new.description, devise = new.devise, objectif = new.objectif
+        WHERE rowid = new.id;
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS tribus_fts_delete AFTER DELETE ON tribus BEGIN
+        DELETE FROM tribus_fts WHERE rowid = old.id;
+    END
+    """)
+    membres_sql = "(SELECT GROUP_CONCAT(m.nom_in_game, ' ') FROM membres m WHERE m.tribu_id = {0}.tribu_id)"
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS membres_fts_insert AFTER INSERT ON membres BEGIN
+        UPDATE tribus_fts SET membres = {membres_sql.format("new")} WHERE rowid = new.tribu_id;
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS membres_fts_update AFTER UPDATE OF nom_in_game ON membres BEGIN
+        UPDATE tribus_fts SET membres = {membres_sql.format("new")} WHERE rowid = new.tribu_id;
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS membres_fts_delete AFTER DELETE ON membres BEGIN
+        UPDATE tribus_fts SET membres = {membres_sql.format("old")} WHERE rowid = old.tribu_id;
+    END
+    """)
+
+def _migration_010_serveurs_bases(c):
+    # Catalogue des bases par serveur (mode DB_SHARDS) : numero sert aussi de préfixe aux ids de tribus
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS serveurs_bases (
+        guild_id INTEGER PRIMARY KEY,
+        numero INTEGER NOT NULL UNIQUE,
+        created_at TEXT NOT NULL
+    )
+    """)
+
+# Colonnes de tribus affichées sur la fiche : message_id / channel_id n'en font pas partie
+COLONNES_FICHE = ("nom", "description", "couleur", "logo_url", "base", "map_base", "coords_base", "tags",
+                  "proprietaire_id", "devise", "ouvert_recrutement", "photo_base", "objectif")
+TABLES_FICHE = ("membres", "avant_postes", "photos_tribu", "bases_premium", "tribu_progression")
+
+def _migration_011_revision_tribus(c):
+    # Compteur monotone incrémenté par trigger à chaque modification visible sur la fiche
+    _ajouter_colonnes(c, "tribus", [("revision", "INTEGER NOT NULL DEFAULT 0")])
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS tribus_revision AFTER UPDATE OF {", ".join(COLONNES_FICHE)} ON tribus BEGIN
+        UPDATE tribus SET revision = revision + 1 WHERE id = new.id;
+    END
+    """)
+    for table in TABLES_FICHE:
+        for evenement, ligne in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+            c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_revision_{evenement.lower()} AFTER {evenement} ON {table} BEGIN
+                UPDATE tribus SET revision = revision + 1 WHERE id = {ligne}.tribu_id;
+            END
+            """)
+
+def _migration_012_bot_messages(c):
+    # Messages publiés par le bot (panneaux, fiches) : retrouvés sans relire l'historique des salons
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS bot_messages (
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        ref_id INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (channel_id, message_id)
+    ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bot_messages_kind ON bot_messages(guild_id, kind, ref_id)")
+    # Les fiches déjà publiées sont connues par tribus.message_id
+    c.execute("""
+    INSERT OR IGNORE INTO bot_messages (guild_id, channel_id, message_id, kind, ref_id)
+    SELECT guild_id, channel_id, message_id, 'fiche', id FROM tribus WHERE message_id != 0 AND channel_id != 0
+    """)
+
+def _migration_013_fts_serveur(c):
+    # Colonne serveur (jeton "g<guild_id>") : la requête MATCH est restreinte au serveur dans l'index
+    # au lieu de classer les résultats de tous les serveurs puis de filtrer après la jointure.
+    # Index de préfixes 1-2 caractères : une saisie courte ne parcourt plus tous les termes.
+    for trigger in ("tribus_fts_insert", "tribus_fts_update", "tribus_fts_delete",
+                    "membres_fts_insert", "membres_fts_update", "membres_fts_delete"):
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    c.execute("DROP TABLE IF EXISTS tribus_fts")
+    c.execute("""
+    CREATE VIRTUAL TABLE tribus_fts USING fts5(
+        nom, description, devise, objectif, membres, serveur,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '1 2'
+    )
+    """)
+    c.execute("""
+    INSERT INTO tribus_fts (rowid, nom, description, devise, objectif, membres, serveur)
+    SELECT t.id, t.nom, t.description, t.devise, t.objectif,
+           (SELECT GROUP_CONCAT(m.nom_in_game, ' ') FROM membres m WHERE m.tribu_id = t.id),
+           'g' || t.guild_id
+    FROM tribus t
+    """)
+    c.execute("""
+    CREATE TRIGGER tribus_fts_insert AFTER INSERT ON tribus BEGIN
+        INSERT INTO tribus_fts (rowid, nom, description, devise, objectif, membres, serveur)
+        VALUES (new.id, new.nom, new.description, new.devise, new.objectif, '', 'g' || new.guild_id);
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER tribus_fts_update AFTER UPDATE OF nom, description, devise, objectif ON tribus BEGIN
+        UPDATE tribus_fts SET nom = new.nom, description = new.description, devise = new.devise, objectif = new.objectif
+        WHERE rowid = new.id;
+    END
+    """)
+    c.execute("""
+    CREATE TRIGGER tribus_fts_delete AFTER DELETE ON tribus BEGIN
+        DELETE FROM tribus_fts WHERE rowid = old.id;
+    END
+    """)
+    membres_sql = "(SELECT GROUP_CONCAT(m.nom_in_game, ' ') FROM membres m WHERE m.tribu_id = {0}.tribu_id)"
+    for evenement, ligne in (("INSERT", "new"), ("UPDATE OF nom_in_game", "new"), ("DELETE", "old")):
+        c.execute(f"""
+        CREATE TRIGGER membres_fts_{evenement.split()[0].lower()} AFTER {evenement} ON membres BEGIN
+            UPDATE tribus_fts SET membres = {membres_sql.format(ligne)} WHERE rowid = {ligne}.tribu_id;
+        END
         """)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS maps (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            UNIQUE(guild_id, nom)
-        )
+
+# (version, description, fonction) — ne jamais modifier une étape déjà publiée, en ajouter une nouvelle
+MIGRATIONS = [
+    (1, "Schéma de base (tables et colonnes)", _migration_001_schema),
+    (2, "Configuration, maps, boss et notes par défaut", _migration_002_donnees_defaut),
+    (3, "photo_base -> photos_tribu", _migration_003_photo_base),
+    (4, "Index de performance", _migration_004_index),
+    (5, "Table tribu_progression (boss et notes)", _migration_005_progression),
+    (6, "Index unique insensible à la casse sur le nom des tribus", _migration_006_nom_nocase),
+    (7, "Index composite historique (tribu_id, created_at, id)", _migration_007_historique_keyset),
+    (8, "Archive compressée de l'historique", _migration_008_historique_archive),
+    (9, "Index plein texte des tribus (FTS5)", _migration_009_recherche_fts),
+    (10, "Catalogue des bases par serveur", _migration_010_serveurs_bases),
+    (11, "Révision des tribus (cache des fiches)", _migration_011_revision_tribus),
+    (12, "Messages publiés par le bot (panneaux, fiches)", _migration_012_bot_messages),
+    (13, "Index plein texte restreint par serveur", _migration_013_fts_serveur),
+]
+
+def _identite_migration_001_schema(c):
+    c.execute("CREATE TABLE IF NOT EXISTS users (user_id TEXT, data TEXT)")
+
+def _identite_migration_002_profils(c):
+    # L'ancienne table (user_id TEXT, data TEXT) gardait une ligne par sauvegarde : seule la dernière est reprise
+    c.execute("""
+    CREATE TABLE users_profils (
+        user_id INTEGER PRIMARY KEY,
+        profil TEXT NOT NULL DEFAULT '{}' CHECK (json_valid(profil)),
+        format INTEGER NOT NULL DEFAULT 1,
+        version INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+    """)
+    maintenant = dt.datetime.utcnow().isoformat()
+    c.execute("""
+    INSERT INTO users_profils (user_id, profil, created_at, updated_at)
+    SELECT CAST(user_id AS INTEGER), json_object('data', data), ?, ?
+    FROM users
+    WHERE rowid IN (SELECT MAX(rowid) FROM users WHERE user_id GLOB '[0-9]*' GROUP BY user_id)
+    """, (maintenant, maintenant))
+    c.execute("DROP TABLE users")
+    c.execute("ALTER TABLE users_profils RENAME TO users")
+
+IDENTITE_MIGRATIONS = [
+    (1, "Table users", _identite_migration_001_schema),
+    (2, "Profils JSON versionnés indexés par user_id", _identite_migration_002_profils),
+]
+
+def migrer(conn, migrations: list, dry_run: bool = False) -> dict:
+    """Applique les migrations en attente (une transaction par étape)
+    
+    En dry-run, les étapes sont exécutées puis annulées (ROLLBACK) : rien n'est écrit.
+    """
+    debut = time.perf_counter()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    en_attente = [m for m in migrations if m[0] > version]
+    appliquees = []
+    
+    c = conn.cursor()
+    try:
+        for numero, description, fonction in en_attente:
+            if not conn.in_transaction:
+                c.execute("BEGIN IMMEDIATE")
+            debut_etape = time.perf_counter()
+            fonction(c)
+            c.execute(f"PRAGMA user_version = {int(numero)}")
+            if not dry_run:
+                conn.commit()
+            appliquees.append((numero, description, (time.perf_counter() - debut_etape) * 1000))
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+    
+    return {"version_initiale": version,
+            "version_finale": appliquees[-1][0] if appliquees else version,
+            "appliquees": appliquees,
+            "duree_ms": (time.perf_counter() - debut) * 1000}
+
+def _afficher_migrations(nom: str, rapport: dict, dry_run: bool = False):
+    prefixe = "🧪 [dry-run] " if dry_run else "🗄️ "
+    print(f"{prefixe}Base {nom} : schéma v{rapport['version_initiale']} -> v{rapport['version_finale']} "
+          f"({len(rapport['appliquees'])} migration(s), {rapport['duree_ms']:.1f} ms)")
+    for numero, description, duree in rapport["appliquees"]:
+        print(f"   - {numero:03d} {description} ({duree:.1f} ms)")
+
+# ---------- Révisions des tribus ----------
+# Dernière révision connue de chaque tribu, publiée par l'écrivain juste après le COMMIT :
+# le cache des fiches sait sans requête si ce qu'il garde est encore à jour (l'index des
+# noms suit le même canal).
+_revisions = {}
+_revisions_verrou = Lock()
+
+def noter_revision(tribu_id: int, revision: int):
+    """Retient une révision lue ou écrite (jamais de retour en arrière)"""
+    with _revisions_verrou:
+        if revision > _revisions.get(tribu_id, -1):
+            _revisions[tribu_id] = revision
+
+def installer_suivi_revisions(conn):
+    """Triggers TEMP, propres à la connexion écrivain : notent chaque tribu créée, modifiée
+    (nouvelle révision, nom courant) ou supprimée (révision -1) dans une table TEMP"""
+    conn.execute("""
+    CREATE TEMP TABLE IF NOT EXISTS tribus_modifiees (
+        tribu_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, nom TEXT NOT NULL, revision INTEGER NOT NULL
+    )
+    """)
+    for nom, evenement, ligne, revision in (("suivi_creations", "INSERT", "new", "new.revision"),
+                                            ("suivi_revisions", "UPDATE OF revision", "new", "new.revision"),
+                                            ("suivi_suppressions", "DELETE", "old", "-1")):
+        conn.execute(f"""
+        CREATE TEMP TRIGGER IF NOT EXISTS {nom} AFTER {evenement} ON main.tribus BEGIN
+            INSERT OR REPLACE INTO tribus_modifiees (tribu_id, guild_id, nom, revision)
+            VALUES ({ligne}.id, {ligne}.guild_id, {ligne}.nom, {revision});
+        END
         """)
+
+def _collecter_tribus_modifiees(conn):
+    # Dans la transaction du lot : un ROLLBACK remet aussi ces lignes en place
+    try:
+        return conn.execute("DELETE FROM temp.tribus_modifiees RETURNING tribu_id, guild_id, nom, revision").fetchall()
+    except sqlite3.OperationalError:
+        return None  # suivi pas encore installé sur cette connexion
+
+def _publier_tribus_modifiees(lignes):
+    for tribu_id, _, _, revision in lignes:
+        if revision < 0:
+            with _revisions_verrou:
+                _revisions.pop(tribu_id, None)  # tribu supprimée
+        else:
+            noter_revision(tribu_id, revision)
+    appliquer_index_noms(lignes)
+
+def db_init(dry_run: bool = False):
+    """Met le schéma de la base tribus à jour (migrations en attente uniquement)"""
+    with db_pool.ecrivain() as conn:
+        rapport = migrer(conn, MIGRATIONS, dry_run)
+        if not dry_run:
+            installer_suivi_revisions(conn)
+    _afficher_migrations("tribus", rapport, dry_run)
+    return rapport
+
+# ---------- Pool de connexions ----------
+class PoolSQLite:
+    """Connexions persistantes : 1 écrivain + N lecteurs en query_only (PRAGMA appliqués une seule fois)
+
+    preparer(conn) : appelé sur la connexion d'écriture à l'ouverture, avant les lecteurs (migrations...).
+    Une fois fermé (fermer()), le pool ne se rouvre plus : tout nouvel emprunt lève sqlite3.ProgrammingError.
+    """
+    def __init__(self, connect, lecteurs: int, preparer=None):
+        self.connect = connect
+        self.preparer = preparer
+        self.nb_lecteurs = max(1, lecteurs)
+        self._ecrivain = None
+        self._verrou_ecriture = Lock()
+        self._lecteurs = queue.Queue()
+        self._verrou_init = Lock()
+        self.ferme = False
+        self._stats_verrou = Lock()
+        self.stats = {"lecture": {"checkouts": 0, "attente": 0.0, "attente_max": 0.0},
+                      "ecriture": {"checkouts": 0, "attente": 0.0, "attente_max": 0.0}}
+    
+    def _ouvrir(self):
+        # Ouverture paresseuse : db_init doit avoir pu créer le fichier avant
+        with self._verrou_init:
+            self._verifier_ouvert()
+            if self._ecrivain is not None:
+                return
+            ecrivain = self.connect()
+            if self.preparer:
+                try:
+                    self.preparer(ecrivain)
+                except Exception:
+                    ecrivain.close()  # nouvelle tentative complète au prochain emprunt
+                    raise
+            for _ in range(self.nb_lecteurs):
+                conn = self.connect()
+                conn.execute("PRAGMA query_only = ON")
+                self._lecteurs.put(conn)
+            self._ecrivain = ecrivain
+    
+    def _verifier_ouvert(self):
+        if self.ferme:
+            raise sqlite3.ProgrammingError("Pool SQLite fermé")
+    
+    def _compter(self, sorte: str, attente: float):
+        with self._stats_verrou:
+            s = self.stats[sorte]
+            s["checkouts"] += 1
+            s["attente"] += attente
+            s["attente_max"] = max(s["attente_max"], attente)
+    
+    @contextmanager
+    def lecteur(self):
+        """Emprunte une connexion en lecture seule"""
+        if self._ecrivain is None:
+            self._ouvrir()
+        debut = time.perf_counter()
+        conn = self._lecteurs.get()
+        if conn is None:
+            # Pool fermé pendant l'attente : réveiller le suivant
+            self._lecteurs.put(None)
+            self._verifier_ouvert()
+        self._compter("lecture", time.perf_counter() - debut)
         try:
-            c.execute("ALTER TABLE tribus ADD COLUMN map_base TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN coords_base TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN message_id INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN channel_id INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN devise TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN ouvert_recrutement INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN photo_base TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN objectif TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN progression_boss TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN progression_notes TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN progression_boss_non_valides TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            c.execute("ALTER TABLE tribus ADD COLUMN progression_notes_non_valides TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._verrou_init:
+                # Emprunté avant la fermeture : fermé au retour plutôt que remis dans la file
+                if self.ferme:
+                    conn.close()
+                else:
+                    self._lecteurs.put(conn)
+    
+    @contextmanager
+    def ecrivain(self):
+        """Emprunte l'unique connexion d'écriture (accès exclusif)"""
+        if self._ecrivain is None:
+            self._ouvrir()
+        debut = time.perf_counter()
+        with self._verrou_ecriture:
+            self._verifier_ouvert()
+            self._compter("ecriture", time.perf_counter() - debut)
+            yield self._ecrivain
+    
+    def resume(self) -> dict:
+        """Copie des métriques (temps en millisecondes)"""
+        with self._stats_verrou:
+            return {sorte: {"checkouts": s["checkouts"],
+                            "attente_moy_ms": s["attente"] * 1000 / s["checkouts"] if s["checkouts"] else 0.0,
+                            "attente_max_ms": s["attente_max"] * 1000}
+                    for sorte, s in self.stats.items()}
+    
+    def fermer(self):
+        """Ferme définitivement le pool ; les lecteurs empruntés sont fermés à leur retour"""
+        with self._verrou_init, self._verrou_ecriture:
+            if self.ferme:
+                return
+            self.ferme = True
+            if self._ecrivain is not None:
+                self._ecrivain.close()
+                self._ecrivain = None
+            while not self._lecteurs.empty():
+                self._lecteurs.get_nowait().close()
+            self._lecteurs.put(None)  # débloque les emprunts en attente
+
+# ---------- Écrivain unique (group commit) ----------
+class EcrivainGroupe:
+    """Thread écrivain unique : les mutations arrivent par une file et sont regroupées
+    dans une seule transaction (un SAVEPOINT par mutation, un COMMIT par lot)"""
+    def __init__(self, pool: PoolSQLite, delai_ms: float, taille_max: int, collecter=None, publier=None):
+        self.pool = pool
+        # collecter(conn) s'exécute juste avant le COMMIT, publier(valeur) juste après (avant les Futures)
+        self.collecter = collecter
+        self.publier = publier
+        self.delai = delai_ms / 1000
+        self.taille_max = max(1, taille_max)
+        self._file = queue.Queue()
+        self._thread = None
+        self.arrete = False
+        self._verrou_init = Lock()
+        self._stats_verrou = Lock()
+        self.stats = {"lots": 0, "mutations": 0, "taille_max": 0, "latence": 0.0, "latence_max": 0.0}
+    
+    def soumettre(self, fonction, args):
+        """Ajoute une mutation à la file et retourne son Future"""
+        if self.arrete:
+            fut = Future()
+            fut.set_exception(sqlite3.ProgrammingError("Écrivain SQLite arrêté"))
+            return fut
+        if self._thread is None:
+            with self._verrou_init:
+                if self._thread is None:
+                    self._thread = Thread(target=self._boucle, name="sqlite-ecrivain", daemon=True)
+                    self._thread.start()
+        fut = Future()
+        self._file.put((fonction, args, fut))
+        return fut
+    
+    def arreter(self):
+        """Termine le thread après les mutations déjà soumises, puis ferme le pool"""
+        self.arrete = True
+        if self._thread is None:
+            self.pool.fermer()
+        else:
+            self._file.put(None)
+    
+    def _boucle(self):
+        while True:
+            lot = [self._file.get()]
+            fin = lot[0] is None
+            # Laisser quelques ms aux autres mutations pour rejoindre le lot
+            limite = time.perf_counter() + self.delai
+            while not fin and len(lot) < self.taille_max:
+                reste = limite - time.perf_counter()
+                try:
+                    element = self._file.get(timeout=reste) if reste > 0 else self._file.get_nowait()
+                except queue.Empty:
+                    break
+                fin = element is None
+                lot.append(element)
+            lot = [element for element in lot if element is not None]
+            if lot:
+                try:
+                    self._executer(lot)
+                except Exception as e:
+                    # Le thread doit survivre : sinon toutes les écritures suivantes attendraient à jamais
+                    print(f"⚠️ Erreur de l'écrivain SQLite : {e}")
+                    self._echouer(lot, e)
+            if fin:
+                self.pool.fermer()
+                # Mutations arrivées pendant l'arrêt : jamais exécutées, échouer plutôt que pendre
+                while not self._file.empty():
+                    element = self._file.get_nowait()
+                    if element is not None and element[2].set_running_or_notify_cancel():
+                        element[2].set_exception(sqlite3.ProgrammingError("Écrivain SQLite arrêté"))
+                return
+    
+    @staticmethod
+    def _echouer(lot, erreur: Exception):
+        """Termine en erreur toutes les mutations du lot encore en suspens"""
+        for fonction, args, fut in lot:
+            if fut.done() or not (fut.running() or fut.set_running_or_notify_cancel()):
+                continue
+            fut.set_exception(erreur)
+    
+    def _executer(self, lot):
+        debut = time.perf_counter()
+        resultats = []
         try:
-            c.execute("ALTER TABLE membres ADD COLUMN nom_in_game TEXT DEFAULT ''")
-        except sqlite3.OperationalError:
-            pass
-        
-        # Tables pour boss et notes
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS boss (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            UNIQUE(guild_id, nom)
-        )
-        """)
-        
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS notes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            UNIQUE(guild_id, nom)
-        )
-        """)
-        
-        # Table d'historique
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS historique (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tribu_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            action TEXT NOT NULL,
-            details TEXT DEFAULT '',
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Table de configuration
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS config (
-            guild_id INTEGER NOT NULL,
-            cle TEXT NOT NULL,
-            valeur TEXT DEFAULT '',
-            PRIMARY KEY (guild_id, cle)
-        )
-        """)
-        
-        # Initialiser la bannière par défaut si elle n'existe pas
-        c.execute("""
-        INSERT OR IGNORE INTO config (guild_id, cle, valeur)
-        VALUES (0, 'banniere_panneau', 'https://i.postimg.cc/8c6gy1qK/AB2723-D2-B10-F-40-F7-A124-1-D6-F30510096.jpg')
-        """)
-        
-        # Initialiser la couleur du panneau par défaut (bleu Discord)
-        c.execute("""
-        INSERT OR IGNORE INTO config (guild_id, cle, valeur)
-        VALUES (0, 'couleur_panneau', '5865F2')
-        """)
-        
-        # Initialiser le texte du panneau par défaut
-        c.execute("""
-        INSERT OR IGNORE INTO config (guild_id, cle, valeur)
-        VALUES (0, 'texte_panneau', 'Bienvenue sur le panneau de gestion des tribus ! Utilise les boutons ci-dessous pour gérer ta tribu.')
-        """)
-        
-        # Salon par défaut pour les fiches tribu (0 = salon actuel)
-        c.execute("""
-        INSERT OR IGNORE INTO config (guild_id, cle, valeur)
-        VALUES (0, 'salon_fiche_tribu', '0')
-        """)
-        
-        # Boss par défaut
-        default_boss = ["Broodmother", "Megapithecus", "Dragon", "Cave Tek", "Manticore", "Rockwell", "King Titan", "Boss Astraeos"]
-        for boss_name in default_boss:
-            c.execute("INSERT OR IGNORE INTO boss (guild_id, nom, created_at) VALUES (?, ?, ?)",
-                     (0, boss_name, dt.datetime.utcnow().isoformat()))
-        
-        # Notes par défaut
-        default_notes = ["Notes Island", "Notes Scorched", "Notes Abbération", "Extinction", "Bob"]
-        for note_name in default_notes:
-            c.execute("INSERT OR IGNORE INTO notes (guild_id, nom, created_at) VALUES (?, ?, ?)",
-                     (0, note_name, dt.datetime.utcnow().isoformat()))
-        
-        # Ajouter les maps par défaut si elles n'existent pas
-        default_maps = [
-            "The Island", "Scorched Earth", "Svartalfheim", "Abberation",
-            "The Center", "Extinction", "Astraeos", "Ragnarok", "Valguero"
-        ]
-        for map_name in default_maps:
-            c.execute("INSERT OR IGNORE INTO maps (guild_id, nom, created_at) VALUES (?, ?, ?)",
-                     (0, map_name, dt.datetime.utcnow().isoformat()))
-        
-        # Table pour les photos de la galerie (jusqu'à 10 photos par tribu)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS photos_tribu (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tribu_id INTEGER NOT NULL,
-            url TEXT NOT NULL,
-            ordre INTEGER DEFAULT 0,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Migrer les photos existantes depuis photo_base vers la nouvelle table
-        c.execute("SELECT id, photo_base FROM tribus WHERE photo_base IS NOT NULL AND photo_base != ''")
-        tribus_avec_photo = c.fetchall()
-        for tribu in tribus_avec_photo:
-            # Vérifier si la photo n'existe pas déjà dans la nouvelle table
-            c.execute("SELECT COUNT(*) as count FROM photos_tribu WHERE tribu_id=?", (tribu["id"],))
-            if c.fetchone()["count"] == 0:
-                c.execute("""
-                INSERT INTO photos_tribu (tribu_id, url, ordre, created_at)
-                VALUES (?, ?, 0, ?)
-                """, (tribu["id"], tribu["photo_base"], dt.datetime.utcnow().isoformat()))
-        
-        # Table pour les maps premium
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS maps_premium (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            guild_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            UNIQUE(guild_id, nom)
-        )
-        """)
-        
-        # Maps premium par défaut
-        default_maps_premium = ["Svartalfheim", "Némésis"]
-        for map_name in default_maps_premium:
-            c.execute("INSERT OR IGNORE INTO maps_premium (guild_id, nom, created_at) VALUES (?, ?, ?)",
-                     (0, map_name, dt.datetime.utcnow().isoformat()))
-        
-        # Table pour les bases premium (similaire aux avant-postes)
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS bases_premium (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tribu_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            nom TEXT NOT NULL,
-            map TEXT DEFAULT '',
-            coords TEXT DEFAULT '',
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (tribu_id) REFERENCES tribus(id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Ajouter des index pour optimiser les performances avec beaucoup d'utilisateurs
-        c.execute("CREATE INDEX IF NOT EXISTS idx_tribus_guild ON tribus(guild_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_tribus_proprietaire ON tribus(proprietaire_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_membres_tribu ON membres(tribu_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_membres_user ON membres(user_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_avant_postes_tribu ON avant_postes(tribu_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_photos_tribu ON photos_tribu(tribu_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_historique_tribu ON historique(tribu_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_bases_premium_tribu ON bases_premium(tribu_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_config_guild ON config(guild_id)")
+            # L'emprunt lui-même peut échouer (preparer/migrations à l'ouverture, pool fermé)
+            with self.pool.ecrivain() as conn:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    for fonction, args, fut in lot:
+                        if not fut.set_running_or_notify_cancel():
+                            continue
+                        conn.execute("SAVEPOINT mutation")
+                        try:
+                            resultats.append((fut, fonction(conn, *args), None))
+                            conn.execute("RELEASE mutation")
+                        except Exception as e:
+                            # Seule la mutation fautive est annulée, le reste du lot continue
+                            conn.execute("ROLLBACK TO mutation")
+                            conn.execute("RELEASE mutation")
+                            resultats.append((fut, None, e))
+                    collecte = self.collecter(conn) if self.collecter else None
+                    conn.commit()
+                except Exception:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    raise
+        except Exception as e:
+            print(f"⚠️ Échec du commit groupé ({len(lot)} mutations) : {e}")
+            self._echouer(lot, e)
+            return
         
+        if collecte and self.publier:
+            # Déjà commité : une erreur de publication ne doit pas faire échouer les mutations
+            try:
+                self.publier(collecte)
+            except Exception as e:
+                print(f"⚠️ Publication après commit impossible : {e}")
+        for fut, resultat, erreur in resultats:
+            if erreur is None:
+                fut.set_result(resultat)
+            else:
+                fut.set_exception(erreur)
+        
+        latence = time.perf_counter() - debut
+        with self._stats_verrou:
+            s = self.stats
+            s["lots"] += 1
+            s["mutations"] += len(lot)
+            s["taille_max"] = max(s["taille_max"], len(lot))
+            s["latence"] += latence
+            s["latence_max"] = max(s["latence_max"], latence)
+    
+    def resume(self) -> dict:
+        """Copie des métriques (temps en millisecondes)"""
+        with self._stats_verrou:
+            s = self.stats
+            return {"lots": s["lots"], "mutations": s["mutations"],
+                    "taille_moy": s["mutations"] / s["lots"] if s["lots"] else 0.0,
+                    "taille_max": s["taille_max"],
+                    "latence_moy_ms": s["latence"] * 1000 / s["lots"] if s["lots"] else 0.0,
+                    "latence_max_ms": s["latence_max"] * 1000,
+                    "en_attente": self._file.qsize()}
+
+# ---------- Accès asynchrone à la base ----------
+# Les lectures tournent dans des threads dédiés, les écritures passent par
+# l'écrivain unique : la boucle asyncio du bot n'attend jamais un verrou SQLite.
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+DB_LECTEURS = int(os.getenv("DB_LECTEURS", str(DB_WORKERS)))
+# Group commit : fenêtre de regroupement des écritures et taille max d'un lot
+DB_GROUPE_MS = float(os.getenv("DB_GROUPE_MS", "2"))
+DB_GROUPE_MAX = int(os.getenv("DB_GROUPE_MAX", "64"))
+_db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="sqlite")
+db_pool = PoolSQLite(db_connect, DB_LECTEURS)
+identite_db_pool = PoolSQLite(identite_db_connect, 1)
+db_ecrivain = EcrivainGroupe(db_pool, DB_GROUPE_MS, DB_GROUPE_MAX, _collecter_tribus_modifiees, _publier_tribus_modifiees)
+identite_db_ecrivain = EcrivainGroupe(identite_db_pool, DB_GROUPE_MS, DB_GROUPE_MAX)
+
+# ---------- Une base par serveur (optionnel) ----------
+# DB_SHARDS=1 : chaque serveur a son fichier (DB_SHARDS_DIR/guild_<id>.db), avec son propre écrivain,
+# et DB_PATH devient le catalogue global : valeurs par défaut (guild_id=0) et table serveurs_bases.
+# Le serveur de l'interaction en cours est porté par serveur_courant, que db_read/db_write suivent.
+# Les ids de tribus restent uniques entre bases : chaque base numérote à partir de numero << 32.
+DB_SHARDS = os.getenv("DB_SHARDS", "0") == "1"
+DB_SHARDS_DIR = os.getenv("DB_SHARDS_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "serveurs"))
+DB_SHARDS_OUVERTS = int(os.getenv("DB_SHARDS_OUVERTS", "32"))
+DB_SHARDS_LECTEURS = int(os.getenv("DB_SHARDS_LECTEURS", "2"))
+TABLES_CATALOGUE = ("config", "boss", "notes", "maps", "maps_premium")
+serveur_courant = ContextVar("serveur_courant", default=0)
+
+@contextmanager
+def sur_serveur(guild_id: int):
+    """Route les accès base du bloc vers la base de ce serveur"""
+    jeton = serveur_courant.set(guild_id or 0)
+    try:
+        yield
+    finally:
+        serveur_courant.reset(jeton)
+
+def chemin_base_serveur(guild_id: int) -> str:
+    return os.path.join(DB_SHARDS_DIR, f"guild_{guild_id}.db")
+
+def _enregistrer_base_serveur(guild_id: int) -> int:
+    """Numéro de la base d'un serveur dans le catalogue (attribué à la première ouverture)"""
+    with db_pool.ecrivain() as cat:
+        cat.execute("""
+            INSERT OR IGNORE INTO serveurs_bases (guild_id, numero, created_at)
+            VALUES (?, (SELECT COALESCE(MAX(numero), 0) + 1 FROM serveurs_bases), ?)
+        """, (guild_id, dt.datetime.utcnow().isoformat()))
+        cat.commit()
+        return cat.execute("SELECT numero FROM serveurs_bases WHERE guild_id=?", (guild_id,)).fetchone()[0]
+
+def _preparer_base_serveur(conn, guild_id: int):
+    rapport = migrer(conn, MIGRATIONS)
+    if rapport["appliquees"]:
+        _afficher_migrations(f"serveur {guild_id}", rapport)
+    numero = _enregistrer_base_serveur(guild_id)
+    
+    # Valeurs par défaut recopiées depuis le catalogue (seule source) à chaque ouverture
+    conn.execute("ATTACH DATABASE ? AS catalogue", (DB_PATH,))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in TABLES_CATALOGUE:
+            colonnes = ", ".join(row["name"] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+            conn.execute(f"DELETE FROM main.{table} WHERE guild_id = 0")
+            conn.execute(f"INSERT INTO main.{table} ({colonnes}) SELECT {colonnes} FROM catalogue.{table} WHERE guild_id = 0")
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'tribus', 0 WHERE NOT EXISTS "
+                     "(SELECT 1 FROM sqlite_sequence WHERE name = 'tribus')")
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'tribus'", (numero << 32,))
         conn.commit()
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute("DETACH DATABASE catalogue")
+    installer_suivi_revisions(conn)
+
+class RoutageBases:
+    """Bases par serveur ouvertes à la demande ; au-delà de `ouvertes_max`, la moins récente est fermée
+
+    Une base évincée encore empruntée (emprunter/rendre) n'est fermée qu'au dernier rendu ;
+    redemandée entre-temps, elle est reprise telle quelle.
+    """
+    def __init__(self, ouvertes_max: int):
+        self.ouvertes_max = max(1, ouvertes_max)
+        self._bases = OrderedDict()  # guild_id -> (pool, écrivain)
+        self._emprunts = Counter()  # guild_id -> emprunts en cours
+        self._a_fermer = {}  # guild_id -> (pool, écrivain) évincée, fermée au dernier rendu
+        self._verrou = Lock()
+        self.ouvertures = 0
+        self.fermetures = 0
+    
+    def base(self, guild_id: int):
+        """(pool, écrivain) de ce serveur — ne fait aucune I/O : l'ouverture a lieu au premier accès"""
+        with self._verrou:
+            return self._base(guild_id)
+    
+    def _base(self, guild_id: int):
+        base = self._bases.get(guild_id) or self._a_fermer.pop(guild_id, None)
+        if base is None:
+            os.makedirs(DB_SHARDS_DIR, exist_ok=True)
+            chemin = chemin_base_serveur(guild_id)
+            pool = PoolSQLite(lambda: db_connect(chemin), DB_SHARDS_LECTEURS,
+                              preparer=lambda conn: _preparer_base_serveur(conn, guild_id))
+            ecrivain = EcrivainGroupe(pool, DB_GROUPE_MS, DB_GROUPE_MAX, _collecter_tribus_modifiees, _publier_tribus_modifiees)
+            base = (pool, ecrivain)
+            self.ouvertures += 1
+        self._bases[guild_id] = base
+        self._bases.move_to_end(guild_id)
+        while len(self._bases) > self.ouvertes_max:
+            self._evincer(*self._bases.popitem(last=False))
+        return base
+    
+    def _evincer(self, guild_id: int, base):
+        if self._emprunts[guild_id]:
+            self._a_fermer[guild_id] = base
+        else:
+            base[1].arreter()
+            self.fermetures += 1
+    
+    def emprunter(self, guild_id: int):
+        """base(guild_id), protégée de la fermeture jusqu'au rendre() correspondant"""
+        with self._verrou:
+            base = self._base(guild_id)
+            self._emprunts[guild_id] += 1
+            return base
+    
+    def emprunter_ouverte(self, guild_id: int):
+        """Comme emprunter(), sans ouvrir ni rafraîchir l'ordre LRU — None si la base n'est pas ouverte"""
+        with self._verrou:
+            base = self._bases.get(guild_id)
+            if base is not None:
+                self._emprunts[guild_id] += 1
+            return base
+    
+    def rendre(self, guild_id: int):
+        with self._verrou:
+            self._emprunts[guild_id] -= 1
+            if self._emprunts[guild_id] <= 0:
+                del self._emprunts[guild_id]
+                base = self._a_fermer.pop(guild_id, None)
+                if base is not None:
+                    base[1].arreter()
+                    self.fermetures += 1
+    
+    def ouvertes(self) -> list:
+        return list(self._bases.items())
+    
+    def fermer_base(self, guild_id: int):
+        """Ferme la base d'un serveur ; le prochain base(guild_id) en rouvre une neuve"""
+        with self._verrou:
+            base = self._bases.pop(guild_id, None)
+            if base is not None:
+                self._evincer(guild_id, base)
+    
+    def fermer(self):
+        with self._verrou:
+            bases = list(self._bases.values()) + list(self._a_fermer.values())
+            self._bases.clear()
+            self._a_fermer.clear()
+        for _, ecrivain in bases:
+            ecrivain.arreter()
+
+routage = RoutageBases(DB_SHARDS_OUVERTS)
+
+def base_courante():
+    """(pool, écrivain) à utiliser pour le serveur courant : catalogue pour guild 0 ou hors mode DB_SHARDS
+
+    Sans emprunt, la base d'un serveur peut être fermée par éviction : préférer base_empruntee().
+    """
+    guild_id = serveur_courant.get()
+    if not DB_SHARDS or not guild_id:
+        return db_pool, db_ecrivain
+    return routage.base(guild_id)
+
+@contextmanager
+def base_empruntee():
+    """base_courante(), non fermée par éviction tant que le bloc (qui peut contenir des await) est en cours"""
+    guild_id = serveur_courant.get()
+    if not DB_SHARDS or not guild_id:
+        yield db_pool, db_ecrivain
+        return
+    base = routage.emprunter(guild_id)
+    try:
+        yield base
+    finally:
+        routage.rendre(guild_id)
+
+def router_interaction(inter: discord.Interaction):
+    """La tâche qui traite l'interaction (commande, autocomplétion, bouton, modal) s'exécute sur la base
+    de son serveur ; les tâches qu'elle crée héritent du contexte, donc de serveur_courant"""
+    serveur_courant.set(inter.guild_id or 0)
+
+class ArbreCommandes(app_commands.CommandTree):
+    """CommandTree dont les commandes et autocomplétions sont routées vers la base de leur serveur"""
+    async def interaction_check(self, inter: discord.Interaction) -> bool:
+        router_interaction(inter)
+        return True
+
+class VueServeur(discord.ui.View):
+    """discord.ui.View dont les callbacks sont routés vers la base du serveur de l'interaction"""
+    async def interaction_check(self, inter: discord.Interaction) -> bool:
+        router_interaction(inter)
+        return True
+
+class ModalServeur(discord.ui.Modal):
+    """ModalServeur dont on_submit est routé vers la base du serveur de l'interaction"""
+    async def interaction_check(self, inter: discord.Interaction) -> bool:
+        router_interaction(inter)
+        return True
+
+async def serveurs_connus() -> list:
+    """guild_id de tous les serveurs ayant des tribus (catalogue en mode DB_SHARDS)"""
+    with sur_serveur(0):
+        if DB_SHARDS:
+            rows = await db_fetchall("SELECT guild_id FROM serveurs_bases ORDER BY numero")
+        else:
+            rows = await db_fetchall("SELECT DISTINCT guild_id FROM tribus")
+    return [row["guild_id"] for row in rows]
+
+def decouper_par_serveur(purger: bool = False) -> dict:
+    """Copie les données de chaque serveur de DB_PATH dans sa propre base — retourne {guild_id: nb tribus}"""
+    with db_pool.lecteur() as conn:
+        serveurs = [row[0] for row in conn.execute(
+            " UNION ".join(f"SELECT guild_id FROM {table} WHERE guild_id != 0" for table in ("tribus", *TABLES_CATALOGUE))
+        )]
+    # Tables liées à une tribu, copiées à la suite de leur tribu (ids d'origine conservés)
+    enfants = ("membres", "avant_postes", "photos_tribu", "bases_premium", "tribu_progression", "historique", "historique_archive")
+    resultat = {}
+    for guild_id in serveurs:
+        pool, _ = routage.base(guild_id)
+        with pool.ecrivain() as conn:
+            conn.execute("ATTACH DATABASE ? AS source", (DB_PATH,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for table in ("tribus", *TABLES_CATALOGUE, "bot_messages", *enfants):
+                    colonnes = ", ".join(row["name"] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+                    filtre = ("tribu_id IN (SELECT id FROM source.tribus WHERE guild_id = ?)" if table in enfants
+                              else "guild_id = ?")
+                    conn.execute(f"INSERT OR IGNORE INTO main.{table} ({colonnes}) "
+                                 f"SELECT {colonnes} FROM source.{table} WHERE {filtre}", (guild_id,))
+                resultat[guild_id] = conn.execute("SELECT COUNT(*) FROM main.tribus").fetchone()[0]
+                conn.commit()
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute("DETACH DATABASE source")
+        routage.fermer_base(guild_id)
+    
+    if purger:
+        # Les lignes liées partent avec leur tribu (ON DELETE CASCADE)
+        with db_pool.ecrivain() as conn:
+            for guild_id in serveurs:
+                conn.execute("DELETE FROM historique_archive WHERE tribu_id IN (SELECT id FROM tribus WHERE guild_id = ?)", (guild_id,))
+                for table in ("tribus", *TABLES_CATALOGUE, "bot_messages"):
+                    conn.execute(f"DELETE FROM {table} WHERE guild_id = ?", (guild_id,))
+            conn.commit()
+    return resultat
+
+async def db_thread(fonction, *args):
+    """Exécute une fonction synchrone quelconque dans un thread SQLite"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, fonction, *args)
+
+def _db_lecture(pool: PoolSQLite, fonction, args):
+    with pool.lecteur() as conn:
+        return fonction(conn, *args)
+
+async def db_read(fonction, *args):
+    """Exécute fonction(conn, *args) en lecture dans un thread SQLite"""
+    with base_empruntee() as (pool, _):
+        return await db_thread(_db_lecture, pool, fonction, args)
+
+async def db_write(fonction, *args):
+    """Exécute fonction(conn, *args) via l'écrivain unique (atomique, rollback si erreur)"""
+    with base_empruntee() as (_, ecrivain):
+        return await asyncio.wrap_future(ecrivain.soumettre(fonction, args))
+
+async def db_fetchone(sql: str, params: tuple = ()):
+    """Retourne la première ligne d'une requête (ou None)"""
+    return await db_read(lambda conn: conn.execute(sql, params).fetchone())
+
+async def db_fetchall(sql: str, params: tuple = ()):
+    """Retourne toutes les lignes d'une requête"""
+    return await db_read(lambda conn: conn.execute(sql, params).fetchall())
+
+async def db_execute(sql: str, params: tuple = ()) -> int:
+    """Exécute une écriture et retourne le nombre de lignes modifiées"""
+    return await db_write(lambda conn: conn.execute(sql, params).rowcount)
 
-def get_config(guild_id: int, cle: str, defaut: str = "") -> str:
+async def identite_db_write(fonction, *args):
+    """Équivalent de db_write pour la base Arki Identité"""
+    return await asyncio.wrap_future(identite_db_ecrivain.soumettre(fonction, args))
+
+async def identite_db_read(fonction, *args):
+    """Équivalent de db_read pour la base Arki Identité"""
+    return await db_thread(_db_lecture, identite_db_pool, fonction, args)
+
+# ---------- Cache LRU ----------
+class CacheLRU:
+    """Cache LRU en mémoire, utilisé depuis la boucle asyncio uniquement (pas de verrou)"""
+    def __init__(self, taille: int):
+        self.taille = max(1, taille)
+        self._donnees = OrderedDict()
+        self.hits = 0
+        self.miss = 0
+    
+    def __contains__(self, cle) -> bool:
+        return cle in self._donnees
+    
+    def get(self, cle, defaut=None):
+        try:
+            valeur = self._donnees[cle]
+        except KeyError:
+            self.miss += 1
+            return defaut
+        self._donnees.move_to_end(cle)
+        self.hits += 1
+        return valeur
+    
+    def peek(self, cle, defaut=None):
+        """Lecture sans effet sur l'ordre ni sur les compteurs"""
+        return self._donnees.get(cle, defaut)
+    
+    def put(self, cle, valeur):
+        self._donnees[cle] = valeur
+        self._donnees.move_to_end(cle)
+        if len(self._donnees) > self.taille:
+            self._donnees.popitem(last=False)
+    
+    def invalider(self, cle):
+        self._donnees.pop(cle, None)
+    
+    def vider(self):
+        self._donnees.clear()
+    
+    def resume(self) -> dict:
+        total = self.hits + self.miss
+        return {"entrees": len(self._donnees), "taille": self.taille, "hits": self.hits, "miss": self.miss,
+                "taux": self.hits / total if total else 0.0}
+
+# ---------- Profils Arki Identité ----------
+# Une ligne par utilisateur (user_id INTEGER PRIMARY KEY) : profil JSON fusionné champ par champ,
+# version incrémentée à chaque écriture. Lectures servies par un LRU mis à jour à l'écriture.
+PROFIL_FORMAT = 1  # structure du JSON profil : à incrémenter, avec une migration, si elle change
+PROFILS_CACHE = int(os.getenv("PROFILS_CACHE", "2048"))
+_ABSENT = object()
+_profils = CacheLRU(PROFILS_CACHE)
+
+@dataclass(slots=True)
+class Profil:
+    user_id: int
+    champs: dict
+    version: int
+    updated_at: str
+
+def _profil_depuis_ligne(row) -> Optional[Profil]:
+    return Profil(row["user_id"], json.loads(row["profil"]), row["version"], row["updated_at"]) if row else None
+
+def _lire_profil(conn, user_id: int):
+    return _profil_depuis_ligne(conn.execute(
+        "SELECT user_id, profil, version, updated_at FROM users WHERE user_id=?", (user_id,)
+    ).fetchone())
+
+def _ecrire_profil(conn, user_id: int, champs: str, maintenant: str):
+    # json_patch : les champs fournis remplacent les anciens, un champ à null est supprimé
+    return _profil_depuis_ligne(conn.execute("""
+        INSERT INTO users (user_id, profil, format, version, created_at, updated_at)
+        VALUES (?1, json_patch('{}', ?2), ?3, 1, ?4, ?4)
+        ON CONFLICT(user_id) DO UPDATE SET
+            profil = json_patch(users.profil, ?2),
+            format = excluded.format,
+            version = users.version + 1,
+            updated_at = excluded.updated_at
+        RETURNING user_id, profil, version, updated_at
+    """, (user_id, champs, PROFIL_FORMAT, maintenant)).fetchone())
+
+async def lire_profil(user_id: int) -> Optional[Profil]:
+    """Profil Arki Identité d'un utilisateur (None s'il n'en a pas)"""
+    profil = _profils.get(user_id, _ABSENT)
+    if profil is _ABSENT:
+        profil = await identite_db_read(_lire_profil, user_id)
+        # Une écriture terminée pendant la lecture a déjà mis le cache à jour
+        if user_id not in _profils:
+            _profils.put(user_id, profil)
+    return profil
+
+async def maj_profil(user_id: int, champs: dict) -> Profil:
+    """Crée ou met à jour des champs du profil (upsert) et rafraîchit le cache"""
+    profil = await identite_db_write(_ecrire_profil, user_id, json.dumps(champs), dt.datetime.utcnow().isoformat())
+    actuel = _profils.peek(user_id)
+    if actuel is None or actuel.version < profil.version:
+        _profils.put(user_id, profil)
+    return profil
+
+def attacher_identite(conn) -> bool:
+    """Attache la base Arki Identité en lecture seule, une fois par connexion (sans jamais créer le fichier)"""
+    if any(row[1] == "identite" for row in conn.execute("PRAGMA database_list")):
+        return True
+    uri = "file:" + urllib.parse.quote(os.path.abspath(IDENTITE_DB_PATH)) + "?mode=ro"
+    try:
+        conn.execute("ATTACH DATABASE ? AS identite", (uri,))
+    except sqlite3.OperationalError:
+        return False  # base Arki Identité pas encore créée
+    return True
+
+def _membres_avec_profils(conn, tribu_id: int):
+    profils = ("u.profil, u.version", "LEFT JOIN identite.users u ON u.user_id = m.user_id") if attacher_identite(conn) \
+        else ("NULL AS profil, NULL AS version", "")
+    return conn.execute(f"""
+        SELECT m.user_id, m.nom_in_game, m.role, m.manager, {profils[0]}
+        FROM membres m
+        {profils[1]}
+        WHERE m.tribu_id = ?
+        ORDER BY m.manager DESC, m.user_id ASC
+    """, (tribu_id,)).fetchall()
+
+async def membres_avec_profils(tribu_id: int):
+    """Membres d'une tribu avec leur profil Arki Identité, en une jointure sur la base attachée"""
+    return await db_read(_membres_avec_profils, tribu_id)
+
+# ---------- Configuration (cache par serveur) ----------
+# Toute la config d'un serveur est chargée en une requête, valeurs du serveur par-dessus les valeurs
+# globales (guild_id=0), puis lue comme un dict. set_config met à jour le cache après l'écriture.
+_config_serveurs = {}  # guild_id -> {cle: valeur}
+_config_generations = {}  # guild_id -> compteur d'écritures (ignore un chargement devenu périmé)
+_config_stats = {"hits": 0, "miss": 0}
+
+def _lire_config_serveur(conn, guild_id: int) -> dict:
+    # guild_id 0 d'abord : les valeurs du serveur écrasent les valeurs globales
+    return {row["cle"]: row["valeur"] for row in conn.execute(
+        "SELECT cle, valeur FROM config WHERE guild_id IN (0, ?) ORDER BY guild_id", (guild_id,)
+    )}
+
+async def config_serveur(guild_id: int) -> dict:
+    """Configuration complète d'un serveur (à ne pas modifier : passer par set_config)"""
+    config = _config_serveurs.get(guild_id)
+    if config is not None:
+        _config_stats["hits"] += 1
+        return config
+    _config_stats["miss"] += 1
+    generation = _config_generations.get(guild_id, 0)
+    config = await db_read(_lire_config_serveur, guild_id)
+    if _config_generations.get(guild_id, 0) == generation:
+        _config_serveurs[guild_id] = config
+    return config
+
+async def get_config(guild_id: int, cle: str, defaut: str = "") -> str:
     """Récupère une valeur de configuration pour un serveur"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        # Chercher d'abord pour ce serveur, sinon utiliser la valeur globale (guild_id=0)
-        c.execute("SELECT valeur FROM config WHERE guild_id IN (?, 0) AND cle=? ORDER BY guild_id DESC LIMIT 1", 
-                 (guild_id, cle))
-        row = c.fetchone()
-        return row["valeur"] if row else defaut
+    # Valeur du serveur, sinon valeur globale (guild_id=0), sinon défaut
+    return (await config_serveur(guild_id)).get(cle, defaut)
 
-def set_config(guild_id: int, cle: str, valeur: str):
+async def set_config(guild_id: int, cle: str, valeur: str):
     """Définit une valeur de configuration pour un serveur"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("INSERT OR REPLACE INTO config (guild_id, cle, valeur) VALUES (?, ?, ?)",
-                 (guild_id, cle, valeur))
-        conn.commit()
+    await db_execute("INSERT OR REPLACE INTO config (guild_id, cle, valeur) VALUES (?, ?, ?)",
+                     (guild_id, cle, valeur))
+    if guild_id == 0:
+        # Une valeur globale peut apparaître dans tous les serveurs : on recharge tout
+        for g in set(_config_generations) | set(_config_serveurs):
+            _config_generations[g] = _config_generations.get(g, 0) + 1
+        _config_serveurs.clear()
+        return
+    _config_generations[guild_id] = _config_generations.get(guild_id, 0) + 1
+    config = _config_serveurs.get(guild_id)
+    if config is not None:
+        _config_serveurs[guild_id] = {**config, cle: valeur}
+
+def resume_config() -> dict:
+    total = _config_stats["hits"] + _config_stats["miss"]
+    return {"serveurs": len(_config_serveurs), **_config_stats,
+            "taux": _config_stats["hits"] / total if total else 0.0}
+
+# ---------- Catalogues (maps, maps premium, boss, notes) ----------
+# Liste fusionnée (guild_id=0 + serveur) et triée, gardée en mémoire avec les Choice / SelectOption
+# déjà construits. Seuls les ajouts / retraits (PanneauParametres) invalident le catalogue.
+TABLES_CATALOGUES = ("maps", "maps_premium", "boss", "notes")
+
+@dataclass(slots=True)
+class Catalogue:
+    noms: tuple
+    choices: list  # app_commands.Choice, 25 au plus (limite Discord)
+    _options: dict  # emoji -> [discord.SelectOption]
+    
+    def options(self, emoji: Optional[str] = None) -> list:
+        """Options d'un menu déroulant (25 au plus), construites une fois par emoji"""
+        options = self._options.get(emoji)
+        if options is None:
+            options = self._options[emoji] = [discord.SelectOption(label=nom, value=nom, emoji=emoji) for nom in self.noms[:25]]
+        return list(options)
+
+_catalogues = {}  # (guild_id, table) -> Catalogue
+_catalogues_generations = {}  # (guild_id, table) -> compteur d'invalidations
+_catalogues_stats = {"hits": 0, "miss": 0}
+
+async def catalogue_serveur(guild_id: int, table: str) -> Catalogue:
+    """Catalogue d'un serveur pour maps, maps_premium, boss ou notes"""
+    cle = (guild_id, table)
+    catalogue = _catalogues.get(cle)
+    if catalogue is not None:
+        _catalogues_stats["hits"] += 1
+        return catalogue
+    _catalogues_stats["miss"] += 1
+    generation = _catalogues_generations.get(cle, 0)
+    rows = await db_fetchall(f"SELECT DISTINCT nom FROM {table} WHERE guild_id IN (0, ?) ORDER BY nom", (guild_id,))
+    noms = tuple(row["nom"] for row in rows)
+    catalogue = Catalogue(noms, [app_commands.Choice(name=nom, value=nom) for nom in noms[:25]], {})
+    if _catalogues_generations.get(cle, 0) == generation:
+        _catalogues[cle] = catalogue
+    return catalogue
+
+def invalider_catalogue(guild_id: int, table: str):
+    # Une entrée globale (guild_id=0) apparaît dans le catalogue de tous les serveurs
+    cles = [cle for cle in set(_catalogues) | set(_catalogues_generations) if cle[1] == table] if guild_id == 0 else [(guild_id, table)]
+    for cle in cles:
+        _catalogues_generations[cle] = _catalogues_generations.get(cle, 0) + 1
+        _catalogues.pop(cle, None)
+
+async def ajouter_au_catalogue(guild_id: int, table: str, nom: str) -> bool:
+    """Ajoute une entrée au catalogue du serveur — False si elle existe déjà"""
+    try:
+        await db_execute(f"INSERT INTO {table} (guild_id, nom, created_at) VALUES (?, ?, ?)",
+                         (guild_id, nom, dt.datetime.utcnow().isoformat()))
+    except sqlite3.IntegrityError:
+        return False
+    invalider_catalogue(guild_id, table)
+    return True
+
+async def retirer_du_catalogue(guild_id: int, table: str, nom: str) -> bool:
+    """Retire une entrée du catalogue du serveur — False si elle n'y était pas"""
+    if not await db_execute(f"DELETE FROM {table} WHERE guild_id=? AND nom=?", (guild_id, nom)):
+        return False
+    invalider_catalogue(guild_id, table)
+    return True
 
-def get_maps_choices(guild_id: int):
+def resume_catalogues() -> dict:
+    total = _catalogues_stats["hits"] + _catalogues_stats["miss"]
+    return {"catalogues": len(_catalogues), **_catalogues_stats,
+            "taux": _catalogues_stats["hits"] / total if total else 0.0}
+
+async def get_maps_choices(guild_id: int):
     """Récupère les choix de maps pour un serveur"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        # Maps globales (guild_id=0) + maps du serveur
-        c.execute("SELECT DISTINCT nom FROM maps WHERE guild_id IN (0, ?) ORDER BY nom", (guild_id,))
-        maps = [row["nom"] for row in c.fetchall()]
-        return [app_commands.Choice(name=m, value=m) for m in maps[:25]]  # Discord limite à 25 choix
+    # Maps globales (guild_id=0) + maps du serveur, Discord limite à 25 choix
+    return (await catalogue_serveur(guild_id, "maps")).choices
 
-def tribu_par_nom(guild_id: int, nom: str):
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM tribus WHERE guild_id=? AND LOWER(nom)=LOWER(?)", (guild_id, nom))
-        return c.fetchone()
+async def tribu_par_nom(guild_id: int, nom: str):
+    """Recherche une tribu par nom, sans tenir compte de la casse (index idx_tribus_nom_nocase)"""
+    return await db_fetchone("SELECT * FROM tribus WHERE guild_id=? AND nom=? COLLATE NOCASE", (guild_id, nom))
+
+# ---------- Recherche de tribus (FTS5) ----------
+COLONNES_FTS = "{nom description devise objectif membres}"  # tout sauf la colonne serveur
+
+def requete_fts(texte: str, colonne: str = COLONNES_FTS, guild_id: Optional[int] = None) -> Optional[str]:
+    """Transforme une saisie libre en requête FTS5 de préfixes ("spi" trouve "Spinos"),
+    restreinte au serveur dans l'index si guild_id est fourni"""
+    mots = re.findall(r"\w+", texte)
+    if not mots:
+        return None
+    prefixes = " ".join(f'"{mot}"*' for mot in mots)
+    requete = f"{colonne} : ({prefixes})"
+    return f"serveur : g{guild_id} AND {requete}" if guild_id is not None else requete
+
+async def rechercher_noms_fts(guild_id: int, saisie: str, gere_par: Optional[int] = None, limite: int = 25):
+    """Noms de tribus pour l'autocomplétion (préfixes sur le nom, via l'index FTS5)
+
+    gere_par : ne garder que les tribus dont cet utilisateur est propriétaire ou manager.
+    """
+    filtre, params = "", []
+    if gere_par is not None:
+        filtre = """AND (t.proprietaire_id = ? OR EXISTS (
+            SELECT 1 FROM membres m WHERE m.tribu_id = t.id AND m.user_id = ? AND m.manager = 1))"""
+        params = [gere_par, gere_par]
+    
+    requete = requete_fts(saisie, "nom", guild_id)
+    if requete is None:
+        rows = await db_fetchall(f"""
+            SELECT t.nom FROM tribus t WHERE t.guild_id = ? {filtre}
+            ORDER BY t.nom COLLATE NOCASE ASC LIMIT ?
+        """, (guild_id, *params, limite))
+    else:
+        rows = await db_fetchall(f"""
+            SELECT t.nom FROM tribus_fts f
+            JOIN tribus t ON t.id = f.rowid
+            WHERE tribus_fts MATCH ? AND t.guild_id = ? {filtre}
+            ORDER BY f.rank LIMIT ?
+        """, (requete, guild_id, *params, limite))
+    return [row["nom"] for row in rows]
+
+async def rechercher_tribus(guild_id: int, texte: str, limite: int = 10):
+    """Recherche classée par pertinence sur nom, description, devise, objectif et membres"""
+    requete = requete_fts(texte, guild_id=guild_id)
+    if requete is None:
+        return []
+    # bm25 : le nom pèse le plus, puis les membres et la devise
+    return await db_fetchall("""
+        SELECT t.id, t.nom,
+               snippet(tribus_fts, -1, '**', '**', '…', 10) AS extrait,
+               bm25(tribus_fts, 10.0, 1.0, 2.0, 1.0, 3.0, 0.0) AS score
+        FROM tribus_fts
+        JOIN tribus t ON t.id = tribus_fts.rowid
+        WHERE tribus_fts MATCH ? AND t.guild_id = ?
+        ORDER BY score LIMIT ?
+    """, (requete, guild_id, limite))
+
+# ---------- Index des noms en mémoire (autocomplétion) ----------
+# Par serveur : noms et mots triés (préfixes par bisect) + trigrammes (sous-chaînes et fautes
+# de frappe). Construit au premier appel, puis tenu à jour par les créations / renommages /
+# suppressions que publie l'écrivain : l'autocomplétion ne touche plus SQLite.
+INDEX_NOMS = os.getenv("INDEX_NOMS", "1") == "1"
+
+def normaliser_nom(texte: str) -> str:
+    """Minuscules sans accents ni espaces superflus ("Éclair  Rouge" -> "eclair rouge")"""
+    decompose = unicodedata.normalize("NFKD", texte.casefold())
+    return " ".join("".join(c for c in decompose if not unicodedata.combining(c)).split())
+
+def _bigrammes(mot: str) -> set:
+    """Bigrammes du mot encadré d'espaces ("loup" -> " l", "lo", "ou", "up", "p ")"""
+    mot = f" {mot} "
+    return {mot[i:i + 2] for i in range(len(mot) - 1)}
+
+class IndexNoms:
+    """Noms de tribus d'un serveur ; classement : exact, préfixe du nom, mots exacts, préfixes
+    de mots, sous-chaînes de mots, puis mots approchés (fautes de frappe)"""
+    SIMILARITE_MIN = 0.5  # coefficient de Dice sur les bigrammes
+    
+    def __init__(self, lignes=()):
+        self.noms = {}  # tribu_id -> nom affiché
+        self._cles = {}  # tribu_id -> (clé normalisée, mots)
+        self._tries = []  # (clé, tribu_id), ordre alphabétique
+        self._mots = {}  # mot -> {tribu_id}
+        self._vocabulaire = []  # mots distincts triés (préfixes par bisect)
+        self._bigrammes = {}  # bigramme -> {mot}
+        for tribu_id, nom in lignes:
+            self._indexer(tribu_id, nom, trier=False)
+        self._tries.sort()
+        self._vocabulaire.sort()
+    
+    def __len__(self) -> int:
+        return len(self.noms)
+    
+    def _indexer(self, tribu_id: int, nom: str, trier: bool = True):
+        cle = normaliser_nom(nom)
+        mots = tuple(dict.fromkeys(re.findall(r"\w+", cle)))
+        self.noms[tribu_id] = nom
+        self._cles[tribu_id] = (cle, mots)
+        ajouter = bisect.insort if trier else list.append
+        ajouter(self._tries, (cle, tribu_id))
+        for mot in mots:
+            ids = self._mots.get(mot)
+            if ids is None:
+                ids = self._mots[mot] = set()
+                ajouter(self._vocabulaire, mot)
+                for bigramme in _bigrammes(mot):
+                    self._bigrammes.setdefault(bigramme, set()).add(mot)
+            ids.add(tribu_id)
+    
+    def retirer(self, tribu_id: int):
+        entree = self._cles.pop(tribu_id, None)
+        if entree is None:
+            return
+        cle, mots = entree
+        del self.noms[tribu_id]
+        i = bisect.bisect_left(self._tries, (cle, tribu_id))
+        if i < len(self._tries) and self._tries[i] == (cle, tribu_id):
+            del self._tries[i]
+        for mot in mots:
+            ids = self._mots[mot]
+            ids.discard(tribu_id)
+            if ids:
+                continue
+            # Dernière tribu portant ce mot : il sort du vocabulaire
+            del self._mots[mot]
+            del self._vocabulaire[bisect.bisect_left(self._vocabulaire, mot)]
+            for bigramme in _bigrammes(mot):
+                self._bigrammes[bigramme].discard(mot)
+                if not self._bigrammes[bigramme]:
+                    del self._bigrammes[bigramme]
+    
+    def placer(self, tribu_id: int, nom: str):
+        """Création ou renommage"""
+        if self.noms.get(tribu_id) == nom:
+            return
+        self.retirer(tribu_id)
+        self._indexer(tribu_id, nom)
+    
+    def _mots_prefixes(self, prefixe: str) -> list:
+        debut = bisect.bisect_left(self._vocabulaire, prefixe)
+        fin = bisect.bisect_left(self._vocabulaire, prefixe + "\U0010ffff", debut)
+        return self._vocabulaire[debut:fin]
+    
+    def _mots_contenant(self, fragment: str) -> list:
+        postes = sorted((self._bigrammes.get(b, set()) for b in _bigrammes(fragment) if " " not in b), key=len)
+        if not postes or not postes[0]:
+            return []
+        return [mot for mot in set.intersection(*postes) if fragment in mot]
+    
+    def _mots_proches(self, mot: str) -> list:
+        bigrammes = _bigrammes(mot)
+        communs = Counter()
+        for bigramme in bigrammes:
+            communs.update(self._bigrammes.get(bigramme, ()))
+        return [autre for autre, n in communs.items()
+                if 2 * n / (len(bigrammes) + len(autre) + 1) >= self.SIMILARITE_MIN]
+    
+    def _tribus(self, mots: list) -> set:
+        if len(mots) == 1:
+            return self._mots[mots[0]]
+        return set().union(*(self._mots[mot] for mot in mots))
+    
+    def _premiers(self, ids: set, n: int):
+        """Les n premiers ids dans l'ordre alphabétique : tas si peu nombreux, sinon parcours du tableau trié"""
+        if len(ids) ** 2 <= n * len(self._tries):
+            return (i for _, i in heapq.nsmallest(n, ((self._cles[i][0], i) for i in ids)))
+        return (i for _, i in self._tries if i in ids)
+    
+    def rechercher(self, saisie: str, limite: int = 25, parmi: Optional[set] = None) -> list:
+        q = normaliser_nom(saisie)
+        resultats, vus = [], set()
+        
+        def prendre(ids):
+            for tribu_id in ids:
+                if len(resultats) >= limite:
+                    return
+                if tribu_id not in vus and (parmi is None or tribu_id in parmi):
+                    vus.add(tribu_id)
+                    resultats.append(tribu_id)
+        
+        # 0-1 : exact puis préfixe du nom complet (l'exact est le premier de la plage)
+        if parmi is not None and len(parmi) <= 256:
+            prendre(i for _, i in sorted((self._cles[i][0], i) for i in parmi
+                                         if i in self._cles and self._cles[i][0].startswith(q)))
+        else:
+            debut = bisect.bisect_left(self._tries, (q,))
+            fin = bisect.bisect_left(self._tries, (q + "\U0010ffff",), debut)
+            prendre(self._tries[i][1] for i in range(debut, fin))
+        
+        # 2 à 5 : chaque mot saisi doit correspondre à un mot du nom, au mieux exactement, puis
+        # par préfixe, sinon comme sous-chaîne, sinon approximativement
+        qmots = re.findall(r"\w+", q)
+        niveaux = [lambda m: [m] if m in self._mots else [],
+                   lambda m: self._mots_prefixes(m),
+                   lambda m: self._mots_contenant(m) if len(m) >= 3 else [],
+                   lambda m: self._mots_proches(m) if len(m) >= 3 else []]
+        cumul = [set() for _ in qmots]  # tribus admises pour chaque mot saisi, niveau par niveau
+        for niveau in niveaux:
+            if len(resultats) >= limite or not qmots:
+                break
+            for k, qm in enumerate(qmots):
+                mots = niveau(qm)
+                if mots:
+                    cumul[k] = cumul[k] | self._tribus(mots) if cumul[k] else self._tribus(mots)
+            if all(cumul):
+                ids = set.intersection(*sorted(cumul, key=len)) if len(cumul) > 1 else cumul[0]
+                if parmi is not None:
+                    ids = ids & parmi
+                prendre(self._premiers(ids - vus if vus else ids, limite - len(resultats)))
+        
+        return [self.noms[tribu_id] for tribu_id in resultats]
+
+_index_noms = {}  # guild_id -> IndexNoms
+_index_en_construction = {}  # guild_id -> modifications publiées pendant le chargement
+_index_taches = {}  # guild_id -> Task de construction (appels simultanés regroupés)
+_index_verrou = Lock()  # l'écrivain applique ses modifications depuis son thread
+
+def appliquer_index_noms(lignes):
+    """Créations, renommages (lignes (tribu_id, guild_id, nom, revision)) et suppressions (revision -1)"""
+    with _index_verrou:
+        for ligne in lignes:
+            tribu_id, guild_id, nom, revision = ligne
+            index = _index_noms.get(guild_id)
+            if index is not None:
+                if revision < 0:
+                    index.retirer(tribu_id)
+                else:
+                    index.placer(tribu_id, nom)
+            elif guild_id in _index_en_construction:
+                _index_en_construction[guild_id].append(tuple(ligne))
+
+async def _construire_index_noms(guild_id: int) -> IndexNoms:
+    with _index_verrou:
+        _index_en_construction[guild_id] = []
+    try:
+        rows = await db_fetchall("SELECT id, nom FROM tribus WHERE guild_id=?", (guild_id,))
+        index = await db_thread(IndexNoms, [(row["id"], row["nom"]) for row in rows])
+        with _index_verrou:
+            # Rejouer ce qui a été publié depuis le début du chargement (idempotent)
+            for tribu_id, _, nom, revision in _index_en_construction[guild_id]:
+                if revision < 0:
+                    index.retirer(tribu_id)
+                else:
+                    index.placer(tribu_id, nom)
+            _index_noms[guild_id] = index
+        return index
+    finally:
+        with _index_verrou:
+            _index_en_construction.pop(guild_id, None)
+
+async def index_noms_serveur(guild_id: int) -> IndexNoms:
+    index = _index_noms.get(guild_id)
+    if index is not None:
+        return index
+    tache = _index_taches.get(guild_id)
+    if tache is None:
+        tache = _index_taches[guild_id] = asyncio.ensure_future(_construire_index_noms(guild_id))
+        tache.add_done_callback(lambda _: _index_taches.pop(guild_id, None))
+    return await asyncio.shield(tache)
+
+async def rechercher_noms_tribus(guild_id: int, saisie: str, gere_par: Optional[int] = None, limite: int = 25):
+    """Noms de tribus pour l'autocomplétion, classés par qualité de correspondance
+
+    gere_par : ne garder que les tribus dont cet utilisateur est propriétaire ou manager.
+    """
+    if not INDEX_NOMS:
+        return await rechercher_noms_fts(guild_id, saisie, gere_par, limite)
+    index = await index_noms_serveur(guild_id)
+    parmi = None
+    if gere_par is not None:
+        rows = await db_fetchall("""
+            SELECT id FROM tribus WHERE guild_id = ?1 AND proprietaire_id = ?2
+            UNION
+            SELECT m.tribu_id FROM membres m JOIN tribus t ON t.id = m.tribu_id
+            WHERE m.user_id = ?2 AND m.manager = 1 AND t.guild_id = ?1
+        """, (guild_id, gere_par))
+        parmi = {row["id"] for row in rows}
+    with _index_verrou:
+        return index.rechercher(saisie, limite, parmi)
+
+def resume_index_noms() -> dict:
+    with _index_verrou:
+        return {"serveurs": len(_index_noms), "noms": sum(len(index) for index in _index_noms.values())}
 
 ROLE_MODO_ID = 1157803768893689877
 
@@ -381,56 +1775,790 @@ def est_admin_ou_modo(inter: discord.Interaction) -> bool:
     """Vérifie si l'utilisateur est admin ou modo"""
     return est_admin(inter) or est_modo(inter)
 
-def est_manager(tribu_id: int, user_id: int) -> bool:
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT manager FROM membres WHERE tribu_id=? AND user_id=?", (tribu_id, user_id))
-        row = c.fetchone()
-        return bool(row and row["manager"])
+# ---------- Droits sur une tribu ----------
+# Référent et manager résolus en une requête (clé primaire de tribus + clé primaire de membres),
+# mémorisés quelques secondes par (serveur, tribu, utilisateur). Un changement de membres ou de
+# référent incrémente la révision de la tribu, ce qui invalide la mémoire sans attendre le TTL.
+DROITS_TTL = float(os.getenv("DROITS_TTL", "30"))
+DROITS_CACHE = int(os.getenv("DROITS_CACHE", "4096"))
+_droits = CacheLRU(DROITS_CACHE)  # (guild_id, tribu_id, user_id) -> (revision, referent, manager, expiration)
+
+@dataclass(slots=True, frozen=True)
+class DroitsTribu:
+    """Statut d'un utilisateur vis-à-vis d'une tribu"""
+    existe: bool
+    referent: bool
+    manager: bool
+    admin: bool
+    modo: bool
+    
+    @property
+    def peut_gerer(self) -> bool:
+        return self.admin or self.referent or self.manager
+    
+    @property
+    def peut_gerer_ou_modo(self) -> bool:
+        return self.peut_gerer or self.modo
 
-def get_boss_choices(guild_id: int):
+async def _statut_membre(guild_id: int, tribu_id: int, user_id: int):
+    """(existe, referent, manager) — sans requête si la mémoire est encore valable"""
+    cle = (guild_id, tribu_id, user_id)
+    entree = _droits.get(cle)
+    if entree is not None and entree[0] == _revisions.get(tribu_id) and entree[3] > time.monotonic():
+        return True, entree[1], entree[2]
+    row = await db_fetchone("""
+        SELECT t.revision, t.proprietaire_id = ?2 AS referent,
+               COALESCE((SELECT m.manager FROM membres m WHERE m.tribu_id = t.id AND m.user_id = ?2), 0) AS manager
+        FROM tribus t WHERE t.id = ?1
+    """, (tribu_id, user_id))
+    if row is None:
+        _droits.invalider(cle)
+        return False, False, False
+    noter_revision(tribu_id, row["revision"])
+    _droits.put(cle, (row["revision"], bool(row["referent"]), bool(row["manager"]), time.monotonic() + DROITS_TTL))
+    return True, bool(row["referent"]), bool(row["manager"])
+
+async def droits_tribu(inter: discord.Interaction, tribu_id: int) -> DroitsTribu:
+    """Référent, manager, admin et modo pour l'auteur de l'interaction"""
+    existe, referent, manager = await _statut_membre(inter.guild_id or 0, tribu_id, inter.user.id)
+    return DroitsTribu(existe=existe, referent=referent, manager=manager,
+                       admin=est_admin(inter), modo=est_modo(inter))
+
+async def get_boss_choices(guild_id: int):
     """Récupère les choix de boss pour un serveur"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT DISTINCT nom FROM boss WHERE guild_id IN (0, ?) ORDER BY nom", (guild_id,))
-        boss = [row["nom"] for row in c.fetchall()]
-        return [app_commands.Choice(name=b, value=b) for b in boss[:25]]
+    return (await catalogue_serveur(guild_id, "boss")).choices
 
-def get_notes_choices(guild_id: int):
+async def get_notes_choices(guild_id: int):
     """Récupère les choix de notes pour un serveur"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT DISTINCT nom FROM notes WHERE guild_id IN (0, ?) ORDER BY nom", (guild_id,))
-        notes = [row["nom"] for row in c.fetchall()]
-        return [app_commands.Choice(name=n, value=n) for n in notes[:25]]
+    return (await catalogue_serveur(guild_id, "notes")).choices
 
-def ajouter_historique(tribu_id: int, user_id: int, action: str, details: str = ""):
+# Nombre d'entrées d'historique par tribu : compté une seule fois, puis tenu à jour
+_historique_totaux = {}
+
+async def ajouter_historique(tribu_id: int, user_id: int, action: str, details: str = ""):
     """Ajoute une entrée dans l'historique de la tribu"""
-    with db_connect() as conn:
-        c = conn.cursor()
+    await db_execute("""
+        INSERT INTO historique (tribu_id, user_id, action, details, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (tribu_id, user_id, action, details, dt.datetime.utcnow().isoformat()))
+    if tribu_id in _historique_totaux:
+        _historique_totaux[tribu_id] += 1
+
+async def compter_historique(tribu_id: int) -> int:
+    """Nombre d'entrées d'historique d'une tribu (mis en cache)"""
+    total = _historique_totaux.get(tribu_id)
+    if total is None:
+        row = await db_fetchone("SELECT COUNT(*) AS total FROM historique WHERE tribu_id=?", (tribu_id,))
+        total = _historique_totaux[tribu_id] = row["total"]
+    return total
+
+async def lire_page_historique(tribu_id: int, curseur: Optional[tuple], taille: int):
+    """Page d'historique la plus récente avant curseur=(created_at, id) (ou la première si None)"""
+    if curseur is None:
+        return await db_fetchall("""
+            SELECT id, user_id, action, details, created_at FROM historique
+            WHERE tribu_id=?
+            ORDER BY created_at DESC, id DESC LIMIT ?
+        """, (tribu_id, taille))
+    return await db_fetchall("""
+        SELECT id, user_id, action, details, created_at FROM historique
+        WHERE tribu_id=? AND (created_at, id) < (?, ?)
+        ORDER BY created_at DESC, id DESC LIMIT ?
+    """, (tribu_id, *curseur, taille))
+
+# ---------- Rétention et archive de l'historique ----------
+# Au-delà de la rétention du serveur (config "retention_historique_jours", 0 = illimitée),
+# les entrées quittent la table historique pour historique_archive, par petits lots.
+# Désactivé par défaut : chaque serveur l'active dans /parametres (ou HISTORIQUE_RETENTION_JOURS pour tous).
+HISTORIQUE_RETENTION_JOURS = int(os.getenv("HISTORIQUE_RETENTION_JOURS", "0"))
+ARCHIVAGE_LOT = int(os.getenv("ARCHIVAGE_LOT", "500"))
+ARCHIVAGE_PAUSE = 0.2  # secondes entre deux lots pour laisser passer les autres écritures
+
+def _archiver_lot(conn, guild_id: int, limite_date: str, taille: int):
+    """Déplace au plus `taille` entrées plus anciennes que limite_date — à exécuter via db_write"""
+    c = conn.cursor()
+    c.execute("""
+        SELECT h.id, h.tribu_id, h.user_id, h.action, h.details, h.created_at
+        FROM tribus t
+        JOIN historique h ON h.tribu_id = t.id
+        WHERE t.guild_id = ? AND h.created_at < ?
+        ORDER BY h.created_at, h.id
+        LIMIT ?
+    """, (guild_id, limite_date, taille))
+    entrees = c.fetchall()
+    
+    par_tribu = {}
+    for h in entrees:
+        par_tribu.setdefault(h["tribu_id"], []).append(h)
+    for tribu_id, bloc in par_tribu.items():
+        donnees = zlib.compress(json.dumps(
+            [[h["id"], h["user_id"], h["action"], h["details"], h["created_at"]] for h in bloc]
+        ).encode("utf-8"))
         c.execute("""
-            INSERT INTO historique (tribu_id, user_id, action, details, created_at)
+            INSERT INTO historique_archive (tribu_id, debut, fin, nb, donnees)
             VALUES (?, ?, ?, ?, ?)
-        """, (tribu_id, user_id, action, details, dt.datetime.utcnow().isoformat()))
-        conn.commit()
+        """, (tribu_id, bloc[0]["created_at"], bloc[-1]["created_at"], len(bloc), donnees))
+    c.executemany("DELETE FROM historique WHERE id=?", [(h["id"],) for h in entrees])
+    return len(entrees), set(par_tribu)
+
+async def archiver_historique() -> int:
+    """Archive l'historique ancien de tous les serveurs, lot par lot — retourne le nombre d'entrées déplacées"""
+    total = 0
+    for guild_id in await serveurs_connus():
+        with sur_serveur(guild_id):
+            try:
+                jours = int(await get_config(guild_id, "retention_historique_jours", str(HISTORIQUE_RETENTION_JOURS)))
+            except ValueError:
+                jours = HISTORIQUE_RETENTION_JOURS
+            if jours <= 0:
+                continue
+            
+            limite_date = (dt.datetime.utcnow() - dt.timedelta(days=jours)).isoformat()
+            while True:
+                nb, tribus = await db_write(_archiver_lot, guild_id, limite_date, ARCHIVAGE_LOT)
+                for tribu_id in tribus:
+                    _historique_totaux.pop(tribu_id, None)
+                total += nb
+                if nb < ARCHIVAGE_LOT:
+                    break
+                await asyncio.sleep(ARCHIVAGE_PAUSE)
+    return total
+
+def _lire_archive(conn, tribu_id: int, avant: Optional[str], nombre: int):
+    # Blocs les plus récents d'abord, décompressés jusqu'à avoir assez d'entrées
+    c = conn.cursor()
+    c.execute("SELECT COALESCE(SUM(nb), 0) AS total FROM historique_archive WHERE tribu_id=?", (tribu_id,))
+    total = c.fetchone()["total"]
+    entrees = []
+    for bloc in c.execute("""
+        SELECT donnees FROM historique_archive
+        WHERE tribu_id=? AND (? IS NULL OR debut < ?)
+        ORDER BY fin DESC, id DESC
+    """, (tribu_id, avant, avant)):
+        entrees.extend(e for e in json.loads(zlib.decompress(bloc["donnees"])) if avant is None or e[4] < avant)
+        if len(entrees) >= nombre:
+            break
+    entrees.sort(key=lambda e: (e[4], e[0]), reverse=True)
+    return total, entrees[:nombre]
+
+async def lire_archive_historique(tribu_id: int, avant: Optional[str] = None, nombre: int = 20):
+    """Entrées archivées d'une tribu, des plus récentes aux plus anciennes : (total archivé, [[id, user_id, action, details, created_at], ...])"""
+    return await db_read(_lire_archive, tribu_id, avant, nombre)
+
+@tasks.loop(hours=6)
+async def tache_archivage_historique():
+    try:
+        debut = time.perf_counter()
+        nb = await archiver_historique()
+        if nb:
+            print(f"🗄️ Historique : {nb} entrées archivées en {time.perf_counter() - debut:.1f} s")
+    except Exception as e:
+        print(f"⚠️ Erreur lors de l'archivage de l'historique : {e}")
+
+# ---------- Lignes orphelines ----------
+# Avant PRAGMA foreign_keys, supprimer une tribu laissait ses avant-postes, photos, bases premium
+# et son historique en place. Balayage unique au démarrage (marqueur global "orphelins_balayes"),
+# sur le catalogue et, en mode DB_SHARDS, sur chaque base de serveur ; relançable à la main : python main.py --nettoyer-orphelins [--vacuum]
+TABLES_ENFANTS = ("membres", "avant_postes", "historique", "photos_tribu", "bases_premium",
+                  "tribu_progression", "historique_archive")
+ORPHELINS_VACUUM = os.getenv("ORPHELINS_VACUUM", "0") == "1"
+
+def _pages_libres(conn) -> tuple:
+    """(pages de la freelist, taille d'une page en octets)"""
+    return (conn.execute("PRAGMA freelist_count").fetchone()[0], conn.execute("PRAGMA page_size").fetchone()[0])
+
+def _supprimer_orphelins_lot(conn, table: str, debut: int, fin: int) -> int:
+    """Supprime les orphelins d'une tranche de rowid — à exécuter via db_write"""
+    return conn.execute(f"""
+        DELETE FROM {table}
+        WHERE rowid > ? AND rowid <= ?
+          AND NOT EXISTS (SELECT 1 FROM tribus t WHERE t.id = {table}.tribu_id)
+    """, (debut, fin)).rowcount
+
+def _vacuum_incremental(pool: PoolSQLite) -> dict:
+    """Rend les pages libres au disque — au premier passage, conversion en auto_vacuum=INCREMENTAL"""
+    with pool.ecrivain() as conn:
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conversion = conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if conversion:
+            # Le passage en mode incrémental demande un VACUUM complet (une seule fois) : le fichier
+            # peut grossir (pages de pointeurs), d'où un compte séparé
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.executescript("PRAGMA incremental_vacuum")  # execute() n'avancerait que d'une page
+        return {"conversion": conversion, "pages_rendues": libres - conn.execute("PRAGMA freelist_count").fetchone()[0]}
+
+async def balayer_orphelins(vacuum: bool = False, taille: int = ARCHIVAGE_LOT) -> dict:
+    """Supprime, par tranches de `taille` rowid, les lignes dont la tribu n'existe plus (base courante)"""
+    libres_avant, page = await db_read(_pages_libres)
+    lignes = {}
+    for table in TABLES_ENFANTS:
+        fin = (await db_fetchone(f"SELECT COALESCE(MAX(rowid), 0) AS fin FROM {table}"))["fin"]
+        total = 0
+        for debut in range(0, fin, taille):
+            nb = await db_write(_supprimer_orphelins_lot, table, debut, debut + taille)
+            total += nb
+            if nb:
+                await asyncio.sleep(ARCHIVAGE_PAUSE)
+        lignes[table] = total
+    if lignes["historique"]:
+        _historique_totaux.clear()
+    # Espace mesuré en pages de la freelist, pas en taille de fichier (la conversion peut l'agrandir)
+    libres_apres, _ = await db_read(_pages_libres)
+    vide = {"conversion": False, "pages_rendues": 0}
+    if vacuum:
+        with base_empruntee() as (pool, _):
+            vide = await db_thread(_vacuum_incremental, pool)
+    return {"lignes": lignes,
+            "octets_liberes": max(0, libres_apres - libres_avant) * page,
+            "octets_rendus": max(0, vide["pages_rendues"]) * page,
+            "conversion": vide["conversion"]}
+
+async def balayer_orphelins_bases(vacuum: bool = False) -> dict:
+    """balayer_orphelins sur le catalogue puis, en mode DB_SHARDS, sur la base de chaque serveur"""
+    total = {"lignes": dict.fromkeys(TABLES_ENFANTS, 0), "octets_liberes": 0, "octets_rendus": 0,
+             "bases": 0, "conversions": 0}
+    for guild_id in [0] + (await serveurs_connus() if DB_SHARDS else []):
+        with sur_serveur(guild_id):
+            rapport = await balayer_orphelins(vacuum=vacuum)
+        for table, nb in rapport["lignes"].items():
+            total["lignes"][table] += nb
+        total["octets_liberes"] += rapport["octets_liberes"]
+        total["octets_rendus"] += rapport["octets_rendus"]
+        total["bases"] += 1
+        total["conversions"] += rapport["conversion"]
+    return total
+
+def _afficher_orphelins(rapport: dict, duree: float):
+    total = sum(rapport["lignes"].values())
+    detail = ", ".join(f"{table}={nb}" for table, nb in rapport["lignes"].items() if nb)
+    print(f"🧹 Orphelins ({rapport['bases']} base(s)) : {total} lignes supprimées en {duree:.1f} s"
+          f"{f' ({detail})' if detail else ''}, {rapport['octets_liberes'] / 1024:.0f} Ko libérés, "
+          f"{rapport['octets_rendus'] / 1024:.0f} Ko rendus au disque")
+    if rapport["conversions"]:
+        print(f"🧹 {rapport['conversions']} base(s) converties en auto_vacuum=INCREMENTAL (VACUUM complet, "
+              f"le fichier peut grossir légèrement)")
+
+# ---------- Maintenance des bases (WAL, optimize, vacuum, intégrité) ----------
+# Checkpoint PASSIVE à chaque passage (n'attend personne), TRUNCATE dès que le fichier -wal dépasse
+# WAL_SEUIL_MO ; PRAGMA optimize + incremental_vacuum toutes les OPTIMIZE_HEURES ; quick_check
+# toutes les INTEGRITE_HEURES. Durées et résultats dans resume_maintenance() (/stats_db, /maintenance).
+MAINTENANCE_MINUTES = float(os.getenv("MAINTENANCE_MINUTES", "5"))
+WAL_SEUIL_MO = float(os.getenv("WAL_SEUIL_MO", "16"))
+OPTIMIZE_HEURES = float(os.getenv("OPTIMIZE_HEURES", "6"))
+INTEGRITE_HEURES = float(os.getenv("INTEGRITE_HEURES", "24"))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "2000"))  # pages rendues au disque au plus par passage
+
+_maintenance = {}  # (base, opération) -> statistiques
+_maintenance_verrou = Lock()  # lu aussi depuis le thread Flask
+_maintenance_derniere = {}  # (base, opération) -> time.monotonic() du dernier passage
+
+def _noter_maintenance(base: str, operation: str, duree: float, resultat):
+    with _maintenance_verrou:
+        s = _maintenance.setdefault((base, operation), {"passages": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["passages"] += 1
+        s["total_ms"] += duree * 1000
+        s["max_ms"] = max(s["max_ms"], duree * 1000)
+        s["dernier_ms"] = duree * 1000
+        s["resultat"] = resultat
+        s["le"] = dt.datetime.utcnow().isoformat(timespec="seconds")
+
+def resume_maintenance() -> dict:
+    """Copie des statistiques de maintenance : {base: {opération: {...}}}"""
+    with _maintenance_verrou:
+        resume = {}
+        for (base, operation), s in _maintenance.items():
+            resume.setdefault(base, {})[operation] = dict(s, moy_ms=s["total_ms"] / s["passages"])
+        return resume
+
+def resume_maintenance_serveurs() -> dict:
+    """Synthèse des bases par serveur (mode DB_SHARDS) : une ligne par opération, pire WAL, dernier échec"""
+    operations, echec = {}, None
+    for base, ops in resume_maintenance().items():
+        if not base.startswith("serveur "):
+            continue
+        for op, s in ops.items():
+            o = operations.setdefault(op, {"bases": 0, "passages": 0, "max_ms": 0.0})
+            o["bases"] += 1
+            o["passages"] += s["passages"]
+            o["max_ms"] = max(o["max_ms"], s["max_ms"])
+            en_erreur = (op == "integrite" and s["resultat"] != "ok") or str(s["resultat"]).startswith("erreur")
+            if en_erreur and (echec is None or s["le"] > echec["le"]):
+                echec = {"base": base, "operation": op, "le": s["le"], "resultat": s["resultat"]}
+    wal = max(((_taille_wal(chemin_base_serveur(guild_id)), guild_id) for guild_id, _ in routage.ouvertes()),
+              default=(0, None))
+    return {"operations": operations, "wal_max_octets": wal[0], "wal_max_serveur": wal[1], "dernier_echec": echec}
+
+def _taille_wal(chemin: str) -> int:
+    try:
+        return os.path.getsize(f"{chemin}-wal")
+    except OSError:
+        return 0
+
+def _checkpoint(pool: PoolSQLite, mode: str):
+    # Sur la connexion d'écriture : pas de commit concurrent pendant le checkpoint
+    with pool.ecrivain() as conn:
+        bloque, pages_wal, pages_copiees = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    return {"bloque": bool(bloque), "pages_wal": pages_wal, "pages_copiees": pages_copiees}
+
+def _optimiser(pool: PoolSQLite):
+    with pool.ecrivain() as conn:
+        conn.execute("PRAGMA optimize")
+        # incremental_vacuum n'a d'effet que si la base est en auto_vacuum=INCREMENTAL (cf. --vacuum)
+        libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if libres and conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")  # execute() n'avancerait que d'une page
+        return {"pages_libres": libres, "pages_libres_apres": conn.execute("PRAGMA freelist_count").fetchone()[0]}
+
+def _verifier_integrite(pool: PoolSQLite):
+    with pool.lecteur() as conn:
+        erreurs = [row[0] for row in conn.execute("PRAGMA quick_check(20)")]
+    return "ok" if erreurs == ["ok"] else erreurs
+
+def _du(base: str, operation: str, heures: float) -> bool:
+    """Vrai si l'opération n'a pas tourné depuis `heures` (et note ce passage)"""
+    maintenant = time.monotonic()
+    derniere = _maintenance_derniere.get((base, operation))
+    if derniere is not None and maintenant - derniere < heures * 3600:
+        return False
+    _maintenance_derniere[(base, operation)] = maintenant
+    return True
+
+async def _operation_maintenance(base: str, operation: str, fonction, *args):
+    debut = time.perf_counter()
+    try:
+        resultat = await db_thread(fonction, *args)
+    except Exception as e:
+        resultat = f"erreur : {e}"
+        print(f"⚠️ Maintenance {base} ({operation}) : {e}")
+    _noter_maintenance(base, operation, time.perf_counter() - debut, resultat)
+    return resultat
+
+async def _maintenance_base(base: str, chemin: str, pool: PoolSQLite):
+    """Checkpoint, optimize et contrôle d'intégrité d'une base (chacun à son rythme)"""
+    wal = _taille_wal(chemin)
+    mode = "TRUNCATE" if wal > WAL_SEUIL_MO * 1024 * 1024 else "PASSIVE"
+    resultat = await _operation_maintenance(base, f"checkpoint_{mode.lower()}", _checkpoint, pool, mode)
+    if mode == "TRUNCATE":
+        print(f"🧽 WAL {base} : {wal / 1024 / 1024:.1f} Mo > {WAL_SEUIL_MO:g} Mo, checkpoint TRUNCATE ({resultat})")
+    
+    if _du(base, "optimize", OPTIMIZE_HEURES):
+        await _operation_maintenance(base, "optimize", _optimiser, pool)
+    if _du(base, "integrite", INTEGRITE_HEURES):
+        integrite = await _operation_maintenance(base, "integrite", _verifier_integrite, pool)
+        if integrite != "ok":
+            print(f"⚠️ Intégrité de la base {base} : {integrite}")
+
+async def maintenance_bases():
+    """Un passage de maintenance sur les deux bases (et les bases de serveurs ouvertes)"""
+    await _maintenance_base("tribus", DB_PATH, db_pool)
+    await _maintenance_base("identite", IDENTITE_DB_PATH, identite_db_pool)
+    for guild_id, _ in routage.ouvertes():
+        # Empruntée : pas fermée par une éviction pendant le passage (ignorée si déjà évincée)
+        base = routage.emprunter_ouverte(guild_id)
+        if base is None:
+            continue
+        try:
+            await _maintenance_base(f"serveur {guild_id}", chemin_base_serveur(guild_id), base[0])
+        finally:
+            routage.rendre(guild_id)
+
+@tasks.loop(minutes=MAINTENANCE_MINUTES)
+async def tache_maintenance():
+    try:
+        await maintenance_bases()
+    except Exception as e:
+        print(f"⚠️ Erreur lors de la maintenance des bases : {e}")
+
+async def balayage_orphelins_initial():
+    """Balayage unique des orphelins, en arrière-plan au premier démarrage"""
+    try:
+        if await get_config(0, "orphelins_balayes"):
+            return
+        debut = time.perf_counter()
+        rapport = await balayer_orphelins_bases(vacuum=ORPHELINS_VACUUM)
+        await set_config(0, "orphelins_balayes", dt.datetime.utcnow().isoformat())
+        _afficher_orphelins(rapport, time.perf_counter() - debut)
+    except Exception as e:
+        print(f"⚠️ Erreur lors du balayage des orphelins : {e}")
+
+# ---------- Export / import des tribus d'un serveur ----------
+# Un enregistrement par ligne : {"type": "tribu", ...} suivi des lignes liées (tribu_id = id d'origine).
+# Export en lecture continue (curseurs, lots de EXPORT_LOT tribus), import par transactions de IMPORT_LOT
+# enregistrements. Hors ligne : python main.py --exporter|--importer <guild_id> <fichier.jsonl|.csv>
+EXPORT_LOT = int(os.getenv("EXPORT_LOT", "500"))
+IMPORT_LOT = int(os.getenv("IMPORT_LOT", "2000"))
+EXPORT_TYPES = {
+    # type : (table, colonnes exportées)
+    "tribu": ("tribus", ("id", "nom", "description", "couleur", "logo_url", "base", "map_base", "coords_base", "tags",
+                         "proprietaire_id", "created_at", "devise", "ouvert_recrutement", "photo_base", "objectif")),
+    "membre": ("membres", ("tribu_id", "user_id", "role", "manager", "nom_in_game")),
+    "avant_poste": ("avant_postes", ("tribu_id", "user_id", "nom", "map", "coords", "created_at")),
+    "base_premium": ("bases_premium", ("tribu_id", "user_id", "nom", "map", "coords", "created_at")),
+    "photo": ("photos_tribu", ("tribu_id", "url", "ordre", "created_at")),
+    "progression": ("tribu_progression", ("tribu_id", "item_id", "kind", "state", "updated_at")),
+}
+# En CSV, une seule feuille : une colonne par champ connu, vides pour les autres types
+EXPORT_COLONNES_CSV = list(dict.fromkeys(col for _, colonnes in EXPORT_TYPES.values() for col in colonnes))
+
+def format_export(chemin: str) -> str:
+    return "csv" if chemin.lower().endswith(".csv") else "jsonl"
+
+def _enregistrements_serveur(conn, guild_id: int, lot: int):
+    """Générateur (type, ligne) : chaque lot de tribus suivi de ses lignes liées"""
+    _, colonnes_tribu = EXPORT_TYPES["tribu"]
+    dernier = 0
+    while True:
+        tribus = conn.execute(f"""
+            SELECT {", ".join(colonnes_tribu)} FROM tribus
+            WHERE guild_id = ? AND id > ? ORDER BY id LIMIT ?
+        """, (guild_id, dernier, lot)).fetchall()
+        if not tribus:
+            return
+        for tribu in tribus:
+            yield "tribu", dict(tribu)
+        ids = [tribu["id"] for tribu in tribus]
+        for type_, (table, colonnes) in EXPORT_TYPES.items():
+            if type_ == "tribu":
+                continue
+            for row in conn.execute(f"""
+                SELECT {", ".join(colonnes)} FROM {table}
+                WHERE tribu_id IN ({", ".join("?" * len(ids))}) ORDER BY tribu_id
+            """, ids):
+                yield type_, dict(row)
+        dernier = ids[-1]
+
+def _exporter_serveur(conn, guild_id: int, chemin: str, format: str) -> dict:
+    """Écrit l'export d'un serveur dans `chemin` — à exécuter via db_read ; retourne le nombre de lignes par type"""
+    comptes = dict.fromkeys(EXPORT_TYPES, 0)
+    conn.execute("BEGIN")  # un seul instantané pour tout l'export
+    try:
+        with open(chemin, "w", encoding="utf-8", newline="") as f:
+            if format == "csv":
+                ecrivain = csv.writer(f)
+                ecrivain.writerow(["type", *EXPORT_COLONNES_CSV])
+            for type_, ligne in _enregistrements_serveur(conn, guild_id, EXPORT_LOT):
+                if format == "csv":
+                    ecrivain.writerow([type_, *(ligne.get(col, "") for col in EXPORT_COLONNES_CSV)])
+                else:
+                    f.write(json.dumps({"type": type_, **ligne}, ensure_ascii=False) + "\n")
+                comptes[type_] += 1
+    finally:
+        conn.rollback()
+    return comptes
+
+async def exporter_serveur(guild_id: int, chemin: str) -> dict:
+    return await db_read(_exporter_serveur, guild_id, chemin, format_export(chemin))
+
+def _lire_export(fichier, format: str, lus: list):
+    """Générateur (type, ligne) depuis un fichier binaire ; lus[0] = octets lus (progression)"""
+    def lignes():
+        for brute in fichier:
+            lus[0] += len(brute)
+            yield brute.decode("utf-8-sig")
+    
+    if format == "csv":
+        for row in csv.DictReader(lignes()):
+            type_ = row.pop("type", "")
+            colonnes = EXPORT_TYPES.get(type_, (None, ()))[1]
+            yield type_, {col: row[col] for col in colonnes if row.get(col) not in (None, "")}
+    else:
+        for texte in lignes():
+            if texte.strip():
+                donnees = json.loads(texte)
+                yield donnees.pop("type", ""), donnees
 
-def get_bases_premium(tribu_id: int):
+def _importer_lot(conn, guild_id: int, enregistrements: list, correspondance: dict):
+    """Insère un lot d'enregistrements — à exécuter via db_write ; retourne (comptes, nouvelles correspondances)"""
+    c = conn.cursor()
+    comptes = {"ignores": 0}
+    nouvelles = {}
+    for type_, ligne in enregistrements:
+        if type_ not in EXPORT_TYPES:
+            comptes["ignores"] += 1
+            continue
+        table, colonnes = EXPORT_TYPES[type_]
+        valeurs = {col: ligne[col] for col in colonnes if col in ligne and col != "id"}
+        if type_ == "tribu":
+            valeurs["guild_id"] = guild_id
+            # Nom déjà pris sur ce serveur : la tribu et ses lignes liées sont ignorées
+            row = c.execute(f"""
+                INSERT INTO tribus ({", ".join(valeurs)}) VALUES ({", ".join("?" * len(valeurs))})
+                ON CONFLICT DO NOTHING RETURNING id
+            """, list(valeurs.values())).fetchone()
+            if row is None:
+                comptes["ignores"] += 1
+                continue
+            nouvelles[int(ligne["id"])] = row[0]
+        else:
+            ancien = int(ligne.get("tribu_id", 0))
+            valeurs["tribu_id"] = nouvelles.get(ancien) or correspondance.get(ancien)
+            if valeurs["tribu_id"] is None:
+                comptes["ignores"] += 1
+                continue
+            if c.execute(f"""
+                INSERT OR IGNORE INTO {table} ({", ".join(valeurs)}) VALUES ({", ".join("?" * len(valeurs))})
+            """, list(valeurs.values())).rowcount == 0:
+                comptes["ignores"] += 1
+                continue
+        comptes[type_] = comptes.get(type_, 0) + 1
+    return comptes, nouvelles
+
+async def importer_serveur(guild_id: int, chemin: str, progression=None) -> dict:
+    """Importe un export dans un serveur, par transactions de IMPORT_LOT enregistrements
+
+    progression : coroutine optionnelle appelée après chaque lot avec (comptes, fraction lue).
+    """
+    comptes = {"ignores": 0, "erreurs": 0}
+    correspondance = {}
+    total = os.path.getsize(chemin) or 1
+    lus = [0]
+    
+    async def envoyer(lot):
+        try:
+            resultat, nouvelles = await db_write(_importer_lot, guild_id, lot, correspondance)
+        except Exception as e:
+            # Le lot fautif est annulé en entier, l'import continue avec le suivant
+            print(f"⚠️ Import : lot de {len(lot)} enregistrements rejeté ({e})")
+            comptes["erreurs"] += len(lot)
+            return
+        correspondance.update(nouvelles)
+        for cle, nb in resultat.items():
+            comptes[cle] = comptes.get(cle, 0) + nb
+        if progression:
+            await progression(comptes, lus[0] / total)
+    
+    with open(chemin, "rb") as f:
+        lot = []
+        for enregistrement in _lire_export(f, format_export(chemin), lus):
+            lot.append(enregistrement)
+            if len(lot) >= IMPORT_LOT:
+                await envoyer(lot)
+                lot = []
+        if lot:
+            await envoyer(lot)
+    return comptes
+
+def resume_import_export(comptes: dict) -> str:
+    noms = {"tribu": "tribus", "membre": "membres", "avant_poste": "avant-postes", "base_premium": "bases premium",
+            "photo": "photos", "progression": "boss/notes", "ignores": "ignorés", "erreurs": "en erreur"}
+    return ", ".join(f"{nb} {noms.get(cle, cle)}" for cle, nb in comptes.items() if nb)
+
+async def definir_progression(tribu_id: int, kind: str, item_id: str, state: str) -> bool:
+    """Upsert d'une seule ligne de progression — retourne False si l'état était déjà celui-ci"""
+    return bool(await db_execute("""
+        INSERT INTO tribu_progression (tribu_id, item_id, kind, state, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(tribu_id, kind, item_id) DO UPDATE
+        SET state=excluded.state, updated_at=excluded.updated_at
+        WHERE state != excluded.state
+    """, (tribu_id, item_id, kind, state, dt.datetime.utcnow().isoformat())))
+
+async def get_bases_premium(tribu_id: int):
     """Récupère les bases premium d'une tribu"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        return c.fetchall()
+    return await db_fetchall("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
+
+def ajouter_photo_galerie(conn, tribu_id: int, url: str):
+    """Ajoute une photo à la galerie (max 10) — à exécuter via db_write
+    
+    Retourne (nombre de photos avant l'ajout, ordre de la nouvelle photo),
+    l'ordre valant None si la galerie est déjà pleine.
+    """
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) as count, COALESCE(MAX(ordre), -1) as max_ordre FROM photos_tribu WHERE tribu_id=?", (tribu_id,))
+    stats = c.fetchone()
+    if stats["count"] >= 10:
+        return stats["count"], None
+    
+    nouvel_ordre = stats["max_ordre"] + 1
+    c.execute("""
+    INSERT INTO photos_tribu (tribu_id, url, ordre, created_at)
+    VALUES (?, ?, ?, ?)
+    """, (tribu_id, url, nouvel_ordre, dt.datetime.utcnow().isoformat()))
+    return stats["count"], nouvel_ordre
 
 # ---------- Bot ----------
 intents = discord.Intents.default()
 intents.guilds = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = commands.Bot(command_prefix="!", intents=intents, tree_cls=ArbreCommandes)
 tree = bot.tree
 
+# ---------- File d'envoi Discord ----------
+# Les appels sortants (envois, éditions, suppressions, lectures d'historique) passent par une file
+# à trois voies : interaction > fiche > maintenance. Un créneau n'est accordé que si la concurrence
+# globale, celle de la route et le seau du salon (N départs par fenêtre glissante) le permettent ;
+# une requête bloquée par son salon laisse passer les suivantes. Les réponses d'interaction
+# (inter.response / followup) utilisent le jeton de l'interaction et ne passent pas par ici.
+PRIORITE_INTERACTION, PRIORITE_FICHE, PRIORITE_MAINTENANCE = 0, 1, 2
+SORTIE_CONCURRENCE = int(os.getenv("SORTIE_CONCURRENCE", "8"))
+SORTIE_PAR_SALON = int(os.getenv("SORTIE_PAR_SALON", "5"))
+SORTIE_FENETRE_S = float(os.getenv("SORTIE_FENETRE_S", "5"))
+SORTIE_ROUTES = {"messages.delete": 2, "messages.history": 1}  # concurrence max par route
+
+@dataclass(slots=True)
+class _DemandeSortie:
+    priorite: int
+    channel_id: int
+    route: str
+    future: asyncio.Future
+    debut: float
+
+class FileSortante:
+    """Ordonnanceur des requêtes Discord sortantes (voies de priorité, seaux par salon et par route)"""
+    VOIES = ("interaction", "fiche", "maintenance")
+    
+    def __init__(self, concurrence: int, par_salon: int, fenetre_s: float, routes: dict):
+        self.concurrence = max(1, concurrence)
+        self.par_salon = max(1, par_salon)
+        self.fenetre = fenetre_s
+        self.routes = routes
+        self._files = tuple(deque() for _ in self.VOIES)
+        self._en_cours = 0
+        self._routes_actives = Counter()
+        self._salons = {}  # channel_id -> deque des départs dans la fenêtre
+        self._reveil = None
+        self.stats = {voie: {"requetes": 0, "attente": 0.0, "attente_max": 0.0} for voie in self.VOIES}
+    
+    def _distribuer(self):
+        maintenant = time.monotonic()
+        prochain = None
+        for voie, file in zip(self.VOIES, self._files):
+            for demande in list(file):
+                if self._en_cours >= self.concurrence:
+                    return
+                if demande.future.done():  # appelant annulé
+                    file.remove(demande)
+                    continue
+                limite = self.routes.get(demande.route)
+                if limite is not None and self._routes_actives[demande.route] >= limite:
+                    continue
+                if demande.channel_id:
+                    departs = self._salons.setdefault(demande.channel_id, deque())
+                    while departs and departs[0] <= maintenant - self.fenetre:
+                        departs.popleft()
+                    if len(departs) >= self.par_salon:
+                        liberation = departs[0] + self.fenetre
+                        prochain = liberation if prochain is None else min(prochain, liberation)
+                        continue
+                    departs.append(maintenant)
+                file.remove(demande)
+                self._en_cours += 1
+                self._routes_actives[demande.route] += 1
+                attente = maintenant - demande.debut
+                s = self.stats[voie]
+                s["requetes"] += 1
+                s["attente"] += attente
+                s["attente_max"] = max(s["attente_max"], attente)
+                demande.future.set_result(None)
+        if prochain is not None and self._reveil is None:
+            # Un salon saturé se libère à cet instant : redistribuer à ce moment-là
+            self._reveil = asyncio.get_running_loop().call_later(prochain - maintenant, self._reveiller)
+    
+    def _reveiller(self):
+        self._reveil = None
+        self._distribuer()
+    
+    def _liberer(self, demande: _DemandeSortie):
+        self._en_cours -= 1
+        self._routes_actives[demande.route] -= 1
+        self._distribuer()
+    
+    @asynccontextmanager
+    async def creneau(self, priorite: int, channel_id: int = 0, route: str = ""):
+        """Attend son tour puis garde le créneau pendant le bloc"""
+        demande = _DemandeSortie(priorite, channel_id or 0, route, asyncio.get_running_loop().create_future(),
+                                 time.monotonic())
+        self._files[priorite].append(demande)
+        self._distribuer()
+        try:
+            await demande.future
+        except asyncio.CancelledError:
+            if demande.future.done() and not demande.future.cancelled():
+                self._liberer(demande)  # créneau accordé juste avant l'annulation
+            raise
+        try:
+            yield
+        finally:
+            self._liberer(demande)
+    
+    async def executer(self, priorite: int, channel_id: int, route: str, appel):
+        """Exécute appel() (une coroutine Discord) dans un créneau et retourne son résultat"""
+        async with self.creneau(priorite, channel_id, route):
+            return await appel()
+    
+    def resume(self) -> dict:
+        """Profondeur et attentes par voie (temps en millisecondes)"""
+        voies = {}
+        for voie, file in zip(self.VOIES, self._files):
+            s = self.stats[voie]
+            voies[voie] = {"profondeur": len(file), "requetes": s["requetes"],
+                           "attente_moy_ms": s["attente"] * 1000 / s["requetes"] if s["requetes"] else 0.0,
+                           "attente_max_ms": s["attente_max"] * 1000}
+        return {"en_cours": self._en_cours, "concurrence": self.concurrence, "voies": voies}
+
+sortie = FileSortante(SORTIE_CONCURRENCE, SORTIE_PAR_SALON, SORTIE_FENETRE_S, SORTIE_ROUTES)
+
+# ---------- Avatars ----------
+# Cache membres de la gateway (intent members), puis cache local à durée de vie, puis REST en dernier
+# recours : les demandes simultanées pour un même utilisateur partagent une seule requête.
+AVATARS_TTL = int(os.getenv("AVATARS_TTL", "3600"))
+AVATARS_CACHE = int(os.getenv("AVATARS_CACHE", "2048"))
+_avatars = CacheLRU(AVATARS_CACHE)  # user_id -> (url ou None, expiration monotonic)
+_avatars_en_cours = {}  # user_id -> Future de la requête REST en vol
+_avatars_stats = {"gateway": 0, "cache": 0, "rest": 0, "regroupes": 0, "erreurs": 0}
+
+async def _fetch_avatar(client: discord.Client, user_id: int) -> Optional[str]:
+    try:
+        utilisateur = await client.fetch_user(user_id)
+    except discord.NotFound:
+        url = None  # compte supprimé : mémorisé comme les autres
+    except Exception as e:
+        _avatars_stats["erreurs"] += 1
+        print(f"⚠️ Avatar de {user_id} indisponible : {e}")
+        return None
+    else:
+        url = utilisateur.display_avatar.url
+    _avatars.put(user_id, (url, time.monotonic() + AVATARS_TTL))
+    return url
+
+async def avatar_utilisateur(client: discord.Client, user_id: int) -> Optional[str]:
+    """URL de l'avatar d'un utilisateur, sans appel REST dans le cas courant"""
+    utilisateur = client.get_user(user_id)
+    if utilisateur is not None:
+        _avatars_stats["gateway"] += 1
+        return utilisateur.display_avatar.url
+    
+    entree = _avatars.get(user_id)
+    if entree is not None and entree[1] > time.monotonic():
+        _avatars_stats["cache"] += 1
+        return entree[0]
+    
+    en_cours = _avatars_en_cours.get(user_id)
+    if en_cours is not None:
+        _avatars_stats["regroupes"] += 1
+        return await asyncio.shield(en_cours)
+    _avatars_stats["rest"] += 1
+    tache = _avatars_en_cours[user_id] = asyncio.ensure_future(_fetch_avatar(client, user_id))
+    tache.add_done_callback(lambda _: _avatars_en_cours.pop(user_id, None))
+    # shield : une interaction annulée n'interrompt pas la requête partagée
+    return await asyncio.shield(tache)
+
+def resume_avatars() -> dict:
+    return {**_avatars_stats, "entrees": len(_avatars._donnees), "en_cours": len(_avatars_en_cours)}
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    _avatars.invalider(after.id)
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    _avatars.invalider(after.id)
+
 # ---------- Helpers UI ----------
-def embed_tribu(tribu, membres=None, avant_postes=None, createur_avatar_url=None, photos=None, photo_index=0, bases_premium=None) -> discord.Embed:
+def embed_tribu(tribu, membres=None, avant_postes=None, createur_avatar_url=None, photos=None, photo_index=0, bases_premium=None, progression=None) -> discord.Embed:
     color = tribu["couleur"] if tribu["couleur"] else 0x2F3136
     
     # Titre et description
@@ -548,24 +2676,17 @@ def embed_tribu(tribu, membres=None, avant_postes=None, createur_avatar_url=None
         e.add_field(name="**📢 RECRUTEMENT OUVERT**", value=str(recrutement_value)[:1024], inline=False)
     
     # Progression Boss
-    boss_valides = []
-    boss_non_valides = []
-    if "progression_boss" in tribu.keys() and tribu["progression_boss"]:
-        boss_valides = [f"<a:ok:1328152449785008189> {b.strip()}" for b in tribu["progression_boss"].split(",") if b.strip()]
-    if "progression_boss_non_valides" in tribu.keys() and tribu["progression_boss_non_valides"]:
-        boss_non_valides = [f"<a:no:1328152539660554363> {b.strip()}" for b in tribu["progression_boss_non_valides"].split(",") if b.strip()]
+    progression = progression or []
+    boss_valides = [f"<a:ok:1328152449785008189> {p['item_id']}" for p in progression if p["kind"] == "boss" and p["state"] == "valide"]
+    boss_non_valides = [f"<a:no:1328152539660554363> {p['item_id']}" for p in progression if p["kind"] == "boss" and p["state"] == "non_valide"]
     
     if boss_valides or boss_non_valides:
         boss_display = ", ".join(boss_valides + boss_non_valides)
         e.add_field(name="**🐉 PROGRESSION BOSS**", value=boss_display[:1024], inline=False)
     
     # Progression Notes
-    notes_valides = []
-    notes_non_valides = []
-    if "progression_notes" in tribu.keys() and tribu["progression_notes"]:
-        notes_valides = [f"<a:ok:1328152449785008189> {n.strip()}" for n in tribu["progression_notes"].split(",") if n.strip()]
-    if "progression_notes_non_valides" in tribu.keys() and tribu["progression_notes_non_valides"]:
-        notes_non_valides = [f"<a:no:1328152539660554363> {n.strip()}" for n in tribu["progression_notes_non_valides"].split(",") if n.strip()]
+    notes_valides = [f"<a:ok:1328152449785008189> {p['item_id']}" for p in progression if p["kind"] == "note" and p["state"] == "valide"]
+    notes_non_valides = [f"<a:no:1328152539660554363> {p['item_id']}" for p in progression if p["kind"] == "note" and p["state"] == "non_valide"]
     
     if notes_valides or notes_non_valides:
         notes_display = ", ".join(notes_valides + notes_non_valides)
@@ -574,38 +2695,120 @@ def embed_tribu(tribu, membres=None, avant_postes=None, createur_avatar_url=None
     e.set_footer(text="💡 Utilise les boutons ci-dessous pour gérer la tribu")
     return e
 
+# ---------- Chargement d'une fiche tribu ----------
+@dataclass(slots=True)
+class FicheTribu:
+    """Agrégat complet d'une tribu, chargé en un seul aller-retour"""
+    tribu: dict
+    membres: list
+    avant_postes: list
+    photos: list
+    bases_premium: list
+    progression: list
+    
+    def embed(self, createur_avatar_url=None, photo_index: int = 0) -> discord.Embed:
+        return carte_tribu(self, photo_index).embed(createur_avatar_url)
+
+def _lire_fiche_tribu(conn, tribu_id: int):
+    # Une seule transaction de lecture : les 6 requêtes voient le même instantané
+    c = conn.cursor()
+    c.execute("BEGIN")
+    try:
+        tribu = c.execute("SELECT * FROM tribus WHERE id=?", (tribu_id,)).fetchone()
+        if not tribu:
+            return None
+        return FicheTribu(
+            tribu=dict(tribu),
+            membres=c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,)).fetchall(),
+            avant_postes=c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,)).fetchall(),
+            photos=c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,)).fetchall(),
+            bases_premium=c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,)).fetchall(),
+            progression=c.execute("""
+                SELECT kind, item_id, state FROM tribu_progression
+                WHERE tribu_id=? ORDER BY updated_at, rowid
+            """, (tribu_id,)).fetchall(),
+        )
+    finally:
+        conn.rollback()
+
+async def charger_fiche_tribu(tribu_id: int) -> Optional[FicheTribu]:
+    """Charge tribu, membres, avant-postes, photos, bases premium et progression (None si introuvable)"""
+    fiche = await db_read(_lire_fiche_tribu, tribu_id)
+    if fiche is not None:
+        noter_revision(tribu_id, fiche.tribu["revision"])
+        _fiches.put((tribu_id, fiche.tribu["revision"]), fiche)
+    return fiche
+
+# ---------- Cache des fiches rendues ----------
+# Clé (tribu_id, revision[, photo_index]) : toute modification visible incrémente la révision
+# (triggers), les anciennes entrées ne sont plus jamais lues et sortent du LRU d'elles-mêmes.
+FICHES_CACHE = int(os.getenv("FICHES_CACHE", "256"))
+CARTES_CACHE = int(os.getenv("CARTES_CACHE", "1024"))
+_fiches = CacheLRU(FICHES_CACHE)
+_cartes = CacheLRU(CARTES_CACHE)
+
+@dataclass(slots=True)
+class CarteTribu:
+    """Embed d'une fiche déjà construit (dict), sans l'avatar du créateur ni l'horodatage, ajoutés à l'affichage"""
+    payload: dict
+    a_logo: bool
+    
+    def embed(self, createur_avatar_url=None) -> discord.Embed:
+        e = discord.Embed.from_dict(self.payload)
+        e.timestamp = discord.utils.utcnow()
+        if not self.a_logo and createur_avatar_url:
+            e.set_thumbnail(url=createur_avatar_url)
+        return e
+
+def carte_tribu(fiche: FicheTribu, photo_index: int = 0) -> CarteTribu:
+    """Embed de la fiche pour cette photo, construit une seule fois par révision"""
+    cle = (fiche.tribu["id"], fiche.tribu["revision"], photo_index)
+    carte = _cartes.get(cle)
+    if carte is None:
+        e = embed_tribu(fiche.tribu, fiche.membres, fiche.avant_postes, None,
+                        fiche.photos, photo_index, fiche.bases_premium, fiche.progression)
+        payload = e.to_dict()
+        payload.pop("timestamp", None)  # heure de construction : remise à jour à chaque affichage
+        carte = CarteTribu(payload=payload, a_logo=bool(fiche.tribu["logo_url"]))
+        _cartes.put(cle, carte)
+    return carte
+
+async def fiche_tribu_courante(tribu_id: int) -> Optional[FicheTribu]:
+    """Fiche de la dernière révision connue : aucune requête si elle est déjà en cache"""
+    revision = _revisions.get(tribu_id)
+    fiche = _fiches.get((tribu_id, revision)) if revision is not None else None
+    return fiche or await charger_fiche_tribu(tribu_id)
+
+def resume_cartes() -> dict:
+    return {"fiches": _fiches.resume(), "cartes": _cartes.resume(), "tribus_suivies": len(_revisions)}
+
 # ---------- Vue pour l'historique paginé ----------
-class HistoriqueView(discord.ui.View):
-    def __init__(self, tribu_id: int, tribu_nom: str, offset: int = 0):
+class HistoriqueView(VueServeur):
+    def __init__(self, tribu_id: int, tribu_nom: str):
         super().__init__(timeout=300)  # 3 minutes
         self.tribu_id = tribu_id
         self.tribu_nom = tribu_nom
-        self.offset = offset
+        self.page = 0
         self.page_size = 10
         self.total_entries = 0
+        self.entrees = []
+        self._page_suivante = None  # Tâche de préchargement de la page suivante
+    
+    def _precharger(self):
+        """Lance la lecture de la page suivante en arrière-plan (curseur = dernière entrée affichée)"""
+        derniere = self.entrees[-1]
+        curseur = (derniere["created_at"], derniere["id"])
+        self._page_suivante = asyncio.create_task(lire_page_historique(self.tribu_id, curseur, self.page_size))
     
     async def create_embed(self):
         """Crée l'embed de l'historique pour la page actuelle"""
-        with db_connect() as conn:
-            c = conn.cursor()
-            # Compter le total d'entrées
-            c.execute("SELECT COUNT(*) as total FROM historique WHERE tribu_id=?", (self.tribu_id,))
-            self.total_entries = c.fetchone()["total"]
-            
-            if self.total_entries == 0:
-                return None
-            
-            # Récupérer les entrées pour cette page
-            c.execute("""
-                SELECT user_id, action, details, created_at 
-                FROM historique 
-                WHERE tribu_id=? 
-                ORDER BY created_at DESC 
-                LIMIT ? OFFSET ?
-            """, (self.tribu_id, self.page_size, self.offset))
-            historique = c.fetchall()
-        
-        if not historique:
+        if not self.entrees:
+            self.total_entries, self.entrees = await asyncio.gather(
+                compter_historique(self.tribu_id),
+                lire_page_historique(self.tribu_id, None, self.page_size)
+            )
+        
+        if not self.entrees:
             return None
         
         # Créer l'embed
@@ -616,23 +2819,25 @@ class HistoriqueView(discord.ui.View):
         )
         
         lines = []
-        for h in historique:
+        for h in self.entrees:
             date = dt.datetime.fromisoformat(h["created_at"]).strftime("%d/%m/%y %H:%M")
-            lines.append(f"**{date}** — <@{h['user_id']}>\n  ↳ {h['action']}")
+            auteur = f"<@{h['user_id']}>" if h["user_id"] else "🤖 Automatique"
+            lines.append(f"**{date}** — {auteur}\n  ↳ {h['action']}")
             if h["details"]:
                 lines.append(f"  _{h['details']}_")
         
         e.description = "\n".join(lines)
         
         # Footer avec info de pagination
-        page_actuelle = (self.offset // self.page_size) + 1
-        total_pages = (self.total_entries + self.page_size - 1) // self.page_size
-        entries_debut = self.offset + 1
-        entries_fin = min(self.offset + self.page_size, self.total_entries)
-        e.set_footer(text=f"Entrées {entries_debut}-{entries_fin} sur {self.total_entries} • Page {page_actuelle}/{total_pages}")
+        total_pages = max(1, (self.total_entries + self.page_size - 1) // self.page_size)
+        entries_debut = self.page * self.page_size + 1
+        entries_fin = entries_debut + len(self.entrees) - 1
+        e.set_footer(text=f"Entrées {entries_debut}-{entries_fin} sur {self.total_entries} • Page {self.page + 1}/{total_pages}")
         
         # Activer/désactiver le bouton "Voir +" selon s'il reste des entrées
-        has_more = (self.offset + self.page_size) < self.total_entries
+        has_more = len(self.entrees) == self.page_size and entries_fin < self.total_entries
+        if has_more:
+            self._precharger()
         
         # Chercher et mettre à jour le bouton dans les enfants de la vue
         for child in self.children:
@@ -645,17 +2850,22 @@ class HistoriqueView(discord.ui.View):
     
     @discord.ui.button(label="Voir +", style=discord.ButtonStyle.primary, emoji="📖")
     async def voir_plus_btn(self, inter: discord.Interaction, button: discord.ui.Button):
-        # Charger la page suivante
-        self.offset += self.page_size
-        embed = await self.create_embed()
+        # Charger la page suivante (normalement déjà préchargée)
+        suivante = await self._page_suivante if self._page_suivante else []
+        self._page_suivante = None
         
-        if embed:
-            await inter.response.edit_message(embed=embed, view=self)
-        else:
+        if not suivante:
             await inter.response.send_message("📜 Fin de l'historique atteint.", ephemeral=True)
+            return
+        
+        self.page += 1
+        self.entrees = suivante
+        self.total_entries = await compter_historique(self.tribu_id)
+        embed = await self.create_embed()
+        await inter.response.edit_message(embed=embed, view=self)
 
 # ---------- Panneau Membre pour afficher les commandes utiles ----------
-class ModalAjouterPhoto(discord.ui.Modal, title="📸 Ajouter une photo"):
+class ModalAjouterPhoto(ModalServeur, title="📸 Ajouter une photo"):
     url_photo = discord.ui.TextInput(
         label="URL de la photo",
         placeholder="https://... (postimages.org recommandé)",
@@ -673,48 +2883,28 @@ class ModalAjouterPhoto(discord.ui.Modal, title="📸 Ajouter une photo"):
         await inter.response.defer(ephemeral=True)
         
         # Vérifier les droits
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            row = c.fetchone()
-            
-            if not row:
-                await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                return
-            
-            # Vérifier les permissions
-            if not (est_admin(inter) or inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, inter.user.id)):
-                await inter.followup.send("❌ Tu n'as pas la permission de modifier cette tribu.", ephemeral=True)
-                return
-            
-            # Vérifier le nombre de photos (max 10)
-            c.execute("SELECT COUNT(*) as count FROM photos_tribu WHERE tribu_id=?", (self.tribu_id,))
-            count = c.fetchone()["count"]
-            
-            if count >= 10:
-                await inter.followup.send("❌ Cette tribu a déjà 10 photos. Supprime-en une avant d'en ajouter une nouvelle.", ephemeral=True)
-                return
-            
-            # Calculer le prochain ordre
-            c.execute("SELECT COALESCE(MAX(ordre), -1) as max_ordre FROM photos_tribu WHERE tribu_id=?", (self.tribu_id,))
-            max_ordre = c.fetchone()["max_ordre"]
-            nouvel_ordre = max_ordre + 1
-            
-            # Ajouter la photo
-            c.execute("""
-            INSERT INTO photos_tribu (tribu_id, url, ordre, created_at)
-            VALUES (?, ?, ?, ?)
-            """, (self.tribu_id, self.url_photo.value.strip(), nouvel_ordre, dt.datetime.utcnow().isoformat()))
-            conn.commit()
+        droits = await droits_tribu(inter, self.tribu_id)
+        
+        if not droits.existe:
+            await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+            return
+        
+        # Vérifier les permissions
+        if not droits.peut_gerer:
+            await inter.followup.send("❌ Tu n'as pas la permission de modifier cette tribu.", ephemeral=True)
+            return
+        
+        count, nouvel_ordre = await db_write(ajouter_photo_galerie, self.tribu_id, self.url_photo.value.strip())
+        
+        if nouvel_ordre is None:
+            await inter.followup.send("❌ Cette tribu a déjà 10 photos. Supprime-en une avant d'en ajouter une nouvelle.", ephemeral=True)
+            return
         
-        ajouter_historique(self.tribu_id, inter.user.id, "Photo ajoutée", f"Photo #{nouvel_ordre + 1} ajoutée à la galerie")
+        await ajouter_historique(self.tribu_id, inter.user.id, "Photo ajoutée", f"Photo #{nouvel_ordre + 1} ajoutée à la galerie")
         await inter.followup.send(f"✅ **Photo #{nouvel_ordre + 1} ajoutée à {self.tribu_nom} !** ({count + 1}/10)\n🔗 depuis une URL", ephemeral=True)
-        try:
-            await afficher_ou_rafraichir_fiche(inter.client, self.tribu_id, inter.guild, inter.channel)
-        except Exception as e:
-            print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+        planificateur_fiches.demander(inter.client, self.tribu_id, inter.guild, inter.channel)
 
-class ConfirmationSupprimerPhoto(discord.ui.View):
+class ConfirmationSupprimerPhoto(VueServeur):
     """Vue de confirmation pour la suppression de photo"""
     def __init__(self, tribu_id: int, tribu_nom: str, photo_id: int, photo_url: str, photo_numero: int):
         super().__init__(timeout=60)
@@ -726,7 +2916,7 @@ class ConfirmationSupprimerPhoto(discord.ui.View):
     
     @discord.ui.button(label="Confirmer la suppression", style=discord.ButtonStyle.danger, emoji="✅")
     async def confirmer(self, inter: discord.Interaction, button: discord.ui.Button):
-        with db_connect() as conn:
+        def _supprimer(conn):
             c = conn.cursor()
             # Supprimer la photo
             c.execute("DELETE FROM photos_tribu WHERE id=?", (self.photo_id,))
@@ -736,16 +2926,13 @@ class ConfirmationSupprimerPhoto(discord.ui.View):
             photos_restantes = c.fetchall()
             for i, p in enumerate(photos_restantes):
                 c.execute("UPDATE photos_tribu SET ordre=? WHERE id=?", (i, p["id"]))
-            
-            conn.commit()
-            count_restant = len(photos_restantes)
+            return len(photos_restantes)
+        
+        count_restant = await db_write(_supprimer)
         
-        ajouter_historique(self.tribu_id, inter.user.id, "Photo supprimée", f"Photo {self.photo_numero} supprimée de la galerie")
+        await ajouter_historique(self.tribu_id, inter.user.id, "Photo supprimée", f"Photo {self.photo_numero} supprimée de la galerie")
         await inter.response.send_message(f"✅ **Photo {self.photo_numero} supprimée de {self.tribu_nom} !** ({count_restant}/10)", ephemeral=True)
-        try:
-            await afficher_ou_rafraichir_fiche(inter.client, self.tribu_id, inter.guild, inter.channel)
-        except Exception as e:
-            print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+        planificateur_fiches.demander(inter.client, self.tribu_id, inter.guild, inter.channel)
     
     @discord.ui.button(label="Annuler", style=discord.ButtonStyle.secondary, emoji="❌")
     async def annuler(self, inter: discord.Interaction, button: discord.ui.Button):
@@ -801,12 +2988,12 @@ class SelectSupprimerPhoto(discord.ui.Select):
         # Modifier le message avec l'embed de confirmation
         await inter.response.edit_message(embed=e, view=view)
 
-class ViewSupprimerPhoto(discord.ui.View):
+class ViewSupprimerPhoto(VueServeur):
     def __init__(self, tribu_id: int, tribu_nom: str, photos: list):
         super().__init__(timeout=300)
         self.add_item(SelectSupprimerPhoto(tribu_id, tribu_nom, photos))
 
-class PanneauMembre(discord.ui.View):
+class PanneauMembre(VueServeur):
     def __init__(self, tribu_nom: str, tribu_id: int = None, timeout: Optional[float] = 180):
         super().__init__(timeout=timeout)
         self.tribu_nom = tribu_nom
@@ -815,7 +3002,7 @@ class PanneauMembre(discord.ui.View):
     @discord.ui.button(label="Changer mon nom in-game", style=discord.ButtonStyle.primary, emoji="✏️", row=0)
     async def btn_nom_ingame(self, inter: discord.Interaction, button: discord.ui.Button):
         # Ouvrir un modal pour changer le nom in-game
-        modal = discord.ui.Modal(title="✏️ Modifier mon nom in-game")
+        modal = ModalServeur(title="✏️ Modifier mon nom in-game")
         nom_input = discord.ui.TextInput(
             label="Nouveau nom in-game",
             placeholder="Ton nom dans Ark: Survival Ascended",
@@ -832,11 +3019,7 @@ class PanneauMembre(discord.ui.View):
                 return
             
             # Mettre à jour le nom in-game pour toutes les tribus de l'utilisateur
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("UPDATE membres SET nom_in_game=? WHERE user_id=?", (nouveau_nom, modal_inter.user.id))
-                affected = c.rowcount
-                conn.commit()
+            affected = await db_execute("UPDATE membres SET nom_in_game=? WHERE user_id=?", (nouveau_nom, modal_inter.user.id))
             
             if affected > 0:
                 await modal_inter.followup.send(f"✅ Ton nom in-game a été changé en **{nouveau_nom}** pour toutes tes tribus !", ephemeral=True)
@@ -884,21 +3067,18 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Vérifier les droits
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            row = c.fetchone()
+        droits = await droits_tribu(inter, self.tribu_id)
         
-        if not row:
+        if not droits.existe:
             await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
             return
         
-        if not (est_admin(inter) or inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, inter.user.id)):
+        if not droits.peut_gerer:
             await inter.response.send_message("❌ Tu n'as pas la permission d'ajouter des membres.", ephemeral=True)
             return
         
         # Créer une vue avec un sélecteur d'utilisateur
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         user_select = discord.ui.UserSelect(
             placeholder="Sélectionne l'utilisateur à ajouter...",
             min_values=1,
@@ -910,19 +3090,16 @@ class PanneauMembre(discord.ui.View):
             selected_user = user_select.values[0]
             
             # Vérifier si le membre est déjà dans la tribu
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT * FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, selected_user.id))
-                if c.fetchone():
-                    await select_inter.response.send_message(f"❌ {selected_user.mention} est déjà membre de cette tribu.", ephemeral=True)
-                    return
+            if await db_fetchone("SELECT * FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, selected_user.id)):
+                await select_inter.response.send_message(f"❌ {selected_user.mention} est déjà membre de cette tribu.", ephemeral=True)
+                return
             
             # Stocker les variables pour le modal
             tribu_id_local = self.tribu_id
             tribu_nom_local = self.tribu_nom
             
             # Ouvrir un modal pour demander le nom in-game
-            class ModalNomIngame(discord.ui.Modal, title="👤 Nom in-game du membre"):
+            class ModalNomIngame(ModalServeur, title="👤 Nom in-game du membre"):
                 nom_ingame = discord.ui.TextInput(
                     label="Nom in-game (dans Ark)",
                     placeholder="Ex: Raptor_Killer42",
@@ -941,7 +3118,7 @@ class PanneauMembre(discord.ui.View):
                     print(f"✅ DEBUG: Envoi de l'embed avec les boutons manager...")
                     
                     # Demander si le membre est manager
-                    class ViewManagerChoice(discord.ui.View):
+                    class ViewManagerChoice(VueServeur):
                         def __init__(self):
                             super().__init__(timeout=300)
                         
@@ -950,36 +3127,24 @@ class PanneauMembre(discord.ui.View):
                             # DEFER immédiatement pour éviter timeout
                             await btn_inter.response.defer(ephemeral=True)
                             
-                            with db_connect() as conn:
-                                c = conn.cursor()
-                                c.execute("INSERT INTO membres (tribu_id, user_id, nom_in_game, role, manager) VALUES (?, ?, ?, ?, 1)", 
-                                         (tribu_id_local, selected_user.id, nom_in_game, "Manager"))
-                                conn.commit()
+                            await db_execute("INSERT INTO membres (tribu_id, user_id, nom_in_game, role, manager) VALUES (?, ?, ?, ?, 1)", 
+                                             (tribu_id_local, selected_user.id, nom_in_game, "Manager"))
                             
-                            ajouter_historique(tribu_id_local, btn_inter.user.id, "Membre ajouté", f"{selected_user.mention} ({nom_in_game}) ajouté en tant que Manager")
+                            await ajouter_historique(tribu_id_local, btn_inter.user.id, "Membre ajouté", f"{selected_user.mention} ({nom_in_game}) ajouté en tant que Manager")
                             await btn_inter.followup.send(f"✅ {selected_user.mention} **({nom_in_game})** a été ajouté à **{tribu_nom_local}** en tant que **Manager** !", ephemeral=True)
-                            try:
-                                await afficher_ou_rafraichir_fiche(btn_inter.client, tribu_id_local, btn_inter.guild, btn_inter.channel)
-                            except Exception as e:
-                                await btn_inter.followup.send(f"⚠️ **Note** : Membre ajouté mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+                            planificateur_fiches.demander(btn_inter.client, tribu_id_local, btn_inter.guild, btn_inter.channel)
                         
                         @discord.ui.button(label="Non, membre simple", style=discord.ButtonStyle.secondary, emoji="👤")
                         async def btn_membre(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
                             # DEFER immédiatement pour éviter timeout
                             await btn_inter.response.defer(ephemeral=True)
                             
-                            with db_connect() as conn:
-                                c = conn.cursor()
-                                c.execute("INSERT INTO membres (tribu_id, user_id, nom_in_game) VALUES (?, ?, ?)", 
-                                         (tribu_id_local, selected_user.id, nom_in_game))
-                                conn.commit()
+                            await db_execute("INSERT INTO membres (tribu_id, user_id, nom_in_game) VALUES (?, ?, ?)", 
+                                             (tribu_id_local, selected_user.id, nom_in_game))
                             
-                            ajouter_historique(tribu_id_local, btn_inter.user.id, "Membre ajouté", f"{selected_user.mention} ({nom_in_game}) ajouté à la tribu")
+                            await ajouter_historique(tribu_id_local, btn_inter.user.id, "Membre ajouté", f"{selected_user.mention} ({nom_in_game}) ajouté à la tribu")
                             await btn_inter.followup.send(f"✅ {selected_user.mention} **({nom_in_game})** a été ajouté à **{tribu_nom_local}** !", ephemeral=True)
-                            try:
-                                await afficher_ou_rafraichir_fiche(btn_inter.client, tribu_id_local, btn_inter.guild, btn_inter.channel)
-                            except Exception as e:
-                                await btn_inter.followup.send(f"⚠️ **Note** : Membre ajouté mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+                            planificateur_fiches.demander(btn_inter.client, tribu_id_local, btn_inter.guild, btn_inter.channel)
                     
                     e = discord.Embed(
                         title="👤 Autorisation de modification",
@@ -1002,18 +3167,14 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer les membres de la tribu
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            row = c.fetchone()
-            
-            if not row:
-                await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
-                return
-            
-            c.execute("SELECT user_id, role FROM membres WHERE tribu_id=? AND user_id != ?", 
-                     (self.tribu_id, row["proprietaire_id"]))
-            membres = c.fetchall()
+        row = await db_fetchone("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
+        
+        if not row:
+            await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
+            return
+        
+        # Une seule jointure membres + profils Arki Identité (base attachée en lecture seule)
+        membres = [m for m in await membres_avec_profils(self.tribu_id) if m["user_id"] != row["proprietaire_id"]]
         
         if not membres:
             await inter.response.send_message("❌ Aucun membre à supprimer (hors référent).", ephemeral=True)
@@ -1024,20 +3185,21 @@ class PanneauMembre(discord.ui.View):
         for membre in membres:
             # Récupérer le nom d'utilisateur Discord
             user = inter.guild.get_member(membre['user_id'])
+            role_display = f" — {membre['role']}" if membre['role'] else ""
+            if membre['profil'] is not None:
+                role_display += " • 🪪 Arki Identité"
             if user:
                 user_display = f"{user.display_name} (@{user.name})"
-                role_display = f" — {membre['role']}" if membre['role'] else ""
                 options.append(discord.SelectOption(
                     label=user_display[:100],  # Discord limite à 100 caractères
-                    description=f"ID: {membre['user_id']}{role_display}",
+                    description=f"ID: {membre['user_id']}{role_display}"[:100],
                     value=str(membre['user_id'])
                 ))
             else:
-                # Fallback si le membre n'est plus sur le serveur
-                role_display = f" — {membre['role']}" if membre['role'] else ""
+                # Fallback si le membre n'est plus sur le serveur : nom In Game s'il est connu
                 options.append(discord.SelectOption(
-                    label=f"Utilisateur {membre['user_id']}",
-                    description=f"(Membre absent du serveur){role_display}",
+                    label=(membre['nom_in_game'] or f"Utilisateur {membre['user_id']}")[:100],
+                    description=f"(Membre absent du serveur){role_display}"[:100],
                     value=str(membre['user_id'])
                 ))
         
@@ -1049,27 +3211,20 @@ class PanneauMembre(discord.ui.View):
             user_id = int(select.values[0])
             
             # Vérifier les droits
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de retirer des membres.", ephemeral=True)
-                    return
-                
-                c.execute("DELETE FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, user_id))
-                conn.commit()
+            droits = await droits_tribu(select_inter, self.tribu_id)
+            
+            if not droits.peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de retirer des membres.", ephemeral=True)
+                return
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Membre retiré", f"<@{user_id}> retiré de la tribu")
+            await db_execute("DELETE FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, user_id))
+            
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Membre retiré", f"<@{user_id}> retiré de la tribu")
             await select_inter.followup.send(f"✅ <@{user_id}> a été retiré de **{self.tribu_nom}** !", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         await inter.response.send_message("👥 Sélectionne le membre à retirer :", view=view, ephemeral=True)
     
@@ -1080,23 +3235,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer toutes les maps disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM maps WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            maps = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "maps")
+        maps = catalogue.noms
         
         if not maps:
             await inter.response.send_message("❌ Aucune map disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des maps
-        options = []
-        for map_nom in maps[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=map_nom,
-                value=map_nom,
-                emoji="🗺️"
-            ))
+        options = catalogue.options("🗺️")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="🗺️ Sélectionne la map de l'avant-poste...",
@@ -1108,7 +3255,7 @@ class PanneauMembre(discord.ui.View):
             map_selectionnee = select.values[0]
             
             # Ouvrir un modal pour les coordonnées
-            modal = discord.ui.Modal(title=f"🏘️ Avant-poste sur {map_selectionnee}")
+            modal = ModalServeur(title=f"🏘️ Avant-poste sur {map_selectionnee}")
             coords_input = discord.ui.TextInput(
                 label="Coordonnées",
                 placeholder="Ex: 45.5, 32.6",
@@ -1125,19 +3272,18 @@ class PanneauMembre(discord.ui.View):
                 coords = coords_input.value.strip()
                 
                 # Vérifier les droits
-                with db_connect() as conn:
+                droits = await droits_tribu(modal_inter, self.tribu_id)
+                
+                if not droits.existe:
+                    await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                    return
+                
+                if not droits.peut_gerer:
+                    await modal_inter.followup.send("❌ Tu n'as pas la permission d'ajouter des avant-postes.", ephemeral=True)
+                    return
+                
+                def _ajouter_ap(conn):
                     c = conn.cursor()
-                    c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                    row = c.fetchone()
-                    
-                    if not row:
-                        await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                        return
-                    
-                    if not (est_admin(modal_inter) or modal_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, modal_inter.user.id)):
-                        await modal_inter.followup.send("❌ Tu n'as pas la permission d'ajouter des avant-postes.", ephemeral=True)
-                        return
-                    
                     # Générer un nom automatique
                     c.execute("SELECT COUNT(*) as count FROM avant_postes WHERE tribu_id=?", (self.tribu_id,))
                     count = c.fetchone()["count"]
@@ -1148,20 +3294,19 @@ class PanneauMembre(discord.ui.View):
                     INSERT INTO avant_postes (tribu_id, user_id, nom, map, coords, created_at)
                     VALUES (?, ?, ?, ?, ?, ?)
                     """, (self.tribu_id, modal_inter.user.id, nom_ap, map_selectionnee, coords, dt.datetime.utcnow().isoformat()))
-                    conn.commit()
+                    return nom_ap
                 
-                ajouter_historique(self.tribu_id, modal_inter.user.id, "Avant-poste ajouté", f"{nom_ap} — {map_selectionnee} | {coords}")
+                nom_ap = await db_write(_ajouter_ap)
+                
+                await ajouter_historique(self.tribu_id, modal_inter.user.id, "Avant-poste ajouté", f"{nom_ap} — {map_selectionnee} | {coords}")
                 await modal_inter.followup.send(f"✅ **{nom_ap} ajouté : {map_selectionnee} !**", ephemeral=True)
-                try:
-                    await afficher_ou_rafraichir_fiche(modal_inter.client, self.tribu_id, modal_inter.guild, modal_inter.channel)
-                except Exception as e:
-                    await modal_inter.followup.send(f"⚠️ **Note** : Avant-poste ajouté mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+                planificateur_fiches.demander(modal_inter.client, self.tribu_id, modal_inter.guild, modal_inter.channel)
             
             modal.on_submit = modal_callback
             await select_inter.response.send_modal(modal)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("🏘️ **Ajouter un avant-poste**\n\nSélectionne d'abord la map :", view=view, ephemeral=True)
@@ -1173,10 +3318,7 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer les avant-postes de la tribu
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT id, nom, map, coords FROM avant_postes WHERE tribu_id=?", (self.tribu_id,))
-            avant_postes = c.fetchall()
+        avant_postes = await db_fetchall("SELECT id, nom, map, coords FROM avant_postes WHERE tribu_id=?", (self.tribu_id,))
         
         if not avant_postes:
             await inter.response.send_message("❌ Aucun avant-poste à supprimer.", ephemeral=True)
@@ -1202,31 +3344,27 @@ class PanneauMembre(discord.ui.View):
             ap_id = int(select.values[0])
             
             # Vérifier les droits
-            with db_connect() as conn:
+            droits = await droits_tribu(select_inter, self.tribu_id)
+            
+            if not droits.peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de retirer des avant-postes.", ephemeral=True)
+                return
+            
+            def _supprimer(conn):
                 c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de retirer des avant-postes.", ephemeral=True)
-                    return
-                
                 c.execute("SELECT nom FROM avant_postes WHERE id=?", (ap_id,))
                 ap = c.fetchone()
-                nom_ap = ap["nom"] if ap else "Avant-poste"
-                
                 c.execute("DELETE FROM avant_postes WHERE id=?", (ap_id,))
-                conn.commit()
+                return ap["nom"] if ap else "Avant-poste"
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Avant-poste supprimé", nom_ap)
+            nom_ap = await db_write(_supprimer)
+            
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Avant-poste supprimé", nom_ap)
             await select_inter.followup.send(f"✅ **{nom_ap}** supprimé de **{self.tribu_nom}** !", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         await inter.response.send_message("🏚️ Sélectionne l'avant-poste à retirer :", view=view, ephemeral=True)
     
@@ -1237,23 +3375,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer toutes les maps disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM maps WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            maps = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "maps")
+        maps = catalogue.noms
         
         if not maps:
             await inter.response.send_message("❌ Aucune map disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des maps
-        options = []
-        for map_nom in maps[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=map_nom,
-                value=map_nom,
-                emoji="🗺️"
-            ))
+        options = catalogue.options("🗺️")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="🗺️ Sélectionne la map de la base principale...",
@@ -1265,7 +3395,7 @@ class PanneauMembre(discord.ui.View):
             map_selectionnee = select.values[0]
             
             # Ouvrir un modal pour les coordonnées
-            modal = discord.ui.Modal(title=f"🏠 Base principale sur {map_selectionnee}")
+            modal = ModalServeur(title=f"🏠 Base principale sur {map_selectionnee}")
             coords_input = discord.ui.TextInput(
                 label="Coordonnées",
                 placeholder="Ex: 45.5, 32.6",
@@ -1282,37 +3412,30 @@ class PanneauMembre(discord.ui.View):
                 coords = coords_input.value.strip()
                 
                 # Vérifier les droits
-                with db_connect() as conn:
-                    c = conn.cursor()
-                    c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                    row = c.fetchone()
-                    
-                    if not row:
-                        await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                        return
-                    
-                    if not (est_admin(modal_inter) or modal_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, modal_inter.user.id)):
-                        await modal_inter.followup.send("❌ Tu n'as pas la permission de modifier la base principale.", ephemeral=True)
-                        return
-                    
-                    # Mettre à jour la base principale
-                    c.execute("""
-                    UPDATE tribus SET base_map=?, base_coords=? WHERE id=?
-                    """, (map_selectionnee, coords, self.tribu_id))
-                    conn.commit()
+                droits = await droits_tribu(modal_inter, self.tribu_id)
+                
+                if not droits.existe:
+                    await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                    return
                 
-                ajouter_historique(self.tribu_id, modal_inter.user.id, "Base principale modifiée", f"{map_selectionnee} | {coords}")
+                if not droits.peut_gerer:
+                    await modal_inter.followup.send("❌ Tu n'as pas la permission de modifier la base principale.", ephemeral=True)
+                    return
+                
+                # Mettre à jour la base principale
+                await db_execute("""
+                UPDATE tribus SET base_map=?, base_coords=? WHERE id=?
+                """, (map_selectionnee, coords, self.tribu_id))
+                
+                await ajouter_historique(self.tribu_id, modal_inter.user.id, "Base principale modifiée", f"{map_selectionnee} | {coords}")
                 await modal_inter.followup.send(f"✅ **Base principale définie : {map_selectionnee} ({coords}) !**", ephemeral=True)
-                try:
-                    await afficher_ou_rafraichir_fiche(modal_inter.client, self.tribu_id, modal_inter.guild, modal_inter.channel)
-                except Exception as e:
-                    await modal_inter.followup.send(f"⚠️ **Note** : Base modifiée mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+                planificateur_fiches.demander(modal_inter.client, self.tribu_id, modal_inter.guild, modal_inter.channel)
             
             modal.on_submit = modal_callback
             await select_inter.response.send_modal(modal)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("🏠 **Modifier la base principale**\n\nSélectionne d'abord la map :", view=view, ephemeral=True)
@@ -1324,23 +3447,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer toutes les maps premium disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM maps_premium WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            maps = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "maps_premium")
+        maps = catalogue.noms
         
         if not maps:
             await inter.response.send_message("❌ Aucune map premium disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des maps premium
-        options = []
-        for map_nom in maps[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=map_nom,
-                value=map_nom,
-                emoji="⭐"
-            ))
+        options = catalogue.options("⭐")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="⭐ Sélectionne la map premium...",
@@ -1352,7 +3467,7 @@ class PanneauMembre(discord.ui.View):
             map_selectionnee = select.values[0]
             
             # Ouvrir un modal pour les coordonnées
-            modal = discord.ui.Modal(title=f"⭐ Base premium sur {map_selectionnee}")
+            modal = ModalServeur(title=f"⭐ Base premium sur {map_selectionnee}")
             coords_input = discord.ui.TextInput(
                 label="Coordonnées",
                 placeholder="Ex: 45.5, 32.6",
@@ -1369,19 +3484,18 @@ class PanneauMembre(discord.ui.View):
                 coords = coords_input.value.strip()
                 
                 # Vérifier les droits
-                with db_connect() as conn:
+                droits = await droits_tribu(modal_inter, self.tribu_id)
+                
+                if not droits.existe:
+                    await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                    return
+                
+                if not droits.peut_gerer:
+                    await modal_inter.followup.send("❌ Tu n'as pas la permission d'ajouter des bases premium.", ephemeral=True)
+                    return
+                
+                def _ajouter_base(conn):
                     c = conn.cursor()
-                    c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                    row = c.fetchone()
-                    
-                    if not row:
-                        await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                        return
-                    
-                    if not (est_admin(modal_inter) or modal_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, modal_inter.user.id)):
-                        await modal_inter.followup.send("❌ Tu n'as pas la permission d'ajouter des bases premium.", ephemeral=True)
-                        return
-                    
                     # Générer un nom automatique
                     c.execute("SELECT COUNT(*) as count FROM bases_premium WHERE tribu_id=?", (self.tribu_id,))
                     count = c.fetchone()["count"]
@@ -1392,20 +3506,19 @@ class PanneauMembre(discord.ui.View):
                     INSERT INTO bases_premium (tribu_id, user_id, nom, map, coords, created_at)
                     VALUES (?, ?, ?, ?, ?, ?)
                     """, (self.tribu_id, modal_inter.user.id, nom_base, map_selectionnee, coords, dt.datetime.utcnow().isoformat()))
-                    conn.commit()
+                    return nom_base
+                
+                nom_base = await db_write(_ajouter_base)
                 
-                ajouter_historique(self.tribu_id, modal_inter.user.id, "Base premium ajoutée", f"{nom_base} — {map_selectionnee} | {coords}")
+                await ajouter_historique(self.tribu_id, modal_inter.user.id, "Base premium ajoutée", f"{nom_base} — {map_selectionnee} | {coords}")
                 await modal_inter.followup.send(f"✅ **{nom_base} ajoutée : {map_selectionnee} !**", ephemeral=True)
-                try:
-                    await afficher_ou_rafraichir_fiche(modal_inter.client, self.tribu_id, modal_inter.guild, modal_inter.channel)
-                except Exception as e:
-                    await modal_inter.followup.send(f"⚠️ **Note** : Base premium ajoutée mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+                planificateur_fiches.demander(modal_inter.client, self.tribu_id, modal_inter.guild, modal_inter.channel)
             
             modal.on_submit = modal_callback
             await select_inter.response.send_modal(modal)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("⭐ **Ajouter une base premium**\n\nSélectionne d'abord la map premium :", view=view, ephemeral=True)
@@ -1417,10 +3530,7 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer les bases premium de la tribu
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT id, nom, map, coords FROM bases_premium WHERE tribu_id=?", (self.tribu_id,))
-            bases_premium = c.fetchall()
+        bases_premium = await db_fetchall("SELECT id, nom, map, coords FROM bases_premium WHERE tribu_id=?", (self.tribu_id,))
         
         if not bases_premium:
             await inter.response.send_message("❌ Aucune base premium à retirer.", ephemeral=True)
@@ -1446,31 +3556,27 @@ class PanneauMembre(discord.ui.View):
             bp_id = int(select.values[0])
             
             # Vérifier les droits
-            with db_connect() as conn:
+            droits = await droits_tribu(select_inter, self.tribu_id)
+            
+            if not droits.peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de retirer des bases premium.", ephemeral=True)
+                return
+            
+            def _supprimer(conn):
                 c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de retirer des bases premium.", ephemeral=True)
-                    return
-                
                 c.execute("SELECT nom FROM bases_premium WHERE id=?", (bp_id,))
                 bp = c.fetchone()
-                nom_bp = bp["nom"] if bp else "Base premium"
-                
                 c.execute("DELETE FROM bases_premium WHERE id=?", (bp_id,))
-                conn.commit()
+                return bp["nom"] if bp else "Base premium"
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Base premium supprimée", nom_bp)
+            nom_bp = await db_write(_supprimer)
+            
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Base premium supprimée", nom_bp)
             await select_inter.followup.send(f"✅ **{nom_bp}** supprimée de **{self.tribu_nom}** !", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         await inter.response.send_message("⭐ Sélectionne la base premium à retirer :", view=view, ephemeral=True)
     
@@ -1483,10 +3589,9 @@ class PanneauMembre(discord.ui.View):
         # Stocker les variables localement pour éviter les problèmes de scope
         tribu_id_local = self.tribu_id
         tribu_nom_local = self.tribu_nom
-        user_id = inter.user.id
         
         # Créer le modal IMMÉDIATEMENT (sans vérifications DB qui ralentissent)
-        modal = discord.ui.Modal(title="📢 Question de recrutement")
+        modal = ModalServeur(title="📢 Question de recrutement")
         recrutement_input = discord.ui.TextInput(
             label="Question de recrutement",
             placeholder="Ex: Nous recrutons des joueurs PVP actifs !",
@@ -1500,39 +3605,30 @@ class PanneauMembre(discord.ui.View):
             await modal_inter.response.defer(ephemeral=True)
             
             # MAINTENANT on vérifie les permissions et on récupère les données
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT recrutement, proprietaire_id FROM tribus WHERE id=?", (tribu_id_local,))
-                row = c.fetchone()
+            droits = await droits_tribu(modal_inter, tribu_id_local)
             
-            if not row:
+            if not droits.existe:
                 await modal_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
                 return
             
             # Vérifier les droits
-            if not (est_admin(modal_inter) or user_id == row["proprietaire_id"] or est_manager(tribu_id_local, user_id)):
+            if not droits.peut_gerer:
                 await modal_inter.followup.send("❌ Tu n'as pas la permission de modifier la question de recrutement.", ephemeral=True)
                 return
             
             nouveau_recrutement = recrutement_input.value.strip()
             
             # Mettre à jour le recrutement
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("UPDATE tribus SET recrutement=? WHERE id=?", (nouveau_recrutement, tribu_id_local))
-                conn.commit()
+            await db_execute("UPDATE tribus SET recrutement=? WHERE id=?", (nouveau_recrutement, tribu_id_local))
             
             if nouveau_recrutement:
-                ajouter_historique(tribu_id_local, modal_inter.user.id, "Question de recrutement modifiée", nouveau_recrutement[:100])
+                await ajouter_historique(tribu_id_local, modal_inter.user.id, "Question de recrutement modifiée", nouveau_recrutement[:100])
                 await modal_inter.followup.send(f"✅ Question de recrutement modifiée pour **{tribu_nom_local}** !", ephemeral=True)
             else:
-                ajouter_historique(tribu_id_local, modal_inter.user.id, "Question de recrutement supprimée", "")
+                await ajouter_historique(tribu_id_local, modal_inter.user.id, "Question de recrutement supprimée", "")
                 await modal_inter.followup.send(f"✅ Question de recrutement supprimée pour **{tribu_nom_local}** !", ephemeral=True)
             
-            try:
-                await afficher_ou_rafraichir_fiche(modal_inter.client, tribu_id_local, modal_inter.guild, modal_inter.channel)
-            except Exception as e:
-                await modal_inter.followup.send(f"⚠️ **Note** : Question modifiée mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+            planificateur_fiches.demander(modal_inter.client, tribu_id_local, modal_inter.guild, modal_inter.channel)
         
         modal.on_submit = modal_callback
         await inter.response.send_modal(modal)
@@ -1566,10 +3662,7 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer les photos de la tribu
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (self.tribu_id,))
-            photos = c.fetchall()
+        photos = await db_fetchall("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (self.tribu_id,))
         
         if not photos:
             await inter.response.send_message("📷 Aucune photo dans la galerie. Utilise le bouton **Ajouter photo** pour en ajouter une.", ephemeral=True)
@@ -1660,23 +3753,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer tous les boss disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM boss WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            boss_list = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "boss")
+        boss_list = catalogue.noms
         
         if not boss_list:
             await inter.response.send_message("❌ Aucun boss disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des boss
-        options = []
-        for boss_nom in boss_list[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=boss_nom,
-                value=boss_nom,
-                emoji="✅"
-            ))
+        options = catalogue.options("✅")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="✅ Sélectionne le boss validé...",
@@ -1690,48 +3775,27 @@ class PanneauMembre(discord.ui.View):
             boss_selectionne = select.values[0]
             
             # Vérifier les droits et ajouter le boss validé
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not row:
-                    await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                    return
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
-                    return
-                
-                # Récupérer les deux listes
-                boss_valides = [b.strip() for b in (row["progression_boss"] or "").split(",") if b.strip()]
-                boss_non_valides = [b.strip() for b in (row["progression_boss_non_valides"] or "").split(",") if b.strip()]
-                
-                # Vérifier si le boss est déjà validé
-                if boss_selectionne in boss_valides:
-                    await select_inter.followup.send(f"ℹ️ Le boss **{boss_selectionne}** est déjà validé pour {row['nom']}.", ephemeral=True)
-                    return
-                
-                # Retirer de la liste non-validés si présent
-                if boss_selectionne in boss_non_valides:
-                    boss_non_valides.remove(boss_selectionne)
-                
-                # Ajouter à la liste des validés
-                boss_valides.append(boss_selectionne)
-                
-                c.execute("UPDATE tribus SET progression_boss=?, progression_boss_non_valides=? WHERE id=?", 
-                         (", ".join(boss_valides), ", ".join(boss_non_valides), row["id"]))
-                conn.commit()
+            row = await db_fetchone("SELECT id, nom, proprietaire_id FROM tribus WHERE id=?", (self.tribu_id,))
+            
+            if not row:
+                await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                return
+            
+            if not (await droits_tribu(select_inter, self.tribu_id)).peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
+                return
+            
+            # Passer le boss en validé (upsert d'une seule ligne)
+            if not await definir_progression(row["id"], "boss", boss_selectionne, "valide"):
+                await select_inter.followup.send(f"ℹ️ Le boss **{boss_selectionne}** est déjà validé pour {row['nom']}.", ephemeral=True)
+                return
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Boss validé", boss_selectionne)
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Boss validé", boss_selectionne)
             await select_inter.followup.send(f"✅ **Boss {boss_selectionne} validé pour {row['nom']} !**", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("✅ **Marquer un boss comme validé**\n\nSélectionne le boss :", view=view, ephemeral=True)
@@ -1743,23 +3807,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer tous les boss disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM boss WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            boss_list = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "boss")
+        boss_list = catalogue.noms
         
         if not boss_list:
             await inter.response.send_message("❌ Aucun boss disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des boss
-        options = []
-        for boss_nom in boss_list[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=boss_nom,
-                value=boss_nom,
-                emoji="❌"
-            ))
+        options = catalogue.options("❌")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="❌ Sélectionne le boss non-validé...",
@@ -1772,48 +3828,27 @@ class PanneauMembre(discord.ui.View):
             boss_selectionne = select.values[0]
             
             # Vérifier les droits et ajouter le boss non-validé
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not row:
-                    await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                    return
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
-                    return
-                
-                # Récupérer les deux listes
-                boss_valides = [b.strip() for b in (row["progression_boss"] or "").split(",") if b.strip()]
-                boss_non_valides = [b.strip() for b in (row["progression_boss_non_valides"] or "").split(",") if b.strip()]
-                
-                # Vérifier si le boss est déjà non-validé
-                if boss_selectionne in boss_non_valides:
-                    await select_inter.followup.send(f"ℹ️ Le boss **{boss_selectionne}** est déjà marqué comme non-validé pour {row['nom']}.", ephemeral=True)
-                    return
-                
-                # Retirer de la liste validés si présent
-                if boss_selectionne in boss_valides:
-                    boss_valides.remove(boss_selectionne)
-                
-                # Ajouter à la liste des non-validés
-                boss_non_valides.append(boss_selectionne)
-                
-                c.execute("UPDATE tribus SET progression_boss=?, progression_boss_non_valides=? WHERE id=?", 
-                         (", ".join(boss_valides), ", ".join(boss_non_valides), row["id"]))
-                conn.commit()
+            row = await db_fetchone("SELECT id, nom, proprietaire_id FROM tribus WHERE id=?", (self.tribu_id,))
+            
+            if not row:
+                await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                return
+            
+            if not (await droits_tribu(select_inter, self.tribu_id)).peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
+                return
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Boss non-validé", boss_selectionne)
+            # Passer le boss en non-validé (upsert d'une seule ligne)
+            if not await definir_progression(row["id"], "boss", boss_selectionne, "non_valide"):
+                await select_inter.followup.send(f"ℹ️ Le boss **{boss_selectionne}** est déjà marqué comme non-validé pour {row['nom']}.", ephemeral=True)
+                return
+            
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Boss non-validé", boss_selectionne)
             await select_inter.followup.send(f"❌ **Boss {boss_selectionne} marqué comme non-validé pour {row['nom']} !**", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("❌ **Marquer un boss comme non-validé**\n\nSélectionne le boss :", view=view, ephemeral=True)
@@ -1825,23 +3860,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer toutes les notes disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM notes WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            notes_list = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "notes")
+        notes_list = catalogue.noms
         
         if not notes_list:
             await inter.response.send_message("❌ Aucune note disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des notes
-        options = []
-        for note_nom in notes_list[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=note_nom,
-                value=note_nom,
-                emoji="📝"
-            ))
+        options = catalogue.options("📝")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="📝 Sélectionne la note validée...",
@@ -1854,48 +3881,27 @@ class PanneauMembre(discord.ui.View):
             note_selectionnee = select.values[0]
             
             # Vérifier les droits et ajouter la note validée
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not row:
-                    await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                    return
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
-                    return
-                
-                # Récupérer les deux listes
-                notes_valides = [n.strip() for n in (row["progression_notes"] or "").split(",") if n.strip()]
-                notes_non_valides = [n.strip() for n in (row["progression_notes_non_valides"] or "").split(",") if n.strip()]
-                
-                # Vérifier si la note est déjà validée
-                if note_selectionnee in notes_valides:
-                    await select_inter.followup.send(f"ℹ️ La note **{note_selectionnee}** est déjà validée pour {row['nom']}.", ephemeral=True)
-                    return
-                
-                # Retirer de la liste non-validées si présent
-                if note_selectionnee in notes_non_valides:
-                    notes_non_valides.remove(note_selectionnee)
-                
-                # Ajouter à la liste des validées
-                notes_valides.append(note_selectionnee)
-                
-                c.execute("UPDATE tribus SET progression_notes=?, progression_notes_non_valides=? WHERE id=?", 
-                         (", ".join(notes_valides), ", ".join(notes_non_valides), row["id"]))
-                conn.commit()
+            row = await db_fetchone("SELECT id, nom, proprietaire_id FROM tribus WHERE id=?", (self.tribu_id,))
+            
+            if not row:
+                await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                return
+            
+            if not (await droits_tribu(select_inter, self.tribu_id)).peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
+                return
+            
+            # Passer la note en validée (upsert d'une seule ligne)
+            if not await definir_progression(row["id"], "note", note_selectionnee, "valide"):
+                await select_inter.followup.send(f"ℹ️ La note **{note_selectionnee}** est déjà validée pour {row['nom']}.", ephemeral=True)
+                return
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Note validée", note_selectionnee)
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Note validée", note_selectionnee)
             await select_inter.followup.send(f"📝 **Note {note_selectionnee} validée pour {row['nom']} !**", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("📝 **Marquer une note comme validée**\n\nSélectionne la note :", view=view, ephemeral=True)
@@ -1907,23 +3913,15 @@ class PanneauMembre(discord.ui.View):
             return
         
         # Récupérer toutes les notes disponibles
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT DISTINCT nom FROM notes WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-            notes_list = [row["nom"] for row in c.fetchall()]
+        catalogue = await catalogue_serveur(inter.guild_id, "notes")
+        notes_list = catalogue.noms
         
         if not notes_list:
             await inter.response.send_message("❌ Aucune note disponible. Contacte un admin pour en ajouter.", ephemeral=True)
             return
         
         # Créer le menu déroulant des notes
-        options = []
-        for note_nom in notes_list[:25]:  # Discord limite à 25 options
-            options.append(discord.SelectOption(
-                label=note_nom,
-                value=note_nom,
-                emoji="📄"
-            ))
+        options = catalogue.options("📄")  # 25 options au plus (limite Discord)
         
         select = discord.ui.Select(
             placeholder="📄 Sélectionne la note non-validée...",
@@ -1936,54 +3934,33 @@ class PanneauMembre(discord.ui.View):
             note_selectionnee = select.values[0]
             
             # Vérifier les droits et ajouter la note non-validée
-            with db_connect() as conn:
-                c = conn.cursor()
-                c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-                row = c.fetchone()
-                
-                if not row:
-                    await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                    return
-                
-                if not (est_admin(select_inter) or select_inter.user.id == row["proprietaire_id"] or est_manager(self.tribu_id, select_inter.user.id)):
-                    await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
-                    return
-                
-                # Récupérer les deux listes
-                notes_valides = [n.strip() for n in (row["progression_notes"] or "").split(",") if n.strip()]
-                notes_non_valides = [n.strip() for n in (row["progression_notes_non_valides"] or "").split(",") if n.strip()]
-                
-                # Vérifier si la note est déjà non-validée
-                if note_selectionnee in notes_non_valides:
-                    await select_inter.followup.send(f"ℹ️ La note **{note_selectionnee}** est déjà marquée comme non-validée pour {row['nom']}.", ephemeral=True)
-                    return
-                
-                # Retirer de la liste validées si présent
-                if note_selectionnee in notes_valides:
-                    notes_valides.remove(note_selectionnee)
-                
-                # Ajouter à la liste des non-validées
-                notes_non_valides.append(note_selectionnee)
-                
-                c.execute("UPDATE tribus SET progression_notes=?, progression_notes_non_valides=? WHERE id=?", 
-                         (", ".join(notes_valides), ", ".join(notes_non_valides), row["id"]))
-                conn.commit()
+            row = await db_fetchone("SELECT id, nom, proprietaire_id FROM tribus WHERE id=?", (self.tribu_id,))
+            
+            if not row:
+                await select_inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+                return
             
-            ajouter_historique(self.tribu_id, select_inter.user.id, "Note non-validée", note_selectionnee)
+            if not (await droits_tribu(select_inter, self.tribu_id)).peut_gerer:
+                await select_inter.followup.send("❌ Tu n'as pas la permission de modifier la progression.", ephemeral=True)
+                return
+            
+            # Passer la note en non-validée (upsert d'une seule ligne)
+            if not await definir_progression(row["id"], "note", note_selectionnee, "non_valide"):
+                await select_inter.followup.send(f"ℹ️ La note **{note_selectionnee}** est déjà marquée comme non-validée pour {row['nom']}.", ephemeral=True)
+                return
+            
+            await ajouter_historique(self.tribu_id, select_inter.user.id, "Note non-validée", note_selectionnee)
             await select_inter.followup.send(f"📄 **Note {note_selectionnee} marquée comme non-validée pour {row['nom']} !**", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {self.tribu_id}: {e}")
+            planificateur_fiches.demander(select_inter.client, self.tribu_id, select_inter.guild, select_inter.channel)
         
         select.callback = select_callback
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         view.add_item(select)
         
         await inter.response.send_message("📄 **Marquer une note comme non-validée**\n\nSélectionne la note :", view=view, ephemeral=True)
 
 # ---------- Panneau Staff pour gérer une tribu spécifique ----------
-class PanneauStaff(discord.ui.View):
+class PanneauStaff(VueServeur):
     def __init__(self, tribu_id: int, tribu_nom: str, timeout: Optional[float] = 180):
         super().__init__(timeout=timeout)
         self.tribu_id = tribu_id
@@ -2023,7 +4000,7 @@ class PanneauStaff(discord.ui.View):
         await inter.response.send_message(f"⚠️ Utilise `/tribu_supprimer` et confirme avec **{self.tribu_nom}** pour supprimer définitivement cette tribu.", ephemeral=True)
 
 # ---------- Menu déroulant pour la fiche tribu avec galerie photo ----------
-class MenuFicheTribu(discord.ui.View):
+class MenuFicheTribu(VueServeur):
     def __init__(self, tribu_id: int, photo_index: int = 0, timeout: Optional[float] = None):
         super().__init__(timeout=timeout)
         self.tribu_id = tribu_id
@@ -2075,40 +4052,21 @@ class MenuFicheTribu(discord.ui.View):
     
     async def _changer_photo(self, inter: discord.Interaction, direction: int):
         """Change la photo affichée (direction: -1 pour précédent, +1 pour suivant)"""
-        with db_connect() as conn:
-            c = conn.cursor()
-            # Récupérer toutes les photos de cette tribu
-            c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (self.tribu_id,))
-            photos = c.fetchall()
-            
-            if not photos:
-                await inter.response.send_message("📷 Aucune photo dans la galerie. Utilise `/ajouter_photo` pour en ajouter.", ephemeral=True)
-                return
-            
-            # Calculer le nouvel index
-            nouvel_index = (self.photo_index + direction) % len(photos)
-            
-            # Récupérer les infos de la tribu et les autres données
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            tribu = c.fetchone()
-            c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (self.tribu_id,))
-            membres = c.fetchall()
-            c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (self.tribu_id,))
-            avant_postes = c.fetchall()
-            c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (self.tribu_id,))
-            bases_premium = c.fetchall()
+        # Fiche de la révision courante : servie par le cache tant que la tribu n'a pas changé
+        fiche = await fiche_tribu_courante(self.tribu_id)
+        
+        if not fiche or not fiche.photos:
+            await inter.response.send_message("📷 Aucune photo dans la galerie. Utilise `/ajouter_photo` pour en ajouter.", ephemeral=True)
+            return
+        
+        # Calculer le nouvel index
+        nouvel_index = (self.photo_index + direction) % len(fiche.photos)
         
         # Récupérer l'avatar du créateur
-        createur_avatar_url = None
-        try:
-            createur = await inter.client.fetch_user(tribu['proprietaire_id'])
-            if createur:
-                createur_avatar_url = createur.display_avatar.url
-        except:
-            pass
+        createur_avatar_url = await avatar_utilisateur(inter.client, fiche.tribu['proprietaire_id'])
         
         # Créer le nouvel embed avec la nouvelle photo
-        embed = embed_tribu(tribu, membres, avant_postes, createur_avatar_url, photos, nouvel_index, bases_premium)
+        embed = fiche.embed(createur_avatar_url, nouvel_index)
         
         # Mettre à jour la vue avec le nouvel index
         new_view = MenuFicheTribu(self.tribu_id, nouvel_index, timeout=None)
@@ -2138,13 +4096,10 @@ class MenuFicheTribu(discord.ui.View):
         await inter.response.defer(ephemeral=True)
         
         # Récupérer les infos de la tribu
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            tribu = c.fetchone()
-            if not tribu:
-                await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                return
+        tribu = await db_fetchone("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
+        if not tribu:
+            await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+            return
         
         # Afficher le panneau d'aide membre
         view = PanneauMembre(tribu['nom'], self.tribu_id)
@@ -2160,22 +4115,14 @@ class MenuFicheTribu(discord.ui.View):
     
     async def action_personnaliser(self, inter: discord.Interaction):
         # Vérifier les droits (référent, manager, admin ou modo)
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            tribu = c.fetchone()
-            if not tribu:
-                await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
-                return
-            
-            # Vérifier les permissions
-            has_perm = (est_admin_ou_modo(inter) or 
-                       inter.user.id == tribu["proprietaire_id"] or 
-                       est_manager(self.tribu_id, inter.user.id))
-            
-            if not has_perm:
-                await inter.response.send_message("❌ Seuls le référent, les managers, admins et modos peuvent personnaliser la tribu.", ephemeral=True)
-                return
+        droits = await droits_tribu(inter, self.tribu_id)
+        if not droits.existe:
+            await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
+            return
+        
+        if not droits.peut_gerer_ou_modo:
+            await inter.response.send_message("❌ Seuls le référent, les managers, admins et modos peuvent personnaliser la tribu.", ephemeral=True)
+            return
         
         # Afficher un message avec le lien pour la couleur + bouton pour ouvrir le modal
         e = discord.Embed(
@@ -2189,7 +4136,7 @@ class MenuFicheTribu(discord.ui.View):
         e.set_footer(text="💡 Le sélecteur de couleur t'aidera à trouver le code hexadécimal parfait")
         
         # Créer un bouton pour ouvrir le modal
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         btn = discord.ui.Button(label="Ouvrir le formulaire", style=discord.ButtonStyle.primary, emoji="📝")
         
         async def btn_callback(btn_inter: discord.Interaction):
@@ -2210,29 +4157,22 @@ class MenuFicheTribu(discord.ui.View):
         await inter.response.defer(ephemeral=True)
         
         # Vérifier que l'utilisateur est membre
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            tribu = c.fetchone()
-            if not tribu:
-                await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                return
-            
-            # Ne peut pas quitter si référent
-            if inter.user.id == tribu["proprietaire_id"]:
-                await inter.followup.send("❌ Le référent tribu ne peut pas quitter. Utilise `/tribu_transférer` d'abord.", ephemeral=True)
-                return
-            
-            c.execute("SELECT * FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, inter.user.id))
-            if not c.fetchone():
-                await inter.followup.send("❌ Tu n'es pas membre de cette tribu.", ephemeral=True)
-                return
-            
-            # Retirer le membre
-            c.execute("DELETE FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, inter.user.id))
-            conn.commit()
+        tribu = await db_fetchone("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
+        if not tribu:
+            await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+            return
         
-        ajouter_historique(self.tribu_id, inter.user.id, "Quitter tribu", f"<@{inter.user.id}> a quitté la tribu")
+        # Ne peut pas quitter si référent
+        if inter.user.id == tribu["proprietaire_id"]:
+            await inter.followup.send("❌ Le référent tribu ne peut pas quitter. Utilise `/tribu_transférer` d'abord.", ephemeral=True)
+            return
+        
+        # Retirer le membre
+        if not await db_execute("DELETE FROM membres WHERE tribu_id=? AND user_id=?", (self.tribu_id, inter.user.id)):
+            await inter.followup.send("❌ Tu n'es pas membre de cette tribu.", ephemeral=True)
+            return
+        
+        await ajouter_historique(self.tribu_id, inter.user.id, "Quitter tribu", f"<@{inter.user.id}> a quitté la tribu")
         await inter.followup.send(f"✅ Tu as quitté la tribu **{tribu['nom']}**.", ephemeral=True)
     
     async def action_historique(self, inter: discord.Interaction):
@@ -2240,25 +4180,20 @@ class MenuFicheTribu(discord.ui.View):
         await inter.response.defer(ephemeral=True)
         
         # Vérifier les permissions (managers, admin ou modo)
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            tribu = c.fetchone()
-            if not tribu:
-                await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                return
-            
-            # Vérifier les droits
-            has_perm = (est_admin_ou_modo(inter) or 
-                       inter.user.id == tribu["proprietaire_id"] or 
-                       est_manager(self.tribu_id, inter.user.id))
-            
-            if not has_perm:
-                await inter.followup.send("❌ Seuls les managers, admins et modos peuvent voir l'historique.", ephemeral=True)
-                return
+        tribu = await db_fetchone("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
+        if not tribu:
+            await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+            return
+        
+        # Vérifier les droits
+        has_perm = (await droits_tribu(inter, self.tribu_id)).peut_gerer_ou_modo
+        
+        if not has_perm:
+            await inter.followup.send("❌ Seuls les managers, admins et modos peuvent voir l'historique.", ephemeral=True)
+            return
         
         # Créer la vue avec pagination
-        view = HistoriqueView(self.tribu_id, tribu['nom'], offset=0)
+        view = HistoriqueView(self.tribu_id, tribu['nom'])
         
         # Initialiser l'embed ET configurer le bouton
         embed = await view.create_embed()
@@ -2280,13 +4215,10 @@ class MenuFicheTribu(discord.ui.View):
             return
         
         # Récupérer les infos de la tribu
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
-            tribu = c.fetchone()
-            if not tribu:
-                await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
-                return
+        tribu = await db_fetchone("SELECT * FROM tribus WHERE id=?", (self.tribu_id,))
+        if not tribu:
+            await inter.followup.send("❌ Tribu introuvable.", ephemeral=True)
+            return
         
         # Afficher le panneau staff
         view = PanneauStaff(self.tribu_id, tribu['nom'])
@@ -2301,14 +4233,14 @@ class MenuFicheTribu(discord.ui.View):
         await inter.followup.send(embed=e, view=view, ephemeral=True)
 
 async def verifier_droits(inter: discord.Interaction, tribu) -> bool:
-    if est_admin(inter) or inter.user.id == tribu["proprietaire_id"] or est_manager(tribu["id"], inter.user.id):
+    if (await droits_tribu(inter, tribu["id"])).peut_gerer:
         return True
     await inter.response.send_message("❌ Tu n'as pas la permission de modifier cette tribu.", ephemeral=True)
     return False
 
 async def verifier_droits_defer(inter: discord.Interaction, tribu) -> bool:
     """Version de verifier_droits pour les interactions déjà defer()"""
-    if est_admin(inter) or inter.user.id == tribu["proprietaire_id"] or est_manager(tribu["id"], inter.user.id):
+    if (await droits_tribu(inter, tribu["id"])).peut_gerer:
         return True
     await inter.followup.send("❌ Tu n'as pas la permission de modifier cette tribu.", ephemeral=True)
     return False
@@ -2372,316 +4304,371 @@ async def afficher_fiche(inter: discord.Interaction, tribu_id: int, ephemeral: b
         ephemeral: Si True, affiche un message éphémère
         force_current_channel: Si True, ignore le salon configuré et affiche dans le salon actuel (pour /fiche_tribu admin)
     """
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM tribus WHERE id=?", (tribu_id,))
-        tribu = c.fetchone()
-        if not tribu:
-            await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
-            return
-        
-        c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,))
-        membres = c.fetchall()
-        c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        avant_postes = c.fetchall()
-        c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,))
-        photos = c.fetchall()
-        c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        bases_premium = c.fetchall()
-        
-        # Récupérer l'avatar du créateur
-        createur_avatar_url = None
-        try:
-            createur = await inter.client.fetch_user(tribu['proprietaire_id'])
-            if createur:
-                createur_avatar_url = createur.display_avatar.url
-        except:
-            pass
-        
-        # Créer l'embed et le menu
-        embed = embed_tribu(tribu, membres, avant_postes, createur_avatar_url, photos, 0, bases_premium)
-        view = MenuFicheTribu(tribu_id, 0, timeout=None)
-        
-        # Déterminer le salon cible
-        target_channel = inter.channel
-        
-        # Si force_current_channel=True (commande admin /fiche_tribu), on ignore le salon configuré
-        if not ephemeral and not force_current_channel:
-            # Récupérer le salon configuré
-            salon_id_str = get_config(inter.guild_id, "salon_fiche_tribu", "0")
-            if salon_id_str != "0":
-                configured_channel = inter.guild.get_channel(int(salon_id_str))
-                if configured_channel:
-                    target_channel = configured_channel
-        
-        # 🗑️ SUPPRIMER L'ANCIENNE FICHE AVANT D'EN CRÉER UNE NOUVELLE
-        if not ephemeral and inter.guild:
-            old_message_id = tribu.get("message_id", 0) or 0
-            old_channel_id = tribu.get("channel_id", 0) or 0
-            
-            if old_message_id and old_channel_id:
-                try:
-                    old_channel = inter.guild.get_channel(old_channel_id)
-                    if old_channel and hasattr(old_channel, 'fetch_message'):
-                        old_message = await old_channel.fetch_message(old_message_id)
-                        await old_message.delete()
-                        print(f"🗑️ Ancienne fiche supprimée (message {old_message_id})")
-                except Exception as e:
-                    print(f"⚠️ Impossible de supprimer l'ancienne fiche: {e}")
-        
-        # Envoyer la fiche
-        if not ephemeral and target_channel != inter.channel:
-            # Afficher dans un salon différent
-            # Répondre d'abord à l'interaction
-            if inter.response.is_done():
-                await inter.followup.send(f"✅ **Fiche affichée dans {target_channel.mention} !**", ephemeral=True)
-            else:
-                await inter.response.send_message(f"✅ **Fiche affichée dans {target_channel.mention} !**", ephemeral=True)
-            
-            # Envoyer la fiche dans le salon configuré
-            msg = await target_channel.send(embed=embed, view=view)
-            
-            # Sauvegarder le message_id et channel_id
-            c.execute("UPDATE tribus SET message_id=?, channel_id=? WHERE id=?", 
-                     (msg.id, msg.channel.id, tribu_id))
-            conn.commit()
+    fiche = await charger_fiche_tribu(tribu_id)
+    if not fiche:
+        await inter.response.send_message("❌ Tribu introuvable.", ephemeral=True)
+        return
+    tribu = fiche.tribu
+    
+    # Récupérer l'avatar du créateur
+    createur_avatar_url = await avatar_utilisateur(inter.client, tribu['proprietaire_id'])
+    
+    # Créer l'embed et le menu
+    embed = fiche.embed(createur_avatar_url)
+    view = MenuFicheTribu(tribu_id, 0, timeout=None)
+    
+    # Déterminer le salon cible
+    target_channel = inter.channel
+    
+    # Si force_current_channel=True (commande admin /fiche_tribu), on ignore le salon configuré
+    if not ephemeral and not force_current_channel:
+        # Récupérer le salon configuré
+        salon_id_str = await get_config(inter.guild_id, "salon_fiche_tribu", "0")
+        if salon_id_str != "0":
+            configured_channel = inter.guild.get_channel(int(salon_id_str))
+            if configured_channel:
+                target_channel = configured_channel
+    
+    # 🗑️ SUPPRIMER L'ANCIENNE FICHE AVANT D'EN CRÉER UNE NOUVELLE
+    if not ephemeral and inter.guild:
+        # Toutes les fiches suivies de la tribu (l'ancienne et d'éventuels doublons)
+        nb = await supprimer_messages_bot(inter.client, await messages_bot(inter.guild_id, "fiche", tribu_id),
+                                          PRIORITE_INTERACTION)
+        if nb:
+            print(f"🗑️ {nb} ancienne(s) fiche(s) supprimée(s) pour tribu {tribu_id}")
+    
+    # Envoyer la fiche
+    if not ephemeral and target_channel != inter.channel:
+        # Afficher dans un salon différent
+        # Répondre d'abord à l'interaction
+        if inter.response.is_done():
+            await inter.followup.send(f"✅ **Fiche affichée dans {target_channel.mention} !**", ephemeral=True)
         else:
-            # Affichage normal dans le salon actuel
-            if inter.response.is_done():
-                msg = await inter.followup.send(embed=embed, view=view, ephemeral=ephemeral, wait=True)
-            else:
-                await inter.response.send_message(embed=embed, view=view, ephemeral=ephemeral)
-                msg = await inter.original_response()
-            
-            # Sauvegarder le message_id et channel_id (seulement si pas ephemeral)
-            if not ephemeral:
-                c.execute("UPDATE tribus SET message_id=?, channel_id=? WHERE id=?", 
-                         (msg.id, msg.channel.id, tribu_id))
-                conn.commit()
-
-async def afficher_fiche_mise_a_jour(inter: discord.Interaction, tribu_id: int, message_prefix: str = "✅ **Fiche mise à jour !**", ephemeral: bool = False):
-    """Affiche la fiche tribu mise à jour et supprime TOUTES les anciennes fiches existantes"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM tribus WHERE id=?", (tribu_id,))
-        tribu = c.fetchone()
-        if not tribu:
-            return
-        
-        c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,))
-        membres = c.fetchall()
-        c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        avant_postes = c.fetchall()
-        c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,))
-        photos = c.fetchall()
-        c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        bases_premium = c.fetchall()
-        
-        # Récupérer l'ancien salon et message
-        old_message_id = tribu["message_id"] if "message_id" in tribu.keys() else 0
-        old_channel_id = tribu["channel_id"] if "channel_id" in tribu.keys() else 0
-        
-        # Supprimer les anciennes fiches UNIQUEMENT si on affiche dans le MÊME salon
-        if old_channel_id and old_channel_id == inter.channel.id:
-            # On est dans le même salon, supprimer toutes les fiches de cette tribu
-            try:
-                async for message in inter.channel.history(limit=50):
-                    if message.author.id == inter.client.user.id and message.embeds:
-                        # Vérifier si c'est une fiche de cette tribu
-                        for embed in message.embeds:
-                            if embed.title and f"Tribu — {tribu['nom']}" in embed.title:
-                                try:
-                                    await message.delete()
-                                except:
-                                    pass
-                                break
-            except:
-                pass  # Erreur lors de la recherche, on continue quand même
-        
-        # Si on affiche dans un salon différent, ne rien supprimer (laisser l'ancienne fiche)
-        
-        # Récupérer l'avatar du créateur
-        createur_avatar_url = None
-        try:
-            createur = await inter.client.fetch_user(tribu['proprietaire_id'])
-            if createur:
-                createur_avatar_url = createur.display_avatar.url
-        except:
-            pass
+            await inter.response.send_message(f"✅ **Fiche affichée dans {target_channel.mention} !**", ephemeral=True)
         
-        # Envoyer le nouveau message avec la fiche et les boutons
-        embed = embed_tribu(tribu, membres, avant_postes, createur_avatar_url, photos, 0, bases_premium)
-        view = MenuFicheTribu(tribu_id, 0, timeout=None)
+        # Envoyer la fiche dans le salon configuré
+        msg = await sortie.executer(PRIORITE_INTERACTION, target_channel.id, "messages.send",
+                                    lambda: target_channel.send(embed=embed, view=view))
         
-        # Répondre à l'interaction (vérifier si déjà différée)
+        # Sauvegarder le message_id et channel_id
+        await enregistrer_fiche(tribu_id, msg)
+    else:
+        # Affichage normal dans le salon actuel
         if inter.response.is_done():
-            # L'interaction a déjà été différée ou répondue, utiliser followup
-            msg = await inter.followup.send(message_prefix, embed=embed, view=view, ephemeral=ephemeral, wait=True)
+            msg = await inter.followup.send(embed=embed, view=view, ephemeral=ephemeral, wait=True)
         else:
-            # Première réponse
-            await inter.response.send_message(message_prefix, embed=embed, view=view, ephemeral=ephemeral)
+            await inter.response.send_message(embed=embed, view=view, ephemeral=ephemeral)
             msg = await inter.original_response()
         
-        # Sauvegarder le nouveau message_id et channel_id (seulement si pas ephemeral)
+        # Sauvegarder le message_id et channel_id (seulement si pas ephemeral)
         if not ephemeral:
-            c.execute("UPDATE tribus SET message_id=?, channel_id=? WHERE id=?", 
-                     (msg.id, msg.channel.id, tribu_id))
-            conn.commit()
+            await enregistrer_fiche(tribu_id, msg)
+
+async def afficher_fiche_mise_a_jour(inter: discord.Interaction, tribu_id: int, message_prefix: str = "✅ **Fiche mise à jour !**", ephemeral: bool = False):
+    """Affiche la fiche tribu mise à jour et supprime TOUTES les anciennes fiches existantes"""
+    fiche = await charger_fiche_tribu(tribu_id)
+    if not fiche:
+        return
+    tribu = fiche.tribu
+    
+    # Supprimer les anciennes fiches UNIQUEMENT si on affiche dans le MÊME salon :
+    # ids suivis dans bot_messages, supprimés par lot (plus de lecture de l'historique)
+    if not ephemeral and inter.guild:
+        anciennes = await messages_bot(inter.guild_id, "fiche", tribu_id, channel_id=inter.channel.id)
+        await supprimer_messages_bot(inter.client, anciennes, PRIORITE_INTERACTION)
+    
+    # Si on affiche dans un salon différent, ne rien supprimer (laisser l'ancienne fiche)
+    
+    # Récupérer l'avatar du créateur
+    createur_avatar_url = await avatar_utilisateur(inter.client, tribu['proprietaire_id'])
+    
+    # Envoyer le nouveau message avec la fiche et les boutons
+    embed = fiche.embed(createur_avatar_url)
+    view = MenuFicheTribu(tribu_id, 0, timeout=None)
+    
+    # Répondre à l'interaction (vérifier si déjà différée)
+    if inter.response.is_done():
+        # L'interaction a déjà été différée ou répondue, utiliser followup
+        msg = await inter.followup.send(message_prefix, embed=embed, view=view, ephemeral=ephemeral, wait=True)
+    else:
+        # Première réponse
+        await inter.response.send_message(message_prefix, embed=embed, view=view, ephemeral=ephemeral)
+        msg = await inter.original_response()
+    
+    # Sauvegarder le nouveau message_id et channel_id (seulement si pas ephemeral)
+    if not ephemeral:
+        await enregistrer_fiche(tribu_id, msg)
 
 async def rafraichir_fiche_tribu(client, tribu_id: int):
     """Rafraîchit automatiquement la fiche tribu existante après une modification"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM tribus WHERE id=?", (tribu_id,))
-        tribu = c.fetchone()
-        
-        if not tribu:
-            return
-        
-        # Récupérer message_id et channel_id
-        message_id = tribu.get("message_id", 0) or 0
-        channel_id = tribu.get("channel_id", 0) or 0
-        
-        # Si pas de message existant, ne rien faire
-        if not message_id or not channel_id:
-            return
-        
-        # Récupérer les données
-        c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,))
-        membres = c.fetchall()
-        c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        avant_postes = c.fetchall()
-        c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,))
-        photos = c.fetchall()
-        c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        bases_premium = c.fetchall()
-        
-        # Récupérer l'avatar du créateur
-        createur_avatar_url = None
-        try:
-            createur = await client.fetch_user(tribu['proprietaire_id'])
-            if createur:
-                createur_avatar_url = createur.display_avatar.url
-        except:
-            pass
-        
-        # Créer l'embed mis à jour avec GESTION D'ERREUR
-        try:
-            embed = embed_tribu(tribu, membres, avant_postes, createur_avatar_url, photos, 0, bases_premium)
-            view = MenuFicheTribu(tribu_id, 0, timeout=None)
-        except Exception as e:
-            print(f"❌ ERREUR embed_tribu() dans rafraichir_fiche_tribu pour tribu {tribu_id}: {str(e)[:200]}")
-            print(f"⚠️ Probable: un champ dépasse 1024 caractères. Utiliser /corriger_champ")
-            return
-        
-        # Éditer le message existant
+    fiche = await charger_fiche_tribu(tribu_id)
+    
+    if not fiche:
+        return
+    tribu = fiche.tribu
+    
+    # Récupérer message_id et channel_id
+    message_id = tribu.get("message_id", 0) or 0
+    channel_id = tribu.get("channel_id", 0) or 0
+    
+    # Si pas de message existant, ne rien faire
+    if not message_id or not channel_id:
+        return
+    
+    
+    # Récupérer l'avatar du créateur
+    createur_avatar_url = await avatar_utilisateur(client, tribu['proprietaire_id'])
+    
+    # Créer l'embed mis à jour avec GESTION D'ERREUR
+    try:
+        embed = fiche.embed(createur_avatar_url)
+        view = MenuFicheTribu(tribu_id, 0, timeout=None)
+    except Exception as e:
+        print(f"❌ ERREUR embed_tribu() dans rafraichir_fiche_tribu pour tribu {tribu_id}: {str(e)[:200]}")
+        print(f"⚠️ Probable: un champ dépasse 1024 caractères. Utiliser /corriger_champ")
+        return
+    
+    # Éditer le message existant (message introuvable ou supprimé : ne rien faire)
+    await editer_fiche(client, channel_id, message_id, embed, view)
+
+# ---------- Messages publiés par le bot ----------
+# Chaque panneau ou fiche envoyé dans un salon est noté dans bot_messages : le nettoyage des anciens
+# messages se fait par ids connus (suppression groupée) au lieu de relire l'historique du salon.
+SUPPRESSION_GROUPEE_MAX_AGE = dt.timedelta(days=14)  # au-delà, Discord refuse la suppression groupée
+
+async def noter_message_bot(guild_id: int, channel_id: int, message_id: int, kind: str, ref_id: int = 0):
+    """Enregistre un message publié par le bot"""
+    await db_execute("INSERT OR REPLACE INTO bot_messages (guild_id, channel_id, message_id, kind, ref_id) "
+                     "VALUES (?, ?, ?, ?, ?)", (guild_id, channel_id, message_id, kind, ref_id))
+
+async def enregistrer_fiche(tribu_id: int, message):
+    """Mémorise la fiche publiée d'une tribu (tribus.message_id et bot_messages, même transaction)"""
+    def _enregistrer(conn):
+        conn.execute("UPDATE tribus SET message_id=?, channel_id=? WHERE id=?",
+                     (message.id, message.channel.id, tribu_id))
+        conn.execute("INSERT OR REPLACE INTO bot_messages (guild_id, channel_id, message_id, kind, ref_id) "
+                     "SELECT guild_id, ?, ?, 'fiche', id FROM tribus WHERE id=?",
+                     (message.channel.id, message.id, tribu_id))
+    await db_write(_enregistrer)
+
+async def messages_bot(guild_id: int, kind: str, ref_id: int = None, channel_id: int = None) -> list:
+    """Messages suivis d'un type donné — [(channel_id, message_id)]"""
+    sql = "SELECT channel_id, message_id FROM bot_messages WHERE guild_id=? AND kind=?"
+    params = [guild_id, kind]
+    if ref_id is not None:
+        sql += " AND ref_id=?"
+        params.append(ref_id)
+    if channel_id is not None:
+        sql += " AND channel_id=?"
+        params.append(channel_id)
+    rows = await db_fetchall(sql, tuple(params))
+    return [(row["channel_id"], row["message_id"]) for row in rows]
+
+async def _supprimer_un_par_un(channel, ids: list, priorite: int) -> tuple:
+    """Suppression message par message (aucune permission requise pour les messages du bot) — (supprimés, à oublier)"""
+    supprimes, oublies = 0, []
+    for message_id in ids:
         try:
-            channel = client.get_channel(channel_id)
-            if channel:
-                message = await channel.fetch_message(message_id)
-                await message.edit(embed=embed, view=view)
-        except:
-            # Message introuvable ou supprimé, ne rien faire
+            await sortie.executer(priorite, channel.id, "messages.delete",
+                                  channel.get_partial_message(message_id).delete)
+            supprimes += 1
+        except discord.NotFound:
             pass
+        except discord.HTTPException as e:
+            print(f"⚠️ Impossible de supprimer le message {message_id} du salon {channel.id} : {e}")
+            continue
+        oublies.append(message_id)
+    return supprimes, oublies
+
+async def supprimer_messages_bot(client, messages: list, priorite: int = PRIORITE_MAINTENANCE) -> int:
+    """Supprime des messages suivis — par lots de 100 s'ils ont moins de 14 jours et que le bot
+    a la permission Gérer les messages, sinon un par un — et les oublie"""
+    par_salon = {}
+    for channel_id, message_id in messages:
+        par_salon.setdefault(channel_id, []).append(message_id)
+    supprimes, oublies = 0, []
+    for channel_id, ids in par_salon.items():
+        channel = client.get_channel(channel_id)
+        if channel is None:
+            # Salon disparu : plus rien à suivre
+            oublies.extend((channel_id, i) for i in ids)
+            continue
+        guild = getattr(channel, "guild", None)
+        groupee = guild is not None and channel.permissions_for(guild.me).manage_messages
+        recents = [i for i in ids if groupee and age_fiche(i) < SUPPRESSION_GROUPEE_MAX_AGE]
+        unitaires = [i for i in ids if i not in recents]
+        for debut in range(0, len(recents), 100):
+            lot = recents[debut:debut + 100]
+            if len(lot) == 1:
+                unitaires += lot
+                continue
+            try:
+                await sortie.executer(priorite, channel_id, "messages.bulk_delete",
+                                      lambda: channel.delete_messages([discord.Object(id=i) for i in lot]))
+            except discord.Forbidden:
+                # Permission retirée entre-temps : repli sur la suppression unitaire
+                unitaires += lot
+                continue
+            except discord.HTTPException as e:
+                print(f"⚠️ Suppression groupée impossible dans le salon {channel_id} : {e}")
+                unitaires += lot
+                continue
+            supprimes += len(lot)
+            oublies.extend((channel_id, i) for i in lot)
+        nb, ids_oublies = await _supprimer_un_par_un(channel, unitaires, priorite)
+        supprimes += nb
+        oublies.extend((channel_id, i) for i in ids_oublies)
+    if oublies:
+        await db_write(lambda conn: conn.executemany(
+            "DELETE FROM bot_messages WHERE channel_id=? AND message_id=?", oublies))
+    return supprimes
+
+# ---------- Publication des fiches ----------
+# Une modification édite la fiche en place : un seul appel API, sans fetch_message ni
+# suppression. Elle n'est renvoyée que si le message a disparu, si le salon configuré a changé,
+# ou pour la faire remonter dans le salon quand elle a plus de FICHE_REMONTEE_HEURES (0 : jamais).
+FICHE_REMONTEE_HEURES = float(os.getenv("FICHE_REMONTEE_HEURES", "0"))
+
+async def editer_fiche(client, channel_id: int, message_id: int, embed: discord.Embed, view) -> bool:
+    """Édite la fiche publiée sans la recharger ; False si le message n'existe plus"""
+    channel = client.get_channel(channel_id)
+    if channel is None:
+        return False
+    try:
+        await sortie.executer(PRIORITE_FICHE, channel_id, "messages.edit",
+                              lambda: channel.get_partial_message(message_id).edit(embed=embed, view=view))
+    except discord.NotFound:
+        return False
+    except discord.HTTPException as e:
+        print(f"⚠️ Impossible d'éditer la fiche {message_id} : {e}")
+    return True
+
+def age_fiche(message_id: int) -> dt.timedelta:
+    """Âge d'un message, lu dans son snowflake (aucun appel API)"""
+    return discord.utils.utcnow() - discord.utils.snowflake_time(message_id)
 
 async def afficher_ou_rafraichir_fiche(client, tribu_id: int, guild, fallback_channel=None):
     """
-    Fonction pour créer une NOUVELLE fiche tribu à chaque modification.
-    - Supprime l'ancienne fiche si elle existe
-    - Crée toujours une nouvelle fiche dans le salon configuré (ou fallback_channel)
+    Met à jour la fiche tribu après une modification.
+    - Édite la fiche existante en place (un seul appel API)
+    - Ne publie une nouvelle fiche (salon configuré, ou fallback_channel) que si l'ancienne a disparu,
+      si le salon configuré a changé ou si elle a dépassé FICHE_REMONTEE_HEURES
     """
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM tribus WHERE id=?", (tribu_id,))
-        tribu = c.fetchone()
-        
-        if not tribu:
-            print(f"⚠️ Tribu {tribu_id} introuvable")
-            return
-        
-        # Récupérer les données de la tribu
-        c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,))
-        membres = c.fetchall()
-        c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        avant_postes = c.fetchall()
-        c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,))
-        photos = c.fetchall()
-        c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        bases_premium = c.fetchall()
-        
-        # Récupérer l'avatar du créateur
-        createur_avatar_url = None
-        try:
-            createur = await client.fetch_user(tribu['proprietaire_id'])
-            if createur:
-                createur_avatar_url = createur.display_avatar.url
-        except:
-            pass
-        
-        # Créer l'embed et la vue avec GESTION D'ERREUR
-        try:
-            embed = embed_tribu(tribu, membres, avant_postes, createur_avatar_url, photos, 0, bases_premium)
-            view = MenuFicheTribu(tribu_id, 0, timeout=None)
-        except Exception as e:
-            print(f"❌ ERREUR embed_tribu() pour tribu {tribu_id} ({tribu['nom']}): {str(e)[:200]}")
-            print(f"⚠️ Probable: un champ dépasse 1024 caractères. Utiliser /corriger_champ")
-            # Ne pas crasher le bot, juste arrêter la mise à jour
-            return
-        
-        # Récupérer message_id et channel_id de l'ancienne fiche
-        message_id = tribu["message_id"] if tribu["message_id"] else 0
-        channel_id = tribu["channel_id"] if tribu["channel_id"] else 0
-        
-        # Supprimer l'ancienne fiche si elle existe
-        if message_id and channel_id and channel_id != 0:
-            try:
-                channel = client.get_channel(channel_id)
-                if channel:
-                    old_message = await channel.fetch_message(message_id)
-                    await old_message.delete()
-                    print(f"🗑️ Ancienne fiche supprimée pour tribu {tribu_id}")
-            except Exception as e:
-                print(f"⚠️ Impossible de supprimer ancienne fiche: {e}")
-        
-        # Déterminer le salon cible pour la nouvelle fiche
-        target_channel = None
-        
-        # 1. Essayer le salon configuré
-        salon_config = get_config(tribu["guild_id"], "salon_fiche_tribu", "0")
-        target_channel_id = int(salon_config) if salon_config != "0" else 0
-        
-        if target_channel_id and target_channel_id != 0:
-            target_channel = client.get_channel(target_channel_id)
-            if target_channel:
-                print(f"📍 Utilisation du salon configuré: {target_channel.name}")
-        
-        # 2. Sinon, utiliser le fallback_channel (salon de l'interaction)
-        if not target_channel and fallback_channel:
-            target_channel = fallback_channel
-            print(f"📍 Utilisation du salon fallback (interaction): {target_channel.name}")
-        
-        # 3. Sinon, chercher le premier salon textuel disponible
-        if not target_channel:
-            for channel in guild.text_channels:
-                if channel.permissions_for(guild.me).send_messages:
-                    target_channel = channel
-                    print(f"📍 Utilisation du premier salon disponible: {target_channel.name}")
-                    break
-        
-        # Créer et envoyer la NOUVELLE fiche
-        if target_channel:
-            new_message = await target_channel.send(embed=embed, view=view)
-            # Sauvegarder le nouveau message_id et channel_id
-            with db_connect() as conn2:
-                c2 = conn2.cursor()
-                c2.execute("UPDATE tribus SET message_id=?, channel_id=? WHERE id=?", 
-                         (new_message.id, new_message.channel.id, tribu_id))
-                conn2.commit()
-            print(f"✅ Nouvelle fiche créée pour tribu {tribu_id} (message {new_message.id} dans canal {target_channel.name})")
+    fiche = await charger_fiche_tribu(tribu_id)
+    
+    if not fiche:
+        print(f"⚠️ Tribu {tribu_id} introuvable")
+        return
+    tribu = fiche.tribu
+    
+    # Récupérer l'avatar du créateur
+    createur_avatar_url = await avatar_utilisateur(client, tribu['proprietaire_id'])
+    
+    # Créer l'embed et la vue avec GESTION D'ERREUR
+    try:
+        embed = fiche.embed(createur_avatar_url)
+        view = MenuFicheTribu(tribu_id, 0, timeout=None)
+    except Exception as e:
+        print(f"❌ ERREUR embed_tribu() pour tribu {tribu_id} ({tribu['nom']}): {str(e)[:200]}")
+        print(f"⚠️ Probable: un champ dépasse 1024 caractères. Utiliser /corriger_champ")
+        # Ne pas crasher le bot, juste arrêter la mise à jour
+        return
+    
+    # Récupérer message_id et channel_id de l'ancienne fiche
+    message_id = tribu["message_id"] if tribu["message_id"] else 0
+    channel_id = tribu["channel_id"] if tribu["channel_id"] else 0
+    
+    salon_config = await get_config(tribu["guild_id"], "salon_fiche_tribu", "0")
+    target_channel_id = int(salon_config) if salon_config != "0" else 0
+    
+    if message_id and channel_id:
+        deplacer = target_channel_id and target_channel_id != channel_id
+        remonter = FICHE_REMONTEE_HEURES > 0 and age_fiche(message_id) > dt.timedelta(hours=FICHE_REMONTEE_HEURES)
+        if not (deplacer or remonter):
+            # Cas courant : édition en place, rien d'autre à faire
+            if await editer_fiche(client, channel_id, message_id, embed, view):
+                return
+            print(f"⚠️ Fiche de la tribu {tribu_id} introuvable, nouvelle publication")
         else:
-            error_msg = f"Aucun salon accessible trouvé pour créer la fiche tribu {tribu_id}"
-            print(f"❌ {error_msg}")
-            raise Exception(error_msg)
+            # Supprimer les fiches suivies (sans les recharger) avant de republier
+            anciennes = await messages_bot(tribu["guild_id"], "fiche", tribu_id)
+            if await supprimer_messages_bot(client, anciennes, PRIORITE_FICHE):
+                print(f"🗑️ Ancienne fiche supprimée pour tribu {tribu_id}")
+    
+    # Déterminer le salon cible pour la nouvelle fiche
+    target_channel = None
+    
+    # 1. Essayer le salon configuré
+    if target_channel_id and target_channel_id != 0:
+        target_channel = client.get_channel(target_channel_id)
+        if target_channel:
+            print(f"📍 Utilisation du salon configuré: {target_channel.name}")
+    
+    # 2. Sinon, utiliser le fallback_channel (salon de l'interaction)
+    if not target_channel and fallback_channel:
+        target_channel = fallback_channel
+        print(f"📍 Utilisation du salon fallback (interaction): {target_channel.name}")
+    
+    # 3. Sinon, chercher le premier salon textuel disponible
+    if not target_channel:
+        for channel in guild.text_channels:
+            if channel.permissions_for(guild.me).send_messages:
+                target_channel = channel
+                print(f"📍 Utilisation du premier salon disponible: {target_channel.name}")
+                break
+    
+    # Créer et envoyer la NOUVELLE fiche
+    if target_channel:
+        new_message = await sortie.executer(PRIORITE_FICHE, target_channel.id, "messages.send",
+                                            lambda: target_channel.send(embed=embed, view=view))
+        # Sauvegarder le nouveau message_id et channel_id
+        await enregistrer_fiche(tribu_id, new_message)
+        print(f"✅ Nouvelle fiche créée pour tribu {tribu_id} (message {new_message.id} dans canal {target_channel.name})")
+    else:
+        error_msg = f"Aucun salon accessible trouvé pour créer la fiche tribu {tribu_id}"
+        print(f"❌ {error_msg}")
+        raise Exception(error_msg)
+
+# ---------- Rafraîchissements groupés ----------
+FICHE_DELAI_MS = int(os.getenv("FICHE_DELAI_MS", "750"))
+
+class PlanificateurFiches:
+    """Rafraîchissements de fiches regroupés par tribu : les demandes reçues pendant la fenêtre
+    (ou pendant un rafraîchissement en cours) n'en déclenchent qu'un seul, sur l'état le plus récent"""
+    def __init__(self, delai_ms: float):
+        self.delai = delai_ms / 1000
+        self._demandes = {}  # tribu_id -> (client, guild, fallback_channel) de la dernière demande
+        self._taches = {}  # tribu_id -> Task
+        self.stats = {"demandes": 0, "regroupees": 0, "rafraichissements": 0, "erreurs": 0}
+    
+    def demander(self, client, tribu_id: int, guild, fallback_channel=None):
+        """Programme le rafraîchissement et rend la main immédiatement"""
+        self.stats["demandes"] += 1
+        if tribu_id in self._demandes:
+            self.stats["regroupees"] += 1
+        self._demandes[tribu_id] = (client, guild, fallback_channel)
+        if tribu_id not in self._taches:
+            self._taches[tribu_id] = asyncio.create_task(self._rafraichir(tribu_id))
+    
+    async def _rafraichir(self, tribu_id: int):
+        try:
+            # Une demande arrivée pendant le rafraîchissement relance un tour (fenêtre comprise)
+            while tribu_id in self._demandes:
+                await asyncio.sleep(self.delai)
+                client, guild, fallback_channel = self._demandes.pop(tribu_id)
+                try:
+                    await afficher_ou_rafraichir_fiche(client, tribu_id, guild, fallback_channel)
+                    self.stats["rafraichissements"] += 1
+                except Exception as e:
+                    self.stats["erreurs"] += 1
+                    print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {tribu_id}: {e}")
+        finally:
+            self._taches.pop(tribu_id, None)
+    
+    def resume(self) -> dict:
+        return {**self.stats, "en_attente": len(self._demandes)}
+
+planificateur_fiches = PlanificateurFiches(FICHE_DELAI_MS)
 
 # ---------- Commandes slash standalone ----------
 
@@ -2697,10 +4684,10 @@ async def tribu_creer(
     map_base: str,
     coords_base: str
 ):
-    if tribu_par_nom(inter.guild_id, nom):
+    if await tribu_par_nom(inter.guild_id, nom):
         await inter.response.send_message("❌ Ce nom de tribu est déjà pris sur ce serveur.", ephemeral=True)
         return
-    with db_connect() as conn:
+    def _creer(conn):
         c = conn.cursor()
         c.execute("""
             INSERT INTO tribus (guild_id, nom, description, base, map_base, coords_base, proprietaire_id, created_at)
@@ -2718,9 +4705,10 @@ async def tribu_creer(
         tribu_id = c.lastrowid
         c.execute("INSERT OR REPLACE INTO membres (tribu_id, user_id, role, manager) VALUES (?, ?, ?, 1)",
                   (tribu_id, inter.user.id, "Chef",))
-        conn.commit()
         c.execute("SELECT * FROM tribus WHERE id=?", (tribu_id,))
-        row = c.fetchone()
+        return c.fetchone()
+    
+    row = await db_write(_creer)
     
     embed = embed_tribu(row)
     embed.set_footer(text="ℹ️ Utilisez le panneau de la fiche tribu pour ajouter des membres et des avant-postes")
@@ -2728,23 +4716,32 @@ async def tribu_creer(
 
 @tribu_creer.autocomplete('map_base')
 async def map_autocomplete(inter: discord.Interaction, current: str):
-    return get_maps_choices(inter.guild_id)
+    return await get_maps_choices(inter.guild_id)
 
 async def autocomplete_tribus(inter: discord.Interaction, current: str):
     """Autocomplétion pour les noms de tribus"""
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT nom FROM tribus WHERE guild_id=? ORDER BY LOWER(nom) ASC", (inter.guild_id,))
-        tribus = [row["nom"] for row in c.fetchall()]
-    
-    # Filtrer selon ce que l'utilisateur tape
-    if current:
-        filtered = [t for t in tribus if current.lower() in t.lower()]
-    else:
-        filtered = tribus
+    tribus = await rechercher_noms_tribus(inter.guild_id, current)
     
     # Discord limite à 25 choix
-    return [app_commands.Choice(name=t, value=t) for t in filtered[:25]]
+    return [app_commands.Choice(name=t, value=t) for t in tribus[:25]]
+
+@tree.command(name="rechercher_tribu", description="Rechercher une tribu (nom, description, devise, objectif, membres)")
+@app_commands.describe(texte="Mots à chercher (ex: spino, raptor_killer)")
+async def rechercher_tribu(inter: discord.Interaction, texte: str):
+    resultats = await rechercher_tribus(inter.guild_id, texte)
+    if not resultats:
+        await inter.response.send_message(f"🔍 Aucune tribu ne correspond à **{texte[:100]}**.", ephemeral=True)
+        return
+    
+    lines = []
+    for i, r in enumerate(resultats, start=1):
+        lines.append(f"**{i}. {r['nom']}**")
+        if r["extrait"] and r["extrait"] != r["nom"]:
+            lines.append(f"  ↳ {r['extrait'][:200]}")
+    
+    e = discord.Embed(title=f"🔍 Recherche — {texte[:100]}", description="\n".join(lines)[:4096], color=0x5865F2)
+    e.set_footer(text="💡 Utilise /fiche_tribu ou /ma_tribu pour afficher une fiche")
+    await inter.response.send_message(embed=e, ephemeral=True)
 
 @tree.command(name="fiche_tribu", description="[ADMIN/MODO] Afficher la fiche d'une tribu dans le salon actuel")
 @app_commands.describe(nom="Nom de la tribu")
@@ -2757,36 +4754,24 @@ async def fiche_tribu(inter: discord.Interaction, nom: str):
         await inter.followup.send("❌ Cette commande est réservée aux admins et modos.", ephemeral=True)
         return
     
-    row = tribu_par_nom(inter.guild_id, nom)
+    row = await tribu_par_nom(inter.guild_id, nom)
     if not row:
         await inter.followup.send("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
         return
     
     # Récupérer toutes les données de la tribu
     tribu_id = row["id"]
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM membres WHERE tribu_id=? ORDER BY manager DESC, user_id ASC", (tribu_id,))
-        membres = c.fetchall()
-        c.execute("SELECT * FROM avant_postes WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        avant_postes = c.fetchall()
-        c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (tribu_id,))
-        photos = c.fetchall()
-        c.execute("SELECT * FROM bases_premium WHERE tribu_id=? ORDER BY created_at DESC", (tribu_id,))
-        bases_premium = c.fetchall()
+    fiche = await charger_fiche_tribu(tribu_id)
+    if not fiche:
+        await inter.followup.send("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
+        return
     
     # Récupérer l'avatar du créateur
-    createur_avatar_url = None
-    try:
-        createur = await inter.client.fetch_user(row['proprietaire_id'])
-        if createur:
-            createur_avatar_url = createur.display_avatar.url
-    except:
-        pass
+    createur_avatar_url = await avatar_utilisateur(inter.client, row['proprietaire_id'])
     
     # Créer l'embed et la vue avec gestion d'erreur
     try:
-        embed = embed_tribu(row, membres, avant_postes, createur_avatar_url, photos, 0, bases_premium)
+        embed = fiche.embed(createur_avatar_url)
         view = MenuFicheTribu(tribu_id, 0, timeout=None)
     except Exception as e:
         await inter.followup.send(
@@ -2801,29 +4786,18 @@ async def fiche_tribu(inter: discord.Interaction, nom: str):
     
     # 🗑️ SUPPRIMER L'ANCIENNE FICHE si elle existe
     if inter.guild:
-        old_message_id = row.get("message_id", 0) or 0
-        old_channel_id = row.get("channel_id", 0) or 0
-        
-        if old_message_id and old_channel_id:
-            try:
-                old_channel = inter.guild.get_channel(old_channel_id)
-                if old_channel and hasattr(old_channel, 'fetch_message'):
-                    old_message = await old_channel.fetch_message(old_message_id)
-                    await old_message.delete()
-                    print(f"🗑️ Ancienne fiche supprimée (message {old_message_id})")
-            except Exception as e:
-                print(f"⚠️ Impossible de supprimer l'ancienne fiche: {e}")
+        # Toutes les fiches suivies de la tribu (l'ancienne et d'éventuels doublons)
+        nb = await supprimer_messages_bot(inter.client, await messages_bot(inter.guild_id, "fiche", tribu_id),
+                                          PRIORITE_INTERACTION)
+        if nb:
+            print(f"🗑️ {nb} ancienne(s) fiche(s) supprimée(s) pour tribu {tribu_id}")
     
     # Envoyer la nouvelle fiche dans le salon actuel avec gestion d'erreur
     try:
         msg = await inter.followup.send(embed=embed, view=view, wait=True)
         
         # Sauvegarder le nouveau message_id et channel_id
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("UPDATE tribus SET message_id=?, channel_id=? WHERE id=?", 
-                     (msg.id, msg.channel.id, tribu_id))
-            conn.commit()
+        await enregistrer_fiche(tribu_id, msg)
     except Exception as e:
         await inter.followup.send(
             f"❌ **Erreur lors de l'envoi de la fiche**\n\n"
@@ -2844,35 +4818,33 @@ async def tribu_transferer(inter: discord.Interaction, nom: str, nouveau_proprio
     # DEFER immédiatement pour éviter le timeout
     await inter.response.defer(ephemeral=True)
     
-    row = tribu_par_nom(inter.guild_id, nom)
+    row = await tribu_par_nom(inter.guild_id, nom)
     if not row:
         await inter.followup.send("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
         return
     if not (est_admin(inter) or inter.user.id == row["proprietaire_id"]):
         await inter.followup.send("❌ Seul le propriétaire actuel (ou un admin) peut transférer la tribu.", ephemeral=True)
         return
-    with db_connect() as conn:
+    def _transferer(conn):
         c = conn.cursor()
         c.execute("UPDATE tribus SET proprietaire_id=? WHERE id=?", (nouveau_proprio.id, row["id"]))
         c.execute("INSERT OR REPLACE INTO membres (tribu_id, user_id, role, manager) VALUES (?, ?, ?, 1)",
                   (row["id"], nouveau_proprio.id, "Chef",))
-        conn.commit()
     
-    ajouter_historique(row["id"], inter.user.id, "Transfert propriété", f"Nouveau propriétaire: <@{nouveau_proprio.id}>")
+    await db_write(_transferer)
+    
+    await ajouter_historique(row["id"], inter.user.id, "Transfert propriété", f"Nouveau propriétaire: <@{nouveau_proprio.id}>")
     
     # Répondre AVANT le rafraîchissement
     await inter.followup.send(f"✅ **Propriété de {row['nom']} transférée à <@{nouveau_proprio.id}> !**", ephemeral=True)
     
     # Rafraîchir la fiche APRÈS avoir répondu
-    try:
-        await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-    except Exception as e:
-        await inter.followup.send(f"⚠️ **Note** : Tribu transférée mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+    planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
 
 @tree.command(name="tribu_supprimer", description="Supprimer une tribu (confirmation requise)")
 @app_commands.describe(nom="Nom de la tribu", confirmation="Retape exactement le nom pour confirmer")
 async def tribu_supprimer(inter: discord.Interaction, nom: str, confirmation: str):
-    row = tribu_par_nom(inter.guild_id, nom)
+    row = await tribu_par_nom(inter.guild_id, nom)
     if not row:
         await inter.response.send_message("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
         return
@@ -2881,29 +4853,23 @@ async def tribu_supprimer(inter: discord.Interaction, nom: str, confirmation: st
     if confirmation.lower() != nom.lower():
         await inter.response.send_message("❌ Confirmation incorrecte. Opération annulée.", ephemeral=True)
         return
-    with db_connect() as conn:
+    def _supprimer(conn):
+        # membres, avant-postes, photos, bases premium, progression et historique suivent par ON DELETE CASCADE
         c = conn.cursor()
         c.execute("DELETE FROM tribus WHERE id=?", (row["id"],))
-        c.execute("DELETE FROM membres WHERE tribu_id=?", (row["id"],))
-        conn.commit()
+        c.execute("DELETE FROM historique_archive WHERE tribu_id=?", (row["id"],))
+        c.execute("DELETE FROM bot_messages WHERE kind='fiche' AND ref_id=?", (row["id"],))
+    
+    await db_write(_supprimer)
+    _historique_totaux.pop(row["id"], None)
     await inter.response.send_message(f"🗑️ La tribu **{nom}** a été supprimée.")
 
 @tribu_supprimer.autocomplete('nom')
 async def tribu_supprimer_autocomplete(inter: discord.Interaction, current: str):
-    with db_connect() as conn:
-        c = conn.cursor()
-        
-        # Si admin ou modo, afficher toutes les tribus
-        if est_admin_ou_modo(inter):
-            c.execute("SELECT nom FROM tribus WHERE guild_id=? ORDER BY LOWER(nom) ASC", (inter.guild_id,))
-        else:
-            # Sinon, afficher seulement les tribus où l'utilisateur est propriétaire ou manager
-            c.execute("""
-                SELECT DISTINCT t.nom FROM tribus t
-                LEFT JOIN membres m ON t.id = m.tribu_id
-                WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
-                ORDER BY LOWER(t.nom) ASC
-            """, (inter.guild_id, inter.user.id, inter.user.id))
+    # Si admin ou modo, afficher toutes les tribus, sinon seulement celles où l'utilisateur est propriétaire ou manager
+    gere_par = None if est_admin_ou_modo(inter) else inter.user.id
+    tribus = await rechercher_noms_tribus(inter.guild_id, current, gere_par)
+    return [app_commands.Choice(name=t, value=t) for t in tribus[:25]]
 
 
 @tree.command(name="corriger_champ", description="[ADMIN/MODO] Corriger un champ de tribu qui dépasse la limite Discord")
@@ -2931,26 +4897,20 @@ async def corriger_champ(inter: discord.Interaction, nom: str, champ: str, nouve
         await inter.followup.send(f"❌ Le texte est trop long ({len(nouveau_texte)} caractères). Maximum : 1024 caractères.\n\n**Astuce** : Coupe ton texte pour qu'il fasse moins de 1024 caractères.", ephemeral=True)
         return
     
-    row = tribu_par_nom(inter.guild_id, nom)
+    row = await tribu_par_nom(inter.guild_id, nom)
     if not row:
         await inter.followup.send("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
         return
     
     # Mettre à jour le champ
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute(f"UPDATE tribus SET {champ}=? WHERE id=?", (nouveau_texte, row["id"]))
-        conn.commit()
+    await db_execute(f"UPDATE tribus SET {champ}=? WHERE id=?", (nouveau_texte, row["id"]))
     
-    ajouter_historique(row["id"], inter.user.id, f"Correction {champ}", f"Texte corrigé par admin ({len(nouveau_texte)} caractères)")
+    await ajouter_historique(row["id"], inter.user.id, f"Correction {champ}", f"Texte corrigé par admin ({len(nouveau_texte)} caractères)")
     
     await inter.followup.send(f"✅ **Champ `{champ}` de la tribu {row['nom']} corrigé !**\n\n📝 Nouveau texte ({len(nouveau_texte)} caractères) :\n```\n{nouveau_texte[:500]}{'...' if len(nouveau_texte) > 500 else ''}\n```", ephemeral=True)
     
     # Rafraîchir la fiche
-    try:
-        await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-    except Exception as e:
-        await inter.followup.send(f"⚠️ Champ corrigé mais fiche non rafraîchie. Utilise `/fiche_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+    planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
 
 
 
@@ -2958,20 +4918,233 @@ async def corriger_champ(inter: discord.Interaction, nom: str, champ: str, nouve
 async def tribu_test(inter: discord.Interaction):
     await inter.response.send_message("🐔 Tout roule ma poule")
 
+@tree.command(name="historique_archive", description="[ADMIN/MODO] Consulter l'historique archivé d'une tribu")
+@app_commands.describe(
+    nom="Nom de la tribu",
+    avant="Seulement les entrées antérieures à cette date (JJ/MM/AAAA, optionnel)",
+    nombre="Nombre d'entrées à afficher (20 par défaut)"
+)
+@app_commands.autocomplete(nom=autocomplete_tribus)
+async def historique_archive(inter: discord.Interaction, nom: str, avant: Optional[str] = None, nombre: app_commands.Range[int, 1, 50] = 20):
+    if not est_admin_ou_modo(inter):
+        await inter.response.send_message("❌ Cette commande est réservée aux admins et modos.", ephemeral=True)
+        return
+    
+    row = await tribu_par_nom(inter.guild_id, nom)
+    if not row:
+        await inter.response.send_message("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
+        return
+    
+    avant_iso = None
+    if avant:
+        try:
+            avant_iso = dt.datetime.strptime(avant.strip(), "%d/%m/%Y").isoformat()
+        except ValueError:
+            await inter.response.send_message("❌ Date invalide. Format attendu : JJ/MM/AAAA.", ephemeral=True)
+            return
+    
+    await inter.response.defer(ephemeral=True)
+    total, entrees = await lire_archive_historique(row["id"], avant_iso, nombre)
+    if not entrees:
+        await inter.followup.send("🗄️ Aucune entrée archivée pour cette tribu.", ephemeral=True)
+        return
+    
+    lines = []
+    for _, user_id, action, details, created_at in entrees:
+        date = dt.datetime.fromisoformat(created_at).strftime("%d/%m/%y %H:%M")
+        lines.append(f"**{date}** — <@{user_id}>\n  ↳ {action}")
+        if details:
+            lines.append(f"  _{details}_")
+    
+    e = discord.Embed(title=f"🗄️ Historique archivé — {row['nom']}", description="\n".join(lines)[:4096], color=0x5865F2)
+    e.set_footer(text=f"{len(entrees)} entrées affichées • {total} archivées au total")
+    await inter.followup.send(embed=e, ephemeral=True)
+
+@tree.command(name="stats_db", description="[ADMIN] Métriques de la base de données")
+async def stats_db(inter: discord.Interaction):
+    if not est_admin(inter):
+        await inter.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+    
+    e = discord.Embed(title="📊 Base de données", color=0xFF9900)
+    for nom, pool in (("Tribus", db_pool), ("Arki Identité", identite_db_pool)):
+        lignes = []
+        for sorte, s in pool.resume().items():
+            lignes.append(f"**{sorte}** : {s['checkouts']} checkouts — attente moy. {s['attente_moy_ms']:.2f} ms, max {s['attente_max_ms']:.2f} ms")
+        e.add_field(name=f"Pool {nom} (1 écrivain + {pool.nb_lecteurs} lecteurs)", value="\n".join(lignes), inline=False)
+    
+    for nom, ecrivain in (("Tribus", db_ecrivain), ("Arki Identité", identite_db_ecrivain)):
+        s = ecrivain.resume()
+        e.add_field(
+            name=f"Group commit {nom}",
+            value=(f"{s['lots']} lots / {s['mutations']} mutations — taille moy. {s['taille_moy']:.1f}, max {s['taille_max']}\n"
+                   f"Latence commit moy. {s['latence_moy_ms']:.2f} ms, max {s['latence_max_ms']:.2f} ms — en attente : {s['en_attente']}"),
+            inline=False
+        )
+    
+    # Bases par serveur résumées en un seul champ (limite de 25 champs par embed)
+    for base, operations in resume_maintenance().items():
+        if base.startswith("serveur "):
+            continue
+        e.add_field(
+            name=f"Maintenance {base}",
+            value="\n".join(f"**{op}** : {s['passages']}× — dernier {s['dernier_ms']:.1f} ms, max {s['max_ms']:.1f} ms ({s['le']})"
+                            for op, s in sorted(operations.items())),
+            inline=False
+        )
+    
+    if DB_SHARDS:
+        s = resume_maintenance_serveurs()
+        lignes = [f"{len(routage.ouvertes())}/{routage.ouvertes_max} ouvertes — {routage.ouvertures} ouvertures, {routage.fermetures} fermetures"]
+        lignes += [f"**{op}** : {o['passages']}× sur {o['bases']} bases — max {o['max_ms']:.1f} ms"
+                   for op, o in sorted(s["operations"].items())]
+        if s["wal_max_serveur"] is not None:
+            lignes.append(f"Plus gros WAL : {s['wal_max_octets'] / 1024 / 1024:.1f} Mo (serveur {s['wal_max_serveur']})")
+        if s["dernier_echec"]:
+            f = s["dernier_echec"]
+            lignes.append(f"⚠️ Dernier échec : {f['operation']} sur {f['base']} ({f['le']}) — {str(f['resultat'])[:200]}")
+        e.add_field(name="Bases par serveur", value="\n".join(lignes)[:1024], inline=False)
+    
+    s = resume_catalogues()
+    e.add_field(name="Cache des catalogues",
+                value=f"{s['catalogues']} catalogues en cache — {s['hits']} hits / {s['miss']} miss ({s['taux']:.0%})",
+                inline=False)
+    
+    s = resume_config()
+    e.add_field(name="Cache de configuration",
+                value=f"{s['serveurs']} serveurs en cache — {s['hits']} hits / {s['miss']} miss ({s['taux']:.0%})",
+                inline=False)
+    
+    s = _profils.resume()
+    e.add_field(name="Cache des profils",
+                value=f"{s['entrees']}/{s['taille']} entrées — {s['hits']} hits / {s['miss']} miss ({s['taux']:.0%})",
+                inline=False)
+    
+    s = resume_cartes()
+    f, c = s["fiches"], s["cartes"]
+    e.add_field(name="Cache des fiches",
+                value=f"Fiches : {f['entrees']}/{f['taille']} — {f['hits']} hits / {f['miss']} miss ({f['taux']:.0%})\n"
+                      f"Embeds : {c['entrees']}/{c['taille']} — {c['hits']} hits / {c['miss']} miss ({c['taux']:.0%})\n"
+                      f"{s['tribus_suivies']} tribus suivies",
+                inline=False)
+    
+    s = resume_avatars()
+    e.add_field(name="Avatars",
+                value=f"Gateway : {s['gateway']} — cache : {s['cache']} ({s['entrees']} entrées) — "
+                      f"REST : {s['rest']} (+{s['regroupes']} regroupés, {s['erreurs']} erreurs)",
+                inline=False)
+    
+    s = sortie.resume()
+    e.add_field(name="File d'envoi Discord",
+                value=f"{s['en_cours']}/{s['concurrence']} en cours\n" + "\n".join(
+                    f"{voie} : {v['profondeur']} en file — {v['requetes']} requêtes, "
+                    f"attente moy {v['attente_moy_ms']:.1f} ms / max {v['attente_max_ms']:.1f} ms"
+                    for voie, v in s["voies"].items()),
+                inline=False)
+    
+    s = planificateur_fiches.resume()
+    e.add_field(name="Rafraîchissements de fiches",
+                value=f"{s['demandes']} demandes — {s['rafraichissements']} rafraîchissements, "
+                      f"{s['regroupees']} regroupées, {s['erreurs']} erreurs, {s['en_attente']} en attente",
+                inline=False)
+    
+    s = resume_index_noms()
+    e.add_field(name="Index des noms (autocomplétion)",
+                value=f"{s['noms']} noms sur {s['serveurs']} serveur(s)" if INDEX_NOMS else "Désactivé (FTS5)",
+                inline=False)
+    
+    s = _droits.resume()
+    e.add_field(name="Cache des droits",
+                value=f"{s['entrees']}/{s['taille']} entrées — {s['hits']} hits / {s['miss']} miss ({s['taux']:.0%}), "
+                      f"TTL {DROITS_TTL:g} s",
+                inline=False)
+    
+    rows = await db_fetchall("SELECT kind, COUNT(*) AS nb FROM bot_messages WHERE guild_id=? GROUP BY kind",
+                             (inter.guild_id,))
+    e.add_field(name="Messages suivis",
+                value=", ".join(f"{row['kind']} : {row['nb']}" for row in rows) or "Aucun",
+                inline=False)
+    
+    await inter.response.send_message(embed=e, ephemeral=True)
+
+
+
+@tree.command(name="exporter_tribus", description="Exporter toutes les tribus du serveur (Admin)")
+@app_commands.describe(format="JSON Lines (restauration complète) ou CSV (tableur)")
+@app_commands.choices(format=[
+    app_commands.Choice(name="JSON Lines", value="jsonl"),
+    app_commands.Choice(name="CSV", value="csv"),
+])
+async def exporter_tribus(inter: discord.Interaction, format: str = "jsonl"):
+    if not est_admin(inter):
+        await inter.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+    await inter.response.defer(ephemeral=True)
+    
+    # TemporaryDirectory : nettoyé même si l'export échoue avant d'avoir créé le fichier
+    with tempfile.TemporaryDirectory(prefix="arki_export_") as dossier:
+        chemin = os.path.join(dossier, f"tribus_{inter.guild_id}.{format}")
+        try:
+            debut = time.perf_counter()
+            comptes = await exporter_serveur(inter.guild_id, chemin)
+            taille = os.path.getsize(chemin)
+            if taille > inter.guild.filesize_limit:
+                await inter.followup.send(f"❌ L'export fait {taille / 1024 / 1024:.1f} Mo, au-delà de la limite Discord du serveur. "
+                                          f"Utilise `python main.py --exporter {inter.guild_id} <fichier>` sur l'hébergement.", ephemeral=True)
+                return
+            await inter.followup.send(
+                f"✅ Export terminé en {time.perf_counter() - debut:.1f} s : {resume_import_export(comptes) or 'aucune tribu'}.",
+                file=discord.File(chemin), ephemeral=True
+            )
+        except Exception as e:
+            print(f"⚠️ Échec de l'export des tribus du serveur {inter.guild_id} : {e}")
+            await inter.followup.send(f"❌ Échec de l'export : {str(e)[:300]}", ephemeral=True)
 
+@tree.command(name="importer_tribus", description="Importer des tribus depuis un export JSON Lines ou CSV (Admin)")
+@app_commands.describe(fichier="Fichier produit par /exporter_tribus (.jsonl ou .csv)")
+async def importer_tribus(inter: discord.Interaction, fichier: discord.Attachment):
+    if not est_admin(inter):
+        await inter.response.send_message("❌ Cette commande est réservée aux administrateurs.", ephemeral=True)
+        return
+    if not fichier.filename.lower().endswith((".jsonl", ".json", ".csv")):
+        await inter.response.send_message("❌ Le fichier doit être un export `.jsonl` ou `.csv`.", ephemeral=True)
+        return
+    await inter.response.defer(ephemeral=True)
+    
+    dernier_affichage = [0.0]
+    
+    async def progression(comptes, fraction):
+        # Pas plus d'une mise à jour toutes les 2 secondes (limites Discord)
+        if time.monotonic() - dernier_affichage[0] < 2:
+            return
+        dernier_affichage[0] = time.monotonic()
+        await inter.edit_original_response(content=f"⏳ Import en cours… {fraction:.0%} — {resume_import_export(comptes)}")
+    
+    with tempfile.TemporaryDirectory(prefix="arki_import_") as dossier:
+        chemin = os.path.join(dossier, os.path.basename(fichier.filename))
+        try:
+            await fichier.save(chemin)
+            debut = time.perf_counter()
+            comptes = await importer_serveur(inter.guild_id, chemin, progression)
+            await inter.edit_original_response(
+                content=f"✅ Import terminé en {time.perf_counter() - debut:.1f} s : {resume_import_export(comptes) or 'rien à importer'}.\n"
+                        f"💡 Les tribus dont le nom existe déjà sur le serveur sont ignorées."
+            )
+        except (ValueError, KeyError) as e:
+            await inter.edit_original_response(content=f"❌ Fichier d'export invalide : {e}")
+        except Exception as e:
+            print(f"⚠️ Échec de l'import des tribus du serveur {inter.guild_id} : {e}")
+            await inter.edit_original_response(content=f"❌ Échec de l'import : {str(e)[:300]}")
 
 @tree.command(name="mon_nom_ingame", description="Ajouter ou modifier ton nom In Game")
 @app_commands.describe(nom_ingame="Ton nom dans le jeu (ex: Raptor_Killer42)")
 async def mon_nom_ingame(inter: discord.Interaction, nom_ingame: str):
     # Trouver les tribus dont l'utilisateur est membre
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("""
-            SELECT t.id, t.nom FROM tribus t
-            JOIN membres m ON t.id = m.tribu_id
-            WHERE t.guild_id = ? AND m.user_id = ?
-        """, (inter.guild_id, inter.user.id))
-        tribus = c.fetchall()
+    tribus = await db_fetchall("""
+        SELECT t.id, t.nom FROM tribus t
+        JOIN membres m ON t.id = m.tribu_id
+        WHERE t.guild_id = ? AND m.user_id = ?
+    """, (inter.guild_id, inter.user.id))
     
     if not tribus:
         await inter.response.send_message("❌ Tu n'es membre d'aucune tribu.", ephemeral=True)
@@ -2979,16 +5152,17 @@ async def mon_nom_ingame(inter: discord.Interaction, nom_ingame: str):
     
     # Mettre à jour le nom in-game pour toutes les tribus dont l'utilisateur est membre
     nom_ingame_clean = nom_ingame.strip()
-    with db_connect() as conn:
+    def _renommer(conn):
         c = conn.cursor()
         for tribu in tribus:
             c.execute("UPDATE membres SET nom_in_game = ? WHERE tribu_id = ? AND user_id = ?",
                      (nom_ingame_clean, tribu["id"], inter.user.id))
-        conn.commit()
+    
+    await db_write(_renommer)
     
     # Ajouter à l'historique pour chaque tribu
     for tribu in tribus:
-        ajouter_historique(tribu["id"], inter.user.id, "Mise à jour nom in-game", f"Nom in-game: {nom_ingame_clean}")
+        await ajouter_historique(tribu["id"], inter.user.id, "Mise à jour nom in-game", f"Nom in-game: {nom_ingame_clean}")
     
     if len(tribus) == 1:
         await inter.response.send_message(f"✅ Ton nom in-game **{nom_ingame_clean}** a été mis à jour dans la tribu **{tribus[0]['nom']}** !", ephemeral=True)
@@ -2998,14 +5172,11 @@ async def mon_nom_ingame(inter: discord.Interaction, nom_ingame: str):
 
 @tree.command(name="quitter_tribu", description="Quitter ta tribu")
 async def quitter_tribu(inter: discord.Interaction):
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("""
-            SELECT t.* FROM tribus t
-            JOIN membres m ON t.id = m.tribu_id
-            WHERE t.guild_id = ? AND m.user_id = ?
-        """, (inter.guild_id, inter.user.id))
-        tribus = c.fetchall()
+    tribus = await db_fetchall("""
+        SELECT t.* FROM tribus t
+        JOIN membres m ON t.id = m.tribu_id
+        WHERE t.guild_id = ? AND m.user_id = ?
+    """, (inter.guild_id, inter.user.id))
     
     if not tribus:
         await inter.response.send_message("❌ Tu n'es membre d'aucune tribu.", ephemeral=True)
@@ -3022,12 +5193,9 @@ async def quitter_tribu(inter: discord.Interaction):
         await inter.response.send_message("❌ Le référent tribu ne peut pas quitter. Utilise `/tribu_transférer` d'abord.", ephemeral=True)
         return
     
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("DELETE FROM membres WHERE tribu_id=? AND user_id=?", (tribu["id"], inter.user.id))
-        conn.commit()
+    await db_execute("DELETE FROM membres WHERE tribu_id=? AND user_id=?", (tribu["id"], inter.user.id))
     
-    ajouter_historique(tribu["id"], inter.user.id, "Quitter tribu", f"<@{inter.user.id}> a quitté la tribu")
+    await ajouter_historique(tribu["id"], inter.user.id, "Quitter tribu", f"<@{inter.user.id}> a quitté la tribu")
     await inter.response.send_message(f"✅ Tu as quitté la tribu **{tribu['nom']}**.", ephemeral=True)
 
 
@@ -3063,7 +5231,7 @@ async def changer_banniere_panneau(inter: discord.Interaction, url: Optional[str
         source = "🔗 depuis une URL"
     
     # Sauvegarder la nouvelle bannière
-    set_config(inter.guild_id, "banniere_panneau", banniere_url)
+    await set_config(inter.guild_id, "banniere_panneau", banniere_url)
     
     await inter.response.send_message(f"✅ **Bannière du panneau modifiée !** {source}\n\n💡 *Utilise `/panneau` pour voir le résultat.*", ephemeral=True)
 
@@ -3073,31 +5241,20 @@ async def ma_tribu(inter: discord.Interaction):
     await inter.response.defer(ephemeral=True)
     
     # Trouver la tribu de l'utilisateur
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("""
-            SELECT t.* FROM tribus t
-            LEFT JOIN membres m ON t.id = m.tribu_id
-            WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR m.user_id = ?)
-        """, (inter.guild_id, inter.user.id, inter.user.id))
-        row = c.fetchone()
+    row = await db_fetchone("""
+        SELECT t.* FROM tribus t
+        LEFT JOIN membres m ON t.id = m.tribu_id
+        WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR m.user_id = ?)
+    """, (inter.guild_id, inter.user.id, inter.user.id))
     
     if not row:
         await inter.followup.send("❌ Tu ne fais partie d'aucune tribu. Utilise `/panneau` pour créer ou rejoindre une tribu !", ephemeral=True)
         return
     
     # Supprimer l'ancienne fiche si elle existe dans ce même salon
-    if row["message_id"] and row["channel_id"] == inter.channel_id:
-        try:
-            channel = bot.get_channel(row["channel_id"])
-            if channel:
-                message = await channel.fetch_message(row["message_id"])
-                await message.delete()
-                print(f"✅ Ancienne fiche de '{row['nom']}' supprimée du salon {inter.channel_id}")
-        except discord.NotFound:
-            print(f"⚠️ Ancienne fiche introuvable (déjà supprimée)")
-        except Exception as e:
-            print(f"⚠️ Erreur lors de la suppression de l'ancienne fiche : {e}")
+    anciennes = await messages_bot(inter.guild_id, "fiche", row["id"], channel_id=inter.channel_id)
+    if await supprimer_messages_bot(bot, anciennes, PRIORITE_INTERACTION):
+        print(f"✅ Ancienne fiche de '{row['nom']}' supprimée du salon {inter.channel_id}")
     
     # Afficher la nouvelle fiche de la tribu
     await afficher_fiche(inter, row["id"], ephemeral=False)
@@ -3154,10 +5311,7 @@ async def aide(inter: discord.Interaction):
 async def save_test(inter: discord.Interaction, texte: str):
     """Commande de test pour enregistrer une donnée dans la base Arki Identité"""
     try:
-        with identite_db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO users (user_id, data) VALUES (?, ?)", (str(inter.user.id), texte))
-            conn.commit()
+        await maj_profil(inter.user.id, {"data": texte})
         await inter.response.send_message(
             f"✅ **Donnée sauvegardée pour {inter.user.display_name}**\n📝 Contenu : `{texte}`", 
             ephemeral=True
@@ -3169,14 +5323,11 @@ async def save_test(inter: discord.Interaction, texte: str):
 async def show_test(inter: discord.Interaction):
     """Commande de test pour afficher la dernière donnée enregistrée dans Arki Identité"""
     try:
-        with identite_db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT data FROM users WHERE user_id = ? ORDER BY rowid DESC LIMIT 1", (str(inter.user.id),))
-            result = cursor.fetchone()
+        profil = await lire_profil(inter.user.id)
         
-        if result:
+        if profil and "data" in profil.champs:
             await inter.response.send_message(
-                f"📦 **Dernière donnée enregistrée**\n`{result[0]}`", 
+                f"📦 **Dernière donnée enregistrée** (version {profil.version})\n`{profil.champs['data']}`", 
                 ephemeral=True
             )
         else:
@@ -3185,7 +5336,7 @@ async def show_test(inter: discord.Interaction):
         await inter.response.send_message(f"❌ Erreur lors de la lecture : {e}", ephemeral=True)
 
 # ---------- UI (boutons + modals) ----------
-class ModalCreerTribu(discord.ui.Modal, title="✨ Créer une tribu"):
+class ModalCreerTribu(ModalServeur, title="✨ Créer une tribu"):
     nom = discord.ui.TextInput(label="Nom de la tribu", placeholder="Ex: Les Spinos", required=True, max_length=100)
     nom_ingame = discord.ui.TextInput(label="Ton nom In Game", placeholder="Ex: Raptor_Killer42", required=True, max_length=100)
     map_base = discord.ui.TextInput(label="Base principale - Map", placeholder="Ex: The Island", required=True, max_length=100)
@@ -3196,11 +5347,11 @@ class ModalCreerTribu(discord.ui.Modal, title="✨ Créer une tribu"):
         # Différer immédiatement pour éviter le timeout (la création prend du temps)
         await inter.response.defer(ephemeral=False)
         
-        if tribu_par_nom(inter.guild_id, self.nom.value):
+        if await tribu_par_nom(inter.guild_id, self.nom.value):
             await inter.followup.send("❌ Ce nom de tribu est déjà pris.", ephemeral=True)
             return
         
-        with db_connect() as conn:
+        def _creer(conn):
             c = conn.cursor()
             c.execute("""
                 INSERT INTO tribus (guild_id, nom, map_base, coords_base, description, proprietaire_id, created_at)
@@ -3216,10 +5367,11 @@ class ModalCreerTribu(discord.ui.Modal, title="✨ Créer une tribu"):
             nom_in_game = self.nom_ingame.value.strip()
             c.execute("INSERT INTO membres (tribu_id, user_id, nom_in_game, manager) VALUES (?, ?, ?, 1)",
                       (tid, inter.user.id, nom_in_game))
-            
-            conn.commit()
+            return tid
+        
+        tid = await db_write(_creer)
         
-        ajouter_historique(tid, inter.user.id, "Création tribu", f"Tribu {self.nom.value} créée")
+        await ajouter_historique(tid, inter.user.id, "Création tribu", f"Tribu {self.nom.value} créée")
         
         # Afficher la fiche de la nouvelle tribu
         # Note: on utilise followup car le defer a déjà été appelé
@@ -3227,12 +5379,9 @@ class ModalCreerTribu(discord.ui.Modal, title="✨ Créer une tribu"):
         await inter.followup.send(f"✅ **Tribu {self.nom.value} créée !**\n{note}", ephemeral=True)
         
         # Afficher la fiche automatiquement
-        try:
-            await afficher_ou_rafraichir_fiche(inter.client, tid, inter.guild, inter.channel)
-        except Exception as e:
-            print(f"⚠️ Erreur lors de l'affichage de la fiche tribu {tid}: {e}")
+        planificateur_fiches.demander(inter.client, tid, inter.guild, inter.channel)
 
-class ModalModifierTribu(discord.ui.Modal, title="🛠️ Modifier tribu"):
+class ModalModifierTribu(ModalServeur, title="🛠️ Modifier tribu"):
     nom = discord.ui.TextInput(label="Nom de la tribu", required=False, max_length=100)
     map_base = discord.ui.TextInput(label="Base principale - Map", required=False, max_length=100)
     coords_base = discord.ui.TextInput(label="Base principale - Coordonnées", required=False, max_length=50)
@@ -3242,14 +5391,11 @@ class ModalModifierTribu(discord.ui.Modal, title="🛠️ Modifier tribu"):
     async def on_submit(self, inter: discord.Interaction):
         await inter.response.defer(ephemeral=True)
         # Trouver la tribu de l'utilisateur
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT t.* FROM tribus t
-                LEFT JOIN membres m ON t.id = m.tribu_id
-                WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
-            """, (inter.guild_id, inter.user.id, inter.user.id))
-            row = c.fetchone()
+        row = await db_fetchone("""
+            SELECT t.* FROM tribus t
+            LEFT JOIN membres m ON t.id = m.tribu_id
+            WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
+        """, (inter.guild_id, inter.user.id, inter.user.id))
         
         if not row:
             await inter.followup.send("❌ Tu n'es référent ou manager d'aucune tribu.", ephemeral=True)
@@ -3272,24 +5418,21 @@ class ModalModifierTribu(discord.ui.Modal, title="🛠️ Modifier tribu"):
                 updates["ouvert_recrutement"] = recrutement_texte
         
         if updates:
-            with db_connect() as conn:
-                c = conn.cursor()
-                set_clause = ", ".join(f"{k}=?" for k in updates.keys())
-                c.execute(f"UPDATE tribus SET {set_clause} WHERE id=?", (*updates.values(), row["id"]))
-                conn.commit()
+            set_clause = ", ".join(f"{k}=?" for k in updates.keys())
+            try:
+                await db_execute(f"UPDATE tribus SET {set_clause} WHERE id=?", (*updates.values(), row["id"]))
+            except sqlite3.IntegrityError:
+                await inter.followup.send(f"❌ Le nom **{updates['nom']}** est déjà pris par une autre tribu.", ephemeral=True)
+                return
             
             # Ajouter l'historique après avoir fermé la connexion
-            ajouter_historique(row["id"], inter.user.id, "Modification", f"Champs modifiés: {', '.join(updates.keys())}")
+            await ajouter_historique(row["id"], inter.user.id, "Modification", f"Champs modifiés: {', '.join(updates.keys())}")
             await inter.followup.send("✅ **Tribu modifiée !**", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {row['id']}: {e}")
-                await inter.followup.send(f"⚠️ **Note** : Fiche modifiée mais non rafraîchie automatiquement. Utilise `/ma_tribu` pour voir les changements.\n`Erreur: {e}`", ephemeral=True)
+            planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
         else:
             await inter.followup.send("ℹ️ Aucun changement n'a été effectué.", ephemeral=True)
 
-class ModalPersonnaliserTribu(discord.ui.Modal, title="🎨 Personnaliser tribu"):
+class ModalPersonnaliserTribu(ModalServeur, title="🎨 Personnaliser tribu"):
     couleur_hex = discord.ui.TextInput(label="Couleur", required=False, placeholder="Ex: #00AAFF", max_length=7)
     logo_url = discord.ui.TextInput(label="Logo", required=False, placeholder="https://...", max_length=500)
     objectif = discord.ui.TextInput(label="Objectif de tribu", required=False, style=discord.TextStyle.paragraph, max_length=1024)
@@ -3297,14 +5440,11 @@ class ModalPersonnaliserTribu(discord.ui.Modal, title="🎨 Personnaliser tribu"
 
     async def on_submit(self, inter: discord.Interaction):
         await inter.response.defer(ephemeral=True)
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT t.* FROM tribus t
-                LEFT JOIN membres m ON t.id = m.tribu_id
-                WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
-            """, (inter.guild_id, inter.user.id, inter.user.id))
-            row = c.fetchone()
+        row = await db_fetchone("""
+            SELECT t.* FROM tribus t
+            LEFT JOIN membres m ON t.id = m.tribu_id
+            WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
+        """, (inter.guild_id, inter.user.id, inter.user.id))
         
         if not row:
             await inter.followup.send("❌ Tu n'es référent ou manager d'aucune tribu.", ephemeral=True)
@@ -3325,21 +5465,14 @@ class ModalPersonnaliserTribu(discord.ui.Modal, title="🎨 Personnaliser tribu"
             updates["devise"] = self.devise.value.strip()
         
         if updates:
-            with db_connect() as conn:
-                c = conn.cursor()
-                set_clause = ", ".join(f"{k}=?" for k in updates.keys())
-                c.execute(f"UPDATE tribus SET {set_clause} WHERE id=?", (*updates.values(), row["id"]))
-                conn.commit()
+            set_clause = ", ".join(f"{k}=?" for k in updates.keys())
+            await db_execute(f"UPDATE tribus SET {set_clause} WHERE id=?", (*updates.values(), row["id"]))
             
             # Ajouter l'historique après avoir fermé la connexion
-            ajouter_historique(row["id"], inter.user.id, "Personnalisation", f"Champs: {', '.join(updates.keys())}")
+            await ajouter_historique(row["id"], inter.user.id, "Personnalisation", f"Champs: {', '.join(updates.keys())}")
             
             await inter.followup.send("✅ **Tribu personnalisée !**", ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {row['id']}: {e}")
-                await inter.followup.send(f"⚠️ **Note** : Personnalisation enregistrée mais fiche non rafraîchie. Utilise `/ma_tribu`.\n`Erreur: {e}`", ephemeral=True)
+            planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
         else:
             await inter.followup.send("ℹ️ Aucun changement n'a été effectué.", ephemeral=True)
 
@@ -3389,20 +5522,17 @@ async def afficher_guide(inter: discord.Interaction):
     await inter.response.send_message(embed=e, ephemeral=True)
 
 # Ancien modal Détailler conservé temporairement pour compatibilité
-class ModalDetaillerTribu(discord.ui.Modal, title="📋 Détailler tribu"):
+class ModalDetaillerTribu(ModalServeur, title="📋 Détailler tribu"):
     photo_base = discord.ui.TextInput(label="Photo base (URL)", required=False, placeholder="https://...", max_length=500)
     objectif = discord.ui.TextInput(label="Objectif", required=False, max_length=1024)
 
     async def on_submit(self, inter: discord.Interaction):
         await inter.response.defer(ephemeral=True)
-        with db_connect() as conn:
-            c = conn.cursor()
-            c.execute("""
-                SELECT t.* FROM tribus t
-                LEFT JOIN membres m ON t.id = m.tribu_id
-                WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
-            """, (inter.guild_id, inter.user.id, inter.user.id))
-            row = c.fetchone()
+        row = await db_fetchone("""
+            SELECT t.* FROM tribus t
+            LEFT JOIN membres m ON t.id = m.tribu_id
+            WHERE t.guild_id = ? AND (t.proprietaire_id = ? OR (m.user_id = ? AND m.manager = 1))
+        """, (inter.guild_id, inter.user.id, inter.user.id))
         
         if not row:
             await inter.followup.send("❌ Tu n'es référent ou manager d'aucune tribu.", ephemeral=True)
@@ -3415,25 +5545,19 @@ class ModalDetaillerTribu(discord.ui.Modal, title="📋 Détailler tribu"):
             updates["objectif"] = str(self.objectif).strip()
         
         if updates:
-            with db_connect() as conn:
-                c = conn.cursor()
-                set_clause = ", ".join(f"{k}=?" for k in updates.keys())
-                c.execute(f"UPDATE tribus SET {set_clause} WHERE id=?", (*updates.values(), row["id"]))
-                conn.commit()
+            set_clause = ", ".join(f"{k}=?" for k in updates.keys())
+            await db_execute(f"UPDATE tribus SET {set_clause} WHERE id=?", (*updates.values(), row["id"]))
             
-            ajouter_historique(row["id"], inter.user.id, "Détails ajoutés", f"Champs: {', '.join(updates.keys())}")
+            await ajouter_historique(row["id"], inter.user.id, "Détails ajoutés", f"Champs: {', '.join(updates.keys())}")
             
             # Message avec info sur la progression
             msg_success = "✅ **Détails ajoutés !**\n\nℹ️ *Pour la progression Boss/Notes, utilise les boutons dans la fiche de ta tribu.*"
             await inter.followup.send(msg_success, ephemeral=True)
-            try:
-                await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-            except Exception as e:
-                print(f"⚠️ Erreur lors du rafraîchissement de la fiche tribu {row['id']}: {e}")
+            planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
         else:
             await inter.followup.send("ℹ️ Aucun changement n'a été effectué.", ephemeral=True)
 
-class PanneauParametres(discord.ui.View):
+class PanneauParametres(VueServeur):
     """Panneau de configuration du bot (Admin seulement)"""
     def __init__(self, timeout: Optional[float] = None):
         super().__init__(timeout=timeout)
@@ -3459,11 +5583,11 @@ class PanneauParametres(discord.ui.View):
         e.set_footer(text="💡 L'upload direct est plus simple si tu as l'image sur ton appareil !")
         
         # Créer un bouton pour ouvrir le modal URL
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         btn = discord.ui.Button(label="Entrer une URL", style=discord.ButtonStyle.primary, emoji="🔗")
         
         async def btn_callback(btn_inter: discord.Interaction):
-            class ModalBanniere(discord.ui.Modal, title="🖼️ URL de la bannière"):
+            class ModalBanniere(ModalServeur, title="🖼️ URL de la bannière"):
                 url = discord.ui.TextInput(
                     label="URL de la bannière",
                     placeholder="https://example.com/banniere.png",
@@ -3478,7 +5602,7 @@ class PanneauParametres(discord.ui.View):
                         await submit_inter.response.send_message("❌ L'URL doit commencer par http:// ou https://", ephemeral=True)
                         return
                     
-                    set_config(submit_inter.guild_id, "banniere_panneau", url_value)
+                    await set_config(submit_inter.guild_id, "banniere_panneau", url_value)
                     await submit_inter.response.send_message(f"✅ **Bannière modifiée !**\n\n💡 *Utilise `/panneau` pour voir le résultat.*", ephemeral=True)
             
             await btn_inter.response.send_modal(ModalBanniere())
@@ -3506,11 +5630,11 @@ class PanneauParametres(discord.ui.View):
         e.set_footer(text="💡 Le sélecteur de couleur t'aidera à trouver le code hexadécimal parfait")
         
         # Créer un bouton pour ouvrir le modal
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         btn = discord.ui.Button(label="Entrer le code couleur", style=discord.ButtonStyle.primary, emoji="🎨")
         
         async def btn_callback(btn_inter: discord.Interaction):
-            class ModalCouleur(discord.ui.Modal, title="🎨 Modifier la couleur"):
+            class ModalCouleur(ModalServeur, title="🎨 Modifier la couleur"):
                 couleur = discord.ui.TextInput(
                     label="Couleur hexadécimale",
                     placeholder="Ex: 5865F2 ou #5865F2",
@@ -3526,7 +5650,7 @@ class PanneauParametres(discord.ui.View):
                         await submit_inter.response.send_message("❌ Couleur invalide. Utilise un code hexadécimal à 6 caractères (ex: 5865F2)", ephemeral=True)
                         return
                     
-                    set_config(submit_inter.guild_id, "couleur_panneau", couleur_value)
+                    await set_config(submit_inter.guild_id, "couleur_panneau", couleur_value)
                     
                     try:
                         couleur_int = int(couleur_value, 16)
@@ -3553,7 +5677,7 @@ class PanneauParametres(discord.ui.View):
             return
         
         # Modal pour le texte
-        class ModalTexte(discord.ui.Modal, title="📝 Modifier le texte du panneau"):
+        class ModalTexte(ModalServeur, title="📝 Modifier le texte du panneau"):
             texte = discord.ui.TextInput(
                 label="Texte de description",
                 placeholder="Ex: Utilise les boutons ci-dessous...",
@@ -3564,7 +5688,7 @@ class PanneauParametres(discord.ui.View):
             
             async def on_submit(self, submit_inter: discord.Interaction):
                 texte_value = str(self.texte).strip()
-                set_config(submit_inter.guild_id, "texte_panneau", texte_value)
+                await set_config(submit_inter.guild_id, "texte_panneau", texte_value)
                 await submit_inter.response.send_message(f"✅ **Texte modifié !**\n\n💡 *Utilise `/panneau` pour voir le résultat.*", ephemeral=True)
         
         await inter.response.send_modal(ModalTexte())
@@ -3576,7 +5700,7 @@ class PanneauParametres(discord.ui.View):
             return
         
         # Modal pour entrer le nom ou l'ID du salon
-        class ModalSalonFiche(discord.ui.Modal, title="📍 Salon pour les fiches tribu"):
+        class ModalSalonFiche(ModalServeur, title="📍 Salon pour les fiches tribu"):
             salon_input = discord.ui.TextInput(
                 label="Nom du salon ou ID",
                 placeholder="Ex: #fiches-tribus ou 123456789012345678 ou 'reset'",
@@ -3590,7 +5714,7 @@ class PanneauParametres(discord.ui.View):
                 
                 # Option reset
                 if input_value in ["reset", "default", "défaut", "0"]:
-                    set_config(submit_inter.guild_id, "salon_fiche_tribu", "0")
+                    await set_config(submit_inter.guild_id, "salon_fiche_tribu", "0")
                     await submit_inter.response.send_message(
                         "✅ **Configuration réinitialisée !**\n\n"
                         "Les fiches seront affichées dans le salon actuel (où la commande est exécutée).",
@@ -3638,7 +5762,7 @@ class PanneauParametres(discord.ui.View):
                     return
                 
                 # Sauvegarder la configuration
-                set_config(submit_inter.guild_id, "salon_fiche_tribu", str(salon_trouve.id))
+                await set_config(submit_inter.guild_id, "salon_fiche_tribu", str(salon_trouve.id))
                 await submit_inter.response.send_message(
                     f"✅ **Salon défini !**\n\n"
                     f"Toutes les nouvelles fiches seront affichées dans {salon_trouve.mention}",
@@ -3654,13 +5778,13 @@ class PanneauParametres(discord.ui.View):
             return
         
         # Afficher un sous-menu pour ajouter ou retirer des maps
-        class ViewMapsGestion(discord.ui.View):
+        class ViewMapsGestion(VueServeur):
             def __init__(self):
                 super().__init__(timeout=300)
             
             @discord.ui.button(label="Ajouter une map", style=discord.ButtonStyle.success, emoji="➕")
             async def btn_ajouter(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
-                class ModalAjoutMap(discord.ui.Modal, title="🗺️ Ajouter une map"):
+                class ModalAjoutMap(ModalServeur, title="🗺️ Ajouter une map"):
                     nom = discord.ui.TextInput(
                         label="Nom de la map",
                         placeholder="Ex: The Island, Scorched Earth...",
@@ -3671,13 +5795,9 @@ class PanneauParametres(discord.ui.View):
                     
                     async def on_submit(self, submit_inter: discord.Interaction):
                         nom_map = str(self.nom).strip()
-                        try:
-                            with db_connect() as conn:
-                                c = conn.cursor()
-                                c.execute("INSERT INTO maps (guild_id, nom) VALUES (?, ?)", (submit_inter.guild_id, nom_map))
-                                conn.commit()
+                        if await ajouter_au_catalogue(submit_inter.guild_id, "maps", nom_map):
                             await submit_inter.response.send_message(f"✅ Map **{nom_map}** ajoutée à la liste !", ephemeral=True)
-                        except sqlite3.IntegrityError:
+                        else:
                             await submit_inter.response.send_message(f"❌ La map **{nom_map}** existe déjà.", ephemeral=True)
                 
                 await btn_inter.response.send_modal(ModalAjoutMap())
@@ -3685,33 +5805,27 @@ class PanneauParametres(discord.ui.View):
             @discord.ui.button(label="Retirer une map", style=discord.ButtonStyle.danger, emoji="➖")
             async def btn_retirer(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
                 # Créer un menu déroulant avec les maps existantes
-                with db_connect() as conn:
-                    c = conn.cursor()
-                    c.execute("SELECT DISTINCT nom FROM maps WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-                    maps = [row["nom"] for row in c.fetchall()]
+                catalogue = await catalogue_serveur(inter.guild_id, "maps")
+                maps = catalogue.noms
                 
                 if not maps:
                     await btn_inter.followup.send("❌ Aucune map à retirer.", ephemeral=True)
                     return
                 
-                class ViewMapSelect(discord.ui.View):
+                class ViewMapSelect(VueServeur):
                     def __init__(self):
                         super().__init__(timeout=300)
                     
                     @discord.ui.select(
                         placeholder="Sélectionne la map à retirer",
-                        options=[discord.SelectOption(label=m, value=m) for m in maps[:25]]
+                        options=catalogue.options()
                     )
                     async def select_map(self, select_inter: discord.Interaction, select: discord.ui.Select):
                         nom_map = select.values[0]
-                        with db_connect() as conn:
-                            c = conn.cursor()
-                            c.execute("DELETE FROM maps WHERE guild_id=? AND nom=?", (select_inter.guild_id, nom_map))
-                            if c.rowcount == 0:
-                                await select_inter.followup.send(f"❌ Map **{nom_map}** non trouvée.", ephemeral=True)
-                            else:
-                                conn.commit()
-                                await select_inter.followup.send(f"✅ Map **{nom_map}** supprimée de la liste !", ephemeral=True)
+                        if not await retirer_du_catalogue(select_inter.guild_id, "maps", nom_map):
+                            await select_inter.followup.send(f"❌ Map **{nom_map}** non trouvée.", ephemeral=True)
+                        else:
+                            await select_inter.followup.send(f"✅ Map **{nom_map}** supprimée de la liste !", ephemeral=True)
                 
                 view = ViewMapSelect()
                 await btn_inter.followup.send("🗺️ **Choisir la map à retirer :**", view=view, ephemeral=True)
@@ -3730,13 +5844,13 @@ class PanneauParametres(discord.ui.View):
             return
         
         # Afficher un sous-menu pour ajouter ou retirer des boss
-        class ViewBossGestion(discord.ui.View):
+        class ViewBossGestion(VueServeur):
             def __init__(self):
                 super().__init__(timeout=300)
             
             @discord.ui.button(label="Ajouter un boss", style=discord.ButtonStyle.success, emoji="➕")
             async def btn_ajouter(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
-                class ModalAjoutBoss(discord.ui.Modal, title="🐉 Ajouter un boss"):
+                class ModalAjoutBoss(ModalServeur, title="🐉 Ajouter un boss"):
                     nom = discord.ui.TextInput(
                         label="Nom du boss",
                         placeholder="Ex: Broodmother, Dragon...",
@@ -3747,13 +5861,9 @@ class PanneauParametres(discord.ui.View):
                     
                     async def on_submit(self, submit_inter: discord.Interaction):
                         nom_boss = str(self.nom).strip()
-                        try:
-                            with db_connect() as conn:
-                                c = conn.cursor()
-                                c.execute("INSERT INTO boss (guild_id, nom) VALUES (?, ?)", (submit_inter.guild_id, nom_boss))
-                                conn.commit()
+                        if await ajouter_au_catalogue(submit_inter.guild_id, "boss", nom_boss):
                             await submit_inter.response.send_message(f"✅ Boss **{nom_boss}** ajouté à la liste !", ephemeral=True)
-                        except sqlite3.IntegrityError:
+                        else:
                             await submit_inter.response.send_message(f"❌ Le boss **{nom_boss}** existe déjà.", ephemeral=True)
                 
                 await btn_inter.response.send_modal(ModalAjoutBoss())
@@ -3761,33 +5871,27 @@ class PanneauParametres(discord.ui.View):
             @discord.ui.button(label="Retirer un boss", style=discord.ButtonStyle.danger, emoji="➖")
             async def btn_retirer(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
                 # Créer un menu déroulant avec les boss existants
-                with db_connect() as conn:
-                    c = conn.cursor()
-                    c.execute("SELECT DISTINCT nom FROM boss WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-                    boss = [row["nom"] for row in c.fetchall()]
+                catalogue = await catalogue_serveur(inter.guild_id, "boss")
+                boss = catalogue.noms
                 
                 if not boss:
                     await btn_inter.followup.send("❌ Aucun boss à retirer.", ephemeral=True)
                     return
                 
-                class ViewBossSelect(discord.ui.View):
+                class ViewBossSelect(VueServeur):
                     def __init__(self):
                         super().__init__(timeout=300)
                     
                     @discord.ui.select(
                         placeholder="Sélectionne le boss à retirer",
-                        options=[discord.SelectOption(label=b, value=b) for b in boss[:25]]
+                        options=catalogue.options()
                     )
                     async def select_boss(self, select_inter: discord.Interaction, select: discord.ui.Select):
                         nom_boss = select.values[0]
-                        with db_connect() as conn:
-                            c = conn.cursor()
-                            c.execute("DELETE FROM boss WHERE guild_id=? AND nom=?", (select_inter.guild_id, nom_boss))
-                            if c.rowcount == 0:
-                                await select_inter.followup.send(f"❌ Boss **{nom_boss}** non trouvé.", ephemeral=True)
-                            else:
-                                conn.commit()
-                                await select_inter.followup.send(f"✅ Boss **{nom_boss}** supprimé de la liste !", ephemeral=True)
+                        if not await retirer_du_catalogue(select_inter.guild_id, "boss", nom_boss):
+                            await select_inter.followup.send(f"❌ Boss **{nom_boss}** non trouvé.", ephemeral=True)
+                        else:
+                            await select_inter.followup.send(f"✅ Boss **{nom_boss}** supprimé de la liste !", ephemeral=True)
                 
                 view = ViewBossSelect()
                 await btn_inter.followup.send("🐉 **Choisir le boss à retirer :**", view=view, ephemeral=True)
@@ -3806,13 +5910,13 @@ class PanneauParametres(discord.ui.View):
             return
         
         # Afficher un sous-menu pour ajouter ou retirer des notes
-        class ViewNotesGestion(discord.ui.View):
+        class ViewNotesGestion(VueServeur):
             def __init__(self):
                 super().__init__(timeout=300)
             
             @discord.ui.button(label="Ajouter une note", style=discord.ButtonStyle.success, emoji="➕")
             async def btn_ajouter(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
-                class ModalAjoutNote(discord.ui.Modal, title="📝 Ajouter une note"):
+                class ModalAjoutNote(ModalServeur, title="📝 Ajouter une note"):
                     nom = discord.ui.TextInput(
                         label="Nom de la note",
                         placeholder="Ex: Note de l'explorateur...",
@@ -3823,13 +5927,9 @@ class PanneauParametres(discord.ui.View):
                     
                     async def on_submit(self, submit_inter: discord.Interaction):
                         nom_note = str(self.nom).strip()
-                        try:
-                            with db_connect() as conn:
-                                c = conn.cursor()
-                                c.execute("INSERT INTO notes (guild_id, nom) VALUES (?, ?)", (submit_inter.guild_id, nom_note))
-                                conn.commit()
+                        if await ajouter_au_catalogue(submit_inter.guild_id, "notes", nom_note):
                             await submit_inter.response.send_message(f"✅ Note **{nom_note}** ajoutée à la liste !", ephemeral=True)
-                        except sqlite3.IntegrityError:
+                        else:
                             await submit_inter.response.send_message(f"❌ La note **{nom_note}** existe déjà.", ephemeral=True)
                 
                 await btn_inter.response.send_modal(ModalAjoutNote())
@@ -3837,33 +5937,27 @@ class PanneauParametres(discord.ui.View):
             @discord.ui.button(label="Retirer une note", style=discord.ButtonStyle.danger, emoji="➖")
             async def btn_retirer(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
                 # Créer un menu déroulant avec les notes existantes
-                with db_connect() as conn:
-                    c = conn.cursor()
-                    c.execute("SELECT DISTINCT nom FROM notes WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-                    notes = [row["nom"] for row in c.fetchall()]
+                catalogue = await catalogue_serveur(inter.guild_id, "notes")
+                notes = catalogue.noms
                 
                 if not notes:
                     await btn_inter.followup.send("❌ Aucune note à retirer.", ephemeral=True)
                     return
                 
-                class ViewNoteSelect(discord.ui.View):
+                class ViewNoteSelect(VueServeur):
                     def __init__(self):
                         super().__init__(timeout=300)
                     
                     @discord.ui.select(
                         placeholder="Sélectionne la note à retirer",
-                        options=[discord.SelectOption(label=n, value=n) for n in notes[:25]]
+                        options=catalogue.options()
                     )
                     async def select_note(self, select_inter: discord.Interaction, select: discord.ui.Select):
                         nom_note = select.values[0]
-                        with db_connect() as conn:
-                            c = conn.cursor()
-                            c.execute("DELETE FROM notes WHERE guild_id=? AND nom=?", (select_inter.guild_id, nom_note))
-                            if c.rowcount == 0:
-                                await select_inter.followup.send(f"❌ Note **{nom_note}** non trouvée.", ephemeral=True)
-                            else:
-                                conn.commit()
-                                await select_inter.followup.send(f"✅ Note **{nom_note}** supprimée de la liste !", ephemeral=True)
+                        if not await retirer_du_catalogue(select_inter.guild_id, "notes", nom_note):
+                            await select_inter.followup.send(f"❌ Note **{nom_note}** non trouvée.", ephemeral=True)
+                        else:
+                            await select_inter.followup.send(f"✅ Note **{nom_note}** supprimée de la liste !", ephemeral=True)
                 
                 view = ViewNoteSelect()
                 await btn_inter.followup.send("📝 **Choisir la note à retirer :**", view=view, ephemeral=True)
@@ -3882,13 +5976,13 @@ class PanneauParametres(discord.ui.View):
             return
         
         # Afficher un sous-menu pour ajouter ou retirer des maps premium
-        class ViewMapsPremiumGestion(discord.ui.View):
+        class ViewMapsPremiumGestion(VueServeur):
             def __init__(self):
                 super().__init__(timeout=300)
             
             @discord.ui.button(label="Ajouter une map premium", style=discord.ButtonStyle.success, emoji="➕")
             async def btn_ajouter(self, btn_inter: discord.Interaction, btn: discord.ui.Button):
-                class ModalAjoutMapPremium(discord.ui.Modal, title="⭐ Ajouter une map premium"):
+                class ModalAjoutMapPremium(ModalServeur, title="⭐ Ajouter une map premium"):
                     nom = discord.ui.TextInput(
                         label="Nom de la map premium",
                         placeholder="Ex: Svartalfheim, Némésis...",
@@ -3899,14 +5993,9 @@ class PanneauParametres(discord.ui.View):
                     
                     async def on_submit(self, submit_inter: discord.Interaction):
                         nom_map = str(self.nom).strip()
-                        try:
-                            with db_connect() as conn:
-                                c = conn.cursor()
-                                c.execute("INSERT INTO maps_premium (guild_id, nom, created_at) VALUES (?, ?, ?)", 
-                                         (submit_inter.guild_id, nom_map, dt.datetime.utcnow().isoformat()))
-                                conn.commit()
+                        if await ajouter_au_catalogue(submit_inter.guild_id, "maps_premium", nom_map):
                             await submit_inter.response.send_message(f"✅ Map premium **{nom_map}** ajoutée à la liste !", ephemeral=True)
-                        except sqlite3.IntegrityError:
+                        else:
                             await submit_inter.response.send_message(f"❌ La map premium **{nom_map}** existe déjà.", ephemeral=True)
                 
                 await btn_inter.response.send_modal(ModalAjoutMapPremium())
@@ -3917,34 +6006,28 @@ class PanneauParametres(discord.ui.View):
                 await btn_inter.response.defer(ephemeral=True)
                 
                 # Créer un menu déroulant avec les maps premium existantes
-                with db_connect() as conn:
-                    c = conn.cursor()
-                    c.execute("SELECT DISTINCT nom FROM maps_premium WHERE guild_id IN (0, ?) ORDER BY nom", (inter.guild_id,))
-                    maps = [row["nom"] for row in c.fetchall()]
+                catalogue = await catalogue_serveur(inter.guild_id, "maps_premium")
+                maps = catalogue.noms
                 
                 if not maps:
                     await btn_inter.followup.send("❌ Aucune map premium à retirer.", ephemeral=True)
                     return
                 
-                class ViewMapPremiumSelect(discord.ui.View):
+                class ViewMapPremiumSelect(VueServeur):
                     def __init__(self):
                         super().__init__(timeout=300)
                     
                     @discord.ui.select(
                         placeholder="Sélectionne la map premium à retirer",
-                        options=[discord.SelectOption(label=m, value=m) for m in maps[:25]]
+                        options=catalogue.options()
                     )
                     async def select_map(self, select_inter: discord.Interaction, select: discord.ui.Select):
                         await select_inter.response.defer(ephemeral=True)
                         nom_map = select.values[0]
-                        with db_connect() as conn:
-                            c = conn.cursor()
-                            c.execute("DELETE FROM maps_premium WHERE guild_id=? AND nom=?", (select_inter.guild_id, nom_map))
-                            if c.rowcount == 0:
-                                await select_inter.followup.send(f"❌ Map premium **{nom_map}** non trouvée.", ephemeral=True)
-                            else:
-                                conn.commit()
-                                await select_inter.followup.send(f"✅ Map premium **{nom_map}** supprimée de la liste !", ephemeral=True)
+                        if not await retirer_du_catalogue(select_inter.guild_id, "maps_premium", nom_map):
+                            await select_inter.followup.send(f"❌ Map premium **{nom_map}** non trouvée.", ephemeral=True)
+                        else:
+                            await select_inter.followup.send(f"✅ Map premium **{nom_map}** supprimée de la liste !", ephemeral=True)
                 
                 view = ViewMapPremiumSelect()
                 await btn_inter.followup.send("⭐ **Choisir la map premium à retirer :**", view=view, ephemeral=True)
@@ -3955,8 +6038,42 @@ class PanneauParametres(discord.ui.View):
             color=0x5865F2
         )
         await inter.response.send_message(embed=e, view=ViewMapsPremiumGestion(), ephemeral=True)
+    
+    @discord.ui.button(label="Historique", style=discord.ButtonStyle.secondary, emoji="🗄️", row=2)
+    async def btn_retention(self, inter: discord.Interaction, button: discord.ui.Button):
+        if not est_admin(inter):
+            await inter.response.send_message("❌ Réservé aux administrateurs.", ephemeral=True)
+            return
+        
+        actuel = await get_config(inter.guild_id, "retention_historique_jours", str(HISTORIQUE_RETENTION_JOURS))
+        
+        # Modal pour la durée de rétention
+        class ModalRetention(ModalServeur, title="🗄️ Rétention de l'historique"):
+            jours = discord.ui.TextInput(
+                label="Jours conservés avant archivage (0 = jamais)",
+                placeholder="Ex: 180",
+                default=actuel,
+                style=discord.TextStyle.short,
+                required=True,
+                max_length=5
+            )
+            
+            async def on_submit(self, submit_inter: discord.Interaction):
+                valeur = str(self.jours).strip()
+                if not valeur.isdigit():
+                    await submit_inter.response.send_message("❌ Indique un nombre de jours (0 pour ne jamais archiver).", ephemeral=True)
+                    return
+                
+                await set_config(submit_inter.guild_id, "retention_historique_jours", str(int(valeur)))
+                if int(valeur) == 0:
+                    message = "✅ **L'historique ne sera plus archivé.**"
+                else:
+                    message = f"✅ **L'historique de plus de {int(valeur)} jours sera archivé.**\n\n💡 *Consulte l'archive avec `/historique_archive`.*"
+                await submit_inter.response.send_message(message, ephemeral=True)
+        
+        await inter.response.send_modal(ModalRetention())
 
-class PanneauTribu(discord.ui.View):
+class PanneauTribu(VueServeur):
     def __init__(self, timeout: Optional[float] = None):
         super().__init__(timeout=timeout)
 
@@ -3982,7 +6099,7 @@ class PanneauTribu(discord.ui.View):
         e.set_footer(text="💡 Le sélecteur de couleur t'aidera à trouver le code hexadécimal parfait")
         
         # Créer un bouton pour ouvrir le modal
-        view = discord.ui.View(timeout=300)
+        view = VueServeur(timeout=300)
         btn = discord.ui.Button(label="Ouvrir le formulaire", style=discord.ButtonStyle.primary, emoji="📝")
         
         async def btn_callback(btn_inter: discord.Interaction):
@@ -4009,7 +6126,7 @@ async def ajouter_logo(inter: discord.Interaction, nom: str, url_logo: Optional[
     # DEFER immédiatement pour éviter le timeout (3 secondes)
     await inter.response.defer(ephemeral=True)
     
-    row = tribu_par_nom(inter.guild_id, nom)
+    row = await tribu_par_nom(inter.guild_id, nom)
     if not row:
         await inter.followup.send("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
         return
@@ -4034,22 +6151,16 @@ async def ajouter_logo(inter: discord.Interaction, nom: str, url_logo: Optional[
         return
     
     # Mettre à jour le logo
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("UPDATE tribus SET logo_url=? WHERE id=?", (logo_url, row["id"]))
-        conn.commit()
+    await db_execute("UPDATE tribus SET logo_url=? WHERE id=?", (logo_url, row["id"]))
     
     source = "📱 depuis un fichier" if fichier else "🔗 depuis une URL"
-    ajouter_historique(row["id"], inter.user.id, "Logo modifié", f"Logo changé {source}")
+    await ajouter_historique(row["id"], inter.user.id, "Logo modifié", f"Logo changé {source}")
     
     # Répondre AVANT le rafraîchissement
     await inter.followup.send(f"✅ **Logo de {row['nom']} mis à jour !**\n{source}", ephemeral=True)
     
     # Rafraîchir la fiche APRÈS avoir répondu
-    try:
-        await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-    except Exception as e:
-        await inter.followup.send(f"⚠️ **Note** : Logo mis à jour mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+    planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
 
 @tree.command(name="ajouter_photo", description="Ajouter une photo à la galerie de ta tribu (max 10 photos)")
 @app_commands.describe(
@@ -4062,7 +6173,7 @@ async def ajouter_photo(inter: discord.Interaction, nom: str, url_photo: Optiona
     # DEFER immédiatement pour éviter le timeout (3 secondes)
     await inter.response.defer(ephemeral=True)
     
-    row = tribu_par_nom(inter.guild_id, nom)
+    row = await tribu_par_nom(inter.guild_id, nom)
     if not row:
         await inter.followup.send("❌ Aucune tribu trouvée avec ce nom.", ephemeral=True)
         return
@@ -4087,38 +6198,19 @@ async def ajouter_photo(inter: discord.Interaction, nom: str, url_photo: Optiona
         return
     
     # Vérifier le nombre de photos (max 10)
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) as count FROM photos_tribu WHERE tribu_id=?", (row["id"],))
-        count = c.fetchone()["count"]
-        
-        if count >= 10:
-            await inter.followup.send("❌ Cette tribu a déjà 10 photos. Supprime-en une avant d'en ajouter une nouvelle.", ephemeral=True)
-            return
-        
-        # Calculer le prochain ordre
-        c.execute("SELECT COALESCE(MAX(ordre), -1) as max_ordre FROM photos_tribu WHERE tribu_id=?", (row["id"],))
-        max_ordre = c.fetchone()["max_ordre"]
-        nouvel_ordre = max_ordre + 1
-        
-        # Ajouter la photo
-        c.execute("""
-        INSERT INTO photos_tribu (tribu_id, url, ordre, created_at)
-        VALUES (?, ?, ?, ?)
-        """, (row["id"], photo_url, nouvel_ordre, dt.datetime.utcnow().isoformat()))
-        conn.commit()
+    count, nouvel_ordre = await db_write(ajouter_photo_galerie, row["id"], photo_url)
+    if nouvel_ordre is None:
+        await inter.followup.send("❌ Cette tribu a déjà 10 photos. Supprime-en une avant d'en ajouter une nouvelle.", ephemeral=True)
+        return
     
     source = "📱 depuis un fichier" if fichier else "🔗 depuis une URL"
-    ajouter_historique(row["id"], inter.user.id, "Photo ajoutée", f"Photo #{nouvel_ordre + 1} ajoutée {source}")
+    await ajouter_historique(row["id"], inter.user.id, "Photo ajoutée", f"Photo #{nouvel_ordre + 1} ajoutée {source}")
     
     # Répondre AVANT le rafraîchissement
     await inter.followup.send(f"✅ **Photo #{nouvel_ordre + 1} ajoutée à {row['nom']} !** ({count + 1}/10)\n{source}", ephemeral=True)
     
     # Rafraîchir la fiche APRÈS avoir répondu
-    try:
-        await afficher_ou_rafraichir_fiche(inter.client, row["id"], inter.guild, inter.channel)
-    except Exception as e:
-        await inter.followup.send(f"⚠️ **Note** : Photo ajoutée mais fiche non rafraîchie. Utilise `/ma_tribu` pour voir.\n`Erreur: {e}`", ephemeral=True)
+    planificateur_fiches.demander(inter.client, row["id"], inter.guild, inter.channel)
 
 async def autocomplete_photos_tribu(inter: discord.Interaction, current: str):
     """Autocomplétion pour les photos d'une tribu"""
@@ -4127,15 +6219,12 @@ async def autocomplete_photos_tribu(inter: discord.Interaction, current: str):
     if not nom_tribu:
         return []
     
-    row = tribu_par_nom(inter.guild_id, nom_tribu)
+    row = await tribu_par_nom(inter.guild_id, nom_tribu)
     if not row:
         return []
     
     # Récupérer les photos de cette tribu
-    with db_connect() as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (row["id"],))
-        photos = c.fetchall()
+    photos = await db_fetchall("SELECT id, url, ordre FROM photos_tribu WHERE tribu_id=? ORDER BY ordre", (row["id"],))
     
     choices = []
     for photo in photos:
@@ -4164,7 +6253,9 @@ async def parametres(inter: discord.Interaction):
             "📍 **Salon fiches** — Définir où afficher les fiches\n"
             "🗺️ **Maps** — Gérer les maps disponibles\n"
             "🐉 **Boss** — Gérer les boss disponibles\n"
-            "📝 **Notes** — Gérer les notes disponibles"
+            "📝 **Notes** — Gérer les notes disponibles\n"
+            "⭐ **Maps Premium** — Gérer les maps premium\n"
+            "🗄️ **Historique** — Durée de conservation avant archivage"
         ),
         color=0xFF9900
     )
@@ -4181,29 +6272,16 @@ async def panneau(inter: discord.Interaction):
         # Répondre d'abord à l'interaction pour éviter le timeout
         await inter.response.defer(ephemeral=False)
         
-        # Supprimer tous les anciens panneaux dans le canal (cherche dans les 200 derniers messages)
-        panneaux_supprimes = 0
-        try:
-            async for msg in inter.channel.history(limit=200):
-                if msg.embeds and len(msg.embeds) > 0:
-                    for embed in msg.embeds:
-                        if embed.title == "🧭 Panneau — Fiches Tribu":
-                            try:
-                                await msg.delete()
-                                panneaux_supprimes += 1
-                                print(f"Panneau supprimé : {msg.id}")
-                                break
-                            except Exception as ex:
-                                print(f"Erreur suppression panneau {msg.id}: {ex}")
-        except Exception as ex:
-            print(f"Erreur lors de la recherche de panneaux: {ex}")
+        # Supprimer tous les anciens panneaux du canal (ids suivis dans bot_messages, suppression groupée)
+        anciens = await messages_bot(inter.guild_id, "panneau", channel_id=inter.channel.id)
+        panneaux_supprimes = await supprimer_messages_bot(inter.client, anciens, PRIORITE_INTERACTION)
         
         print(f"Total panneaux supprimés: {panneaux_supprimes}")
         
         # Récupérer les configurations personnalisées
-        couleur_hex = get_config(inter.guild_id, "couleur_panneau", "5865F2")
-        texte = get_config(inter.guild_id, "texte_panneau", "Utilise les boutons ci-dessous pour gérer les fiches sans taper de commandes.")
-        banniere_url = get_config(inter.guild_id, "banniere_panneau", "https://i.postimg.cc/8c6gy1qK/AB2723-D2-B10-F-40-F7-A124-1-D6-F30510096.jpg")
+        couleur_hex = await get_config(inter.guild_id, "couleur_panneau", "5865F2")
+        texte = await get_config(inter.guild_id, "texte_panneau", "Utilise les boutons ci-dessous pour gérer les fiches sans taper de commandes.")
+        banniere_url = await get_config(inter.guild_id, "banniere_panneau", "https://i.postimg.cc/8c6gy1qK/AB2723-D2-B10-F-40-F7-A124-1-D6-F30510096.jpg")
         
         # Convertir la couleur hex en int
         try:
@@ -4218,12 +6296,13 @@ async def panneau(inter: discord.Interaction):
         )
         e.set_image(url=banniere_url)
         e.set_footer(text="👑 Panneau admin — Visible par tous")
-        await inter.followup.send(embed=e, view=v)
+        msg = await inter.followup.send(embed=e, view=v, wait=True)
+        await noter_message_bot(inter.guild_id, msg.channel.id, msg.id, "panneau")
     else:
         # Récupérer les configurations personnalisées
-        couleur_hex = get_config(inter.guild_id, "couleur_panneau", "5865F2")
-        texte = get_config(inter.guild_id, "texte_panneau", "Utilise les boutons ci-dessous pour gérer les fiches sans taper de commandes.")
-        banniere_url = get_config(inter.guild_id, "banniere_panneau", "https://i.postimg.cc/8c6gy1qK/AB2723-D2-B10-F-40-F7-A124-1-D6-F30510096.jpg")
+        couleur_hex = await get_config(inter.guild_id, "couleur_panneau", "5865F2")
+        texte = await get_config(inter.guild_id, "texte_panneau", "Utilise les boutons ci-dessous pour gérer les fiches sans taper de commandes.")
+        banniere_url = await get_config(inter.guild_id, "banniere_panneau", "https://i.postimg.cc/8c6gy1qK/AB2723-D2-B10-F-40-F7-A124-1-D6-F30510096.jpg")
         
         # Convertir la couleur hex en int
         try:
@@ -4253,6 +6332,7 @@ async def on_interaction(inter: discord.Interaction):
     
     if not inter.data or 'custom_id' not in inter.data:
         return
+    router_interaction(inter)
     
     custom_id = inter.data['custom_id']
     
@@ -4308,10 +6388,24 @@ async def on_interaction(inter: discord.Interaction):
     elif choice == "staff":
         await view.action_staff(inter)
 
+_demarrage_fait = False
+
 @bot.event
 async def on_ready():
-    db_init()  # Initialiser la DB tribus au démarrage
-    identite_db_init()  # Initialiser la DB Arki Identité au démarrage
+    global _demarrage_fait
+    # on_ready est rappelé à chaque reconnexion au gateway : l'initialisation n'a lieu qu'une fois
+    if _demarrage_fait:
+        print(f"Reconnecté en tant que {bot.user} (ID: {bot.user.id})")
+        return
+    _demarrage_fait = True
+    
+    debut = time.perf_counter()
+    await db_thread(db_init)  # Migrer la DB tribus au démarrage
+    await db_thread(identite_db_init)  # Migrer la DB Arki Identité au démarrage
+    print(f"⏱️ Bases prêtes en {(time.perf_counter() - debut) * 1000:.1f} ms")
+    tache_archivage_historique.start()
+    tache_maintenance.start()
+    asyncio.create_task(balayage_orphelins_initial())
     
     # Ajouter les vues persistantes pour qu'elles fonctionnent après redémarrage
     bot.add_view(PanneauTribu(timeout=None))
@@ -4329,6 +6423,47 @@ async def on_ready():
     print(f"Connecté en tant que {bot.user} (ID: {bot.user.id})")
 
 def main():
+    # Vérifier les migrations sans rien écrire : python main.py --migrations-dry-run
+    if "--migrations-dry-run" in sys.argv:
+        db_init(dry_run=True)
+        identite_db_init(dry_run=True)
+        return
+    
+    # Export / import hors ligne : python main.py --exporter|--importer <guild_id> <fichier.jsonl|.csv>
+    for option in ("--exporter", "--importer"):
+        if option in sys.argv:
+            i = sys.argv.index(option)
+            guild_id, chemin = int(sys.argv[i + 1]), sys.argv[i + 2]
+            db_init()
+            debut = time.perf_counter()
+            with sur_serveur(guild_id):
+                if option == "--exporter":
+                    comptes = asyncio.run(exporter_serveur(guild_id, chemin))
+                else:
+                    async def afficher(comptes, fraction):
+                        print(f"   {fraction:6.1%} — {resume_import_export(comptes)}")
+                    comptes = asyncio.run(importer_serveur(guild_id, chemin, afficher))
+            print(f"📦 {chemin} : {resume_import_export(comptes)} ({time.perf_counter() - debut:.1f} s)")
+            return
+    
+    # Passage à une base par serveur : python main.py --decouper-serveurs [--purger], puis DB_SHARDS=1
+    if "--decouper-serveurs" in sys.argv:
+        db_init()
+        debut = time.perf_counter()
+        resultat = decouper_par_serveur(purger="--purger" in sys.argv)
+        for guild_id, nb in resultat.items():
+            print(f"   - serveur {guild_id} : {nb} tribus -> {chemin_base_serveur(guild_id)}")
+        print(f"🗂️ {len(resultat)} base(s) de serveur créée(s) en {time.perf_counter() - debut:.1f} s")
+        return
+    
+    # Balayage manuel des lignes orphelines : python main.py --nettoyer-orphelins [--vacuum]
+    if "--nettoyer-orphelins" in sys.argv:
+        db_init()
+        debut = time.perf_counter()
+        rapport = asyncio.run(balayer_orphelins_bases(vacuum="--vacuum" in sys.argv))
+        _afficher_orphelins(rapport, time.perf_counter() - debut)
+        return
+    
     # Replit utilise DISCORD_TOKEN, Railway/autres peuvent utiliser DISCORD_BOT_TOKEN
     token = os.getenv("DISCORD_BOT_TOKEN") or os.getenv("DISCORD_TOKEN")
     if not token: